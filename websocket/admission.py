@@ -0,0 +1,209 @@
+"""
+显存/内存预算准入控制：按估算的内存开销排队放行推理任务，只在内存紧张时才做清理
+"""
+import asyncio
+import contextlib
+import gc
+import os
+import threading
+
+
+class RssMemoryBackend:
+    """CPU 部署：以进程常驻内存（RSS）衡量内存使用"""
+    name = "rss"
+
+    def __init__(self, sample_interval_s=0.005):
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.sample_interval_s = sample_interval_s
+        self._sampler = None
+
+    def used(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (OSError, ValueError, IndexError):
+            import resource
+            # 取不到当前值时退回历史峰值（Linux 上单位为 KB）
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def total(self):
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (AttributeError, ValueError, OSError):
+            return 0
+
+    def reset_peak(self):
+        """开始在后台线程中采样 RSS，记录峰值，直到 peak() 取走结果"""
+        self.peak()
+        stop = threading.Event()
+        sampler = {"stop": stop, "peak": self.used()}
+
+        def sample():
+            while not stop.wait(self.sample_interval_s):
+                sampler["peak"] = max(sampler["peak"], self.used())
+
+        sampler["thread"] = threading.Thread(target=sample, name="rss-peak", daemon=True)
+        sampler["thread"].start()
+        self._sampler = sampler
+
+    def peak(self):
+        """停止采样并返回采样期间的 RSS 峰值；没有在采样时返回 None"""
+        sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            return None
+        sampler["stop"].set()
+        sampler["thread"].join()
+        return max(sampler["peak"], self.used())
+
+    def cleanup(self):
+        gc.collect()
+
+
+class CudaMemoryBackend:
+    """GPU 部署：以 PyTorch 在当前设备上分配的显存衡量"""
+    name = "cuda"
+
+    def __init__(self, torch):
+        self.torch = torch
+        self.device = torch.cuda.current_device()
+
+    def used(self):
+        return self.torch.cuda.memory_allocated(self.device)
+
+    def total(self):
+        return self.torch.cuda.get_device_properties(self.device).total_memory
+
+    def reset_peak(self):
+        self.torch.cuda.reset_peak_memory_stats(self.device)
+
+    def peak(self):
+        return self.torch.cuda.max_memory_allocated(self.device)
+
+    def cleanup(self):
+        gc.collect()
+        self.torch.cuda.empty_cache()
+
+
+def default_memory_backend(device="cuda"):
+    """有可用 CUDA 且使用 GPU 推理时按显存计量，否则按进程内存计量"""
+    if device.startswith("cuda"):
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return CudaMemoryBackend(torch)
+        except ImportError:
+            pass
+    return RssMemoryBackend()
+
+
+class AdmissionController:
+    """
+    内存预算准入控制
+
+    每个任务按 base_bytes + bytes_per_second * 音频秒数 估算开销，已放行任务的
+    估算之和不超过 budget_bytes；超出预算的任务按先来后到排队等待，而不是直接拒绝。
+    没有其他任务运行时总会放行一个，避免超大任务永远等不到。
+
+    单独运行的任务结束后，用实测的峰值增量校准每秒音频的内存开销（RSS 计量时
+    峰值由后台线程在任务运行期间采样得到），测不到峰值增量时不校准。
+    任务结束时如果已用内存超过 (基线 + 预算) * pressure_ratio，才执行一次清理。
+    """
+    def __init__(self, backend, budget_bytes=0, bytes_per_second=32 * 1024 * 1024,
+                 base_bytes=64 * 1024 * 1024, pressure_ratio=0.9):
+        self.backend = backend
+        self.bytes_per_second = bytes_per_second
+        self.base_bytes = base_bytes
+        self._auto_budget = budget_bytes <= 0
+        self.budget_bytes = budget_bytes
+        self.reset_baseline()
+        self.pressure_ratio = pressure_ratio
+        self.reserved = 0
+        self.inflight = 0
+        self._waiters = []
+        self.stats_counters = {"admitted": 0, "queued": 0, "cleanups": 0, "calibrations": 0}
+
+    def reset_baseline(self):
+        """以当前内存使用为基线（模型加载完成后调用）；未指定预算时重新按剩余内存的 80% 计算"""
+        self.baseline = self.backend.used()
+        if self._auto_budget:
+            self.budget_bytes = max(int((self.backend.total() - self.baseline) * 0.8), self.base_bytes)
+
+    def estimate(self, audio_seconds):
+        return int(self.base_bytes + self.bytes_per_second * audio_seconds)
+
+    def _fits(self, cost):
+        return self.inflight == 0 or self.reserved + cost <= self.budget_bytes
+
+    @contextlib.asynccontextmanager
+    async def admit(self, audio_seconds):
+        cost = self.estimate(audio_seconds)
+        if self._waiters or not self._fits(cost):
+            self.stats_counters["queued"] += 1
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append((cost, waiter))
+            try:
+                await waiter
+            except BaseException:
+                if waiter in [w for _, w in self._waiters]:
+                    self._waiters = [(c, w) for c, w in self._waiters if w is not waiter]
+                    self._drain()
+                elif waiter.done() and not waiter.cancelled():
+                    # 已被放行但调用方取消了，归还预算
+                    self._release(cost)
+                raise
+        else:
+            self._reserve(cost)
+        solo = self.inflight == 1
+        if solo:
+            self.backend.reset_peak()
+        start_used = self.backend.used()
+        try:
+            yield
+        finally:
+            if solo:
+                peak = self.backend.peak()
+                # 取不到峰值，或峰值没有超过起点（释放过的内存被复用，RSS 看不出增长）时不校准
+                if self.inflight == 1 and audio_seconds > 0 and peak is not None and peak > start_used:
+                    self._calibrate(peak - start_used, audio_seconds)
+            self._release(cost)
+            if self.backend.used() > (self.baseline + self.budget_bytes) * self.pressure_ratio:
+                self.backend.cleanup()
+                self.stats_counters["cleanups"] += 1
+
+    def _reserve(self, cost):
+        self.reserved += cost
+        self.inflight += 1
+        self.stats_counters["admitted"] += 1
+
+    def _release(self, cost):
+        self.reserved -= cost
+        self.inflight -= 1
+        self._drain()
+
+    def _drain(self):
+        # 按顺序放行排在前面、预算已足够的任务
+        while self._waiters and self._fits(self._waiters[0][0]):
+            cost, waiter = self._waiters.pop(0)
+            self._reserve(cost)
+            waiter.set_result(None)
+
+    def _calibrate(self, measured_bytes, audio_seconds):
+        per_second = max(measured_bytes - self.base_bytes, 0) / audio_seconds
+        # 偏保守地更新：增长立即跟上，下降缓慢
+        if per_second > self.bytes_per_second:
+            self.bytes_per_second = per_second
+        else:
+            self.bytes_per_second = 0.9 * self.bytes_per_second + 0.1 * per_second
+        self.stats_counters["calibrations"] += 1
+
+    def stats(self):
+        return dict(
+            self.stats_counters,
+            backend=self.backend.name,
+            budget_bytes=self.budget_bytes,
+            reserved_bytes=self.reserved,
+            inflight=self.inflight,
+            waiting=len(self._waiters),
+            bytes_per_second=self.bytes_per_second,
+            used_bytes=self.backend.used(),
+        )
@@ -0,0 +1,358 @@
+"""
+音频解码：边接收边解析，直接把采样写进预分配的 float32 数组
+"""
+import functools
+import itertools
+import math
+import struct
+
+import numpy as np
+
+
+TARGET_SAMPLE_RATE = 16000
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class UnsupportedAudioFormat(Exception):
+    """流式解码器不支持的格式，调用方应退回到文件解码"""
+
+
+def allocate_float32(n):
+    return np.empty(n, dtype=np.float32)
+
+
+class StreamingWavDecoder:
+    """
+    WAV / 裸 PCM 流式解码器
+
+    支持 16 位 PCM、16kHz 的 WAV（多声道会混为单声道）和 16kHz 单声道 16 位裸 PCM。
+    WAV 头里的 data 长度用于一次性分配输出数组，长度未知时按两倍扩容。
+    遇到其他格式时 feed() 抛出 UnsupportedAudioFormat，已读取的字节可通过
+    consumed_head 取回。
+
+    allocate(n) 用于分配 n 个采样的 float32 输出，可替换为 np.memmap 等实现。
+    """
+    def __init__(self, raw_pcm=False, expected_bytes=None, allocate=allocate_float32):
+        self.raw_pcm = raw_pcm
+        self.expected_bytes = expected_bytes
+        self.allocate = allocate
+        self.channels = 1
+        self.sample_rate = TARGET_SAMPLE_RATE
+        self.consumed_head = bytearray()  # 解析头部期间缓存的字节
+        self._header_done = False
+        self._data_remaining = None  # WAV data 块剩余字节数，None 表示未知
+        self._carry = b""  # 不足一帧的残留字节
+        self._out = None
+        self._n = 0
+
+    @property
+    def samples(self):
+        return self._n
+
+    def feed(self, chunk):
+        if not self._header_done:
+            self.consumed_head += chunk
+            if not self._parse_header():
+                return
+            chunk = bytes(self.consumed_head[self._data_start:])
+        if self._data_remaining is not None:
+            chunk = chunk[:self._data_remaining]
+            self._data_remaining -= len(chunk)
+        self._decode(chunk)
+
+    def _parse_header(self):
+        head = self.consumed_head
+        if self.raw_pcm or (len(head) >= 4 and head[:4] != b"RIFF"):
+            if not self.raw_pcm:
+                raise UnsupportedAudioFormat("not a RIFF/WAVE stream")
+            self._data_start = 0
+            self._start_data(self.expected_bytes)
+            return True
+        if len(head) < 12:
+            return False
+        if head[8:12] != b"WAVE":
+            raise UnsupportedAudioFormat("not a RIFF/WAVE stream")
+        pos = 12
+        fmt_seen = False
+        while True:
+            if len(head) < pos + 8:
+                return False
+            chunk_id = bytes(head[pos:pos + 4])
+            chunk_size = struct.unpack("<I", head[pos + 4:pos + 8])[0]
+            body = pos + 8
+            if chunk_id == b"data":
+                if not fmt_seen:
+                    raise UnsupportedAudioFormat("data chunk before fmt chunk")
+                self._data_start = body
+                # 流式写出的 WAV 常把长度写成 0 或 0xFFFFFFFF
+                size = chunk_size if 0 < chunk_size < 0xFFFFFFFF else None
+                self._data_remaining = size
+                self._start_data(size)
+                return True
+            if len(head) < body + chunk_size:
+                return False
+            if chunk_id == b"fmt ":
+                audio_format, channels, sample_rate = struct.unpack("<HHI", head[body:body + 8])
+                bits = struct.unpack("<H", head[body + 14:body + 16])[0]
+                if audio_format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or bits != 16:
+                    raise UnsupportedAudioFormat(f"wav format {audio_format} with {bits} bits")
+                if sample_rate != TARGET_SAMPLE_RATE:
+                    raise UnsupportedAudioFormat(f"sample rate {sample_rate}")
+                self.channels = channels
+                self.sample_rate = sample_rate
+                fmt_seen = True
+            pos = body + chunk_size + (chunk_size & 1)
+
+    def _start_data(self, size_bytes):
+        self._header_done = True
+        capacity = size_bytes // (2 * self.channels) if size_bytes else TARGET_SAMPLE_RATE * 60
+        self._out = self.allocate(max(capacity, 1))
+
+    def _decode(self, chunk):
+        frame_bytes = 2 * self.channels
+        if self._carry:
+            chunk = self._carry + chunk
+        usable = len(chunk) - len(chunk) % frame_bytes
+        self._carry = bytes(chunk[usable:])
+        if usable == 0:
+            return
+        samples = np.frombuffer(chunk, dtype="<i2", count=usable // 2)
+        n = len(samples) // self.channels
+        self._reserve(n)
+        out = self._out[self._n:self._n + n]
+        if self.channels == 1:
+            np.multiply(samples, 1.0 / 32768, out=out, casting="unsafe")
+        else:
+            frames = samples.reshape(n, self.channels)
+            np.multiply(frames.mean(axis=1), 1.0 / 32768, out=out, casting="unsafe")
+        self._n += n
+
+    def _reserve(self, n):
+        if self._n + n <= len(self._out):
+            return
+        grown = self.allocate(max(2 * len(self._out), self._n + n))
+        grown[:self._n] = self._out[:self._n]
+        self._out = grown
+
+    def finish(self):
+        """返回解码后的 float32 单声道数组"""
+        if not self._header_done:
+            raise UnsupportedAudioFormat("incomplete wav header")
+        return self._out[:self._n]
+
+
+# websocket 传输编码：每个会话在握手 JSON 中用 wav_format / audio_fs 声明，
+# 服务器把每帧解码成 16kHz int16，直接写进会话的 AudioRing
+
+
+def _ulaw_table():
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    t = (((u & 0x0F) << 3) + 0x84) << ((u & 0x70) >> 4)
+    return np.where(u & 0x80, 0x84 - t, t - 0x84).astype(np.int16)
+
+
+def _alaw_table():
+    a = np.arange(256, dtype=np.int32) ^ 0x55
+    seg = (a & 0x70) >> 4
+    t = (a & 0x0F) << 4
+    t = np.where(seg == 0, t + 8, (t + 0x108) << np.maximum(seg - 1, 0))
+    return np.where(a & 0x80, t, -t).astype(np.int16)
+
+
+# G.711 8 位码到 16 位线性采样的查找表
+ULAW_TABLE = _ulaw_table()
+ALAW_TABLE = _alaw_table()
+
+IMA_STEP_TABLE = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307,
+    337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
+    2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767,
+], dtype=np.int32)
+IMA_INDEX_ADJUST = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+
+
+def _ima_tables():
+    step = IMA_STEP_TABLE[:, None]
+    code = np.arange(16, dtype=np.int32)[None, :]
+    diff = (step >> 3) + np.where(code & 4, step, 0) + np.where(code & 2, step >> 1, 0) + np.where(code & 1, step >> 2, 0)
+    diff = np.where(code & 8, -diff, diff)
+    next_index = np.clip(np.arange(89)[:, None] + IMA_INDEX_ADJUST[None, :], 0, 88)
+    return diff.astype(np.int32), next_index.ravel().tolist()
+
+
+# IMA-ADPCM：按 (步长序号, 4 位码) 查差值和下一个步长序号
+IMA_DIFF_TABLE, IMA_NEXT_INDEX = _ima_tables()
+
+
+class PolyphaseResampler:
+    """
+    流式多相 FIR 重采样
+
+    输入/输出采样率之比约分为 up/down，低通滤波器（Kaiser 窗 sinc）按 up 拆成多相，
+    每个输出采样只计算它所在相位的 taps 个乘加；一块输入的全部输出用一次 einsum 算完。
+    块与块之间保留 taps - 1 个历史采样，分块处理与整段处理结果一致。
+    """
+    def __init__(self, in_rate, out_rate, taps_per_phase=16, beta=8.0):
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.taps = -(-taps_per_phase * max(self.up, self.down) // self.up)
+        n = self.taps * self.up
+        cutoff = 0.5 / max(self.up, self.down) * 0.95  # 相对上采样后采样率的截止频率
+        t = np.arange(n) - (n - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, beta) * self.up
+        # phases[p, k] = h[k * up + p]，作用于输入 x[i - k]
+        self.phases = np.ascontiguousarray(h.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # 已输入的采样数
+        self._next_out = 0  # 下一个输出采样的序号
+
+    def process(self, x):
+        if len(x) == 0:
+            return np.zeros(0, dtype=np.float32)
+        buf = np.concatenate([self._history, x.astype(np.float32, copy=False)])
+        total = self._consumed + len(x)
+        n_end = (total * self.up + self.down - 1) // self.down
+        n = np.arange(self._next_out, n_end, dtype=np.int64)
+        pos = n * self.down
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps)
+        y = np.einsum("nk,nk->n", windows[pos // self.up - self._consumed], self.phases[pos % self.up])
+        if self.taps > 1:
+            self._history = buf[len(buf) - (self.taps - 1):].copy()
+        self._consumed = total
+        self._next_out = n_end
+        return y
+
+
+class TransportDecoder:
+    """
+    websocket 音频帧解码器基类
+
+    decode(data, ring) 把一帧字节解码成 16kHz int16 写进 ring，返回写入段的 (start, end)。
+    不足一个编码单元的尾部字节留到下一帧。采样率不是 16kHz 时先解码成 float 再多相重采样。
+    """
+    bytes_per_unit = 2
+    samples_per_unit = 1
+
+    def __init__(self, sample_rate=TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.resampler = None
+        if sample_rate != TARGET_SAMPLE_RATE:
+            self.resampler = PolyphaseResampler(sample_rate, TARGET_SAMPLE_RATE)
+        self._carry = b""
+
+    def decode(self, data, ring):
+        if self._carry:
+            data = self._carry + bytes(data)
+        usable = len(data) - len(data) % self.bytes_per_unit
+        self._carry = bytes(data[usable:])
+        n = usable // self.bytes_per_unit * self.samples_per_unit
+        if n == 0:
+            return ring.end, ring.end
+        data = memoryview(data)[:usable]
+        if self.resampler is None:
+            start, end, out = ring.allocate(n)
+            self._decode_into(data, out)
+            return start, end
+        y = self.resampler.process(self._decode_float(data, n))
+        start, end, out = ring.allocate(len(y))
+        np.clip(y, -32768, 32767, out=y)
+        out[:] = y
+        return start, end
+
+    def _decode_into(self, data, out):
+        raise NotImplementedError
+
+    def _decode_float(self, data, n):
+        samples = np.empty(n, dtype=np.int16)
+        self._decode_into(data, samples)
+        return samples.astype(np.float32)
+
+
+class Pcm16Decoder(TransportDecoder):
+    def _decode_into(self, data, out):
+        out[:] = np.frombuffer(data, dtype="<i2")
+
+
+class G711Decoder(TransportDecoder):
+    """µ-law / A-law：每字节一个采样，查表解码"""
+    bytes_per_unit = 1
+
+    def __init__(self, table, sample_rate=TARGET_SAMPLE_RATE):
+        super().__init__(sample_rate)
+        self.table = table
+
+    def _decode_into(self, data, out):
+        np.take(self.table, np.frombuffer(data, dtype=np.uint8), out=out)
+
+
+class ImaAdpcmDecoder(TransportDecoder):
+    """
+    IMA-ADPCM 连续码流：每字节两个采样，低 4 位在前，预测值和步长序号跨帧延续（从 0 开始）
+
+    步长序号的递推带饱和，只能逐个求（查表，每个采样一次列表索引）；
+    差值查表、预测值累加都是向量运算，预测值越界时才逐个饱和。
+    """
+    bytes_per_unit = 1
+    samples_per_unit = 2
+
+    def __init__(self, sample_rate=TARGET_SAMPLE_RATE):
+        super().__init__(sample_rate)
+        self.predictor = 0
+        self.index = 0
+
+    def _decode_into(self, data, out):
+        packed = np.frombuffer(data, dtype=np.uint8)
+        codes = np.empty(2 * len(packed), dtype=np.int32)
+        codes[0::2] = packed & 0x0F
+        codes[1::2] = packed >> 4
+        indices = list(itertools.accumulate(codes.tolist(), lambda i, c: IMA_NEXT_INDEX[i * 16 + c], initial=self.index))
+        self.index = indices.pop()
+        diffs = IMA_DIFF_TABLE[np.array(indices, dtype=np.int32), codes]
+        predicted = self.predictor + np.cumsum(diffs)
+        if predicted.min() < -32768 or predicted.max() > 32767:
+            predicted = np.array(
+                list(itertools.accumulate(diffs.tolist(), lambda p, d: min(max(p + d, -32768), 32767), initial=self.predictor))[1:]
+            )
+        self.predictor = int(predicted[-1])
+        out[:] = predicted
+
+
+class Float32Decoder(TransportDecoder):
+    """小端 float32，取值 [-1, 1]"""
+    bytes_per_unit = 4
+
+    def _decode_into(self, data, out):
+        np.copyto(out, np.clip(self._decode_float(data, len(out)), -32768, 32767), casting="unsafe")
+
+    def _decode_float(self, data, n):
+        return np.frombuffer(data, dtype="<f4") * np.float32(32768)
+
+
+TRANSPORT_DECODERS = {
+    "pcm": Pcm16Decoder,
+    "wav": Pcm16Decoder,
+    "pcm16": Pcm16Decoder,
+    "ulaw": functools.partial(G711Decoder, ULAW_TABLE),
+    "pcmu": functools.partial(G711Decoder, ULAW_TABLE),
+    "alaw": functools.partial(G711Decoder, ALAW_TABLE),
+    "pcma": functools.partial(G711Decoder, ALAW_TABLE),
+    "ima_adpcm": ImaAdpcmDecoder,
+    "adpcm": ImaAdpcmDecoder,
+    "float32": Float32Decoder,
+    "f32": Float32Decoder,
+}
+
+
+def make_transport_decoder(wav_format="pcm", sample_rate=TARGET_SAMPLE_RATE):
+    """按握手中的 wav_format / audio_fs 创建解码器，不支持时抛出 UnsupportedAudioFormat"""
+    decoder = TRANSPORT_DECODERS.get(str(wav_format).lower())
+    if decoder is None:
+        raise UnsupportedAudioFormat(f"wav_format {wav_format}, expected one of {', '.join(TRANSPORT_DECODERS)}")
+    sample_rate = int(sample_rate)
+    if not 8000 <= sample_rate <= 192000:
+        raise UnsupportedAudioFormat(f"audio_fs {sample_rate}")
+    return decoder(sample_rate=sample_rate)
@@ -0,0 +1,102 @@
+"""
+会话音频环形缓冲区：按采样点偏移寻址，整个会话只保存一份音频
+"""
+import numpy as np
+
+
+class AudioRing:
+    """
+    预分配、可增长的 int16 音频缓冲区
+
+    所有位置都用会话开始以来的绝对采样点偏移表示。写入时只拷贝新到的数据；
+    view() 直接返回底层数组的切片视图。release(offset) 声明 offset 之前的数据
+    不再需要，空间在下次写满时回收：只搬移仍需要的尾部数据，必要时按两倍扩容，
+    所以长时间会议的内存只取决于仍在使用的那一段音频。
+
+    view() 返回的视图在下一次 append() 之后可能失效，需要跨越 await 使用时请用
+    read_float() 取得独立的 float32 拷贝（这也是模型需要的输入格式）。
+    """
+    def __init__(self, initial_seconds=30, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self._buf = np.empty(int(initial_seconds * sample_rate), dtype=np.int16)
+        self.start = 0  # 缓冲区中最早样本的绝对偏移
+        self.end = 0  # 下一个写入样本的绝对偏移
+        self._keep = 0  # 仍需保留的最早偏移
+        self._odd_byte = b""  # 上一块数据末尾不足一个样本的字节
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def ms_to_samples(self, ms):
+        return int(ms) * self.sample_rate // 1000
+
+    def append(self, data):
+        """写入 16 位 PCM 字节或 int16 数组，返回写入段的 (start, end) 偏移"""
+        if isinstance(data, np.ndarray):
+            samples = data.astype(np.int16, copy=False)
+        else:
+            if self._odd_byte:
+                data = self._odd_byte + bytes(data)
+                self._odd_byte = b""
+            if len(data) % 2:
+                self._odd_byte = bytes(data[-1:])
+                data = data[:-1]
+            samples = np.frombuffer(data, dtype=np.int16)
+        begin, end, out = self.allocate(len(samples))
+        out[:] = samples
+        return begin, end
+
+    def allocate(self, n):
+        """在末尾追加 n 个采样的空间，返回 (start, end, 可写视图)，解码器直接写入缓冲区"""
+        self._reserve(n)
+        pos = self.end - self.start
+        begin = self.end
+        self.end += n
+        return begin, self.end, self._buf[pos:pos + n]
+
+    def _reserve(self, n):
+        used = self.end - self.start
+        if used + n <= len(self._buf):
+            return
+        # 先丢弃不再需要的数据，把仍需保留的部分移到头部
+        drop = max(0, min(self._keep, self.end) - self.start)
+        live = used - drop
+        if live + n > len(self._buf):
+            new_buf = np.empty(max(2 * len(self._buf), live + n), dtype=np.int16)
+            new_buf[:live] = self._buf[drop:used]
+            self._buf = new_buf
+        elif drop:
+            self._buf[:live] = self._buf[drop:used]
+        self.start += drop
+
+    def release(self, offset):
+        """声明 offset 之前的数据不再需要"""
+        self._keep = max(self._keep, min(offset, self.end))
+
+    def clamp(self, offset):
+        """把偏移限制在缓冲区仍保存的范围内"""
+        return min(max(offset, self.start), self.end)
+
+    def view(self, start, end=None):
+        """返回 [start, end) 区间的 int16 视图（不拷贝）"""
+        end = self.end if end is None else end
+        start = self.clamp(start)
+        end = self.clamp(end)
+        return self._buf[start - self.start:end - self.start]
+
+    def read_float(self, start, end=None):
+        """返回 [start, end) 区间归一化到 [-1, 1) 的 float32 数组，可直接作为模型输入"""
+        samples = self.view(start, end)
+        out = np.empty(len(samples), dtype=np.float32)
+        np.multiply(samples, 1.0 / 32768, out=out, casting="unsafe")
+        return out
+
+    def clear(self):
+        """丢弃所有数据，偏移继续累加"""
+        self.start = self.end
+        self._keep = self.end
+        self._odd_byte = b""
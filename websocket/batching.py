@@ -0,0 +1,161 @@
+"""
+跨会话微批调度：在一个很短的时间窗口内收集多个会话的推理请求，合并成一次推理任务
+"""
+import asyncio
+import collections
+import time
+
+
+class MicroBatcher:
+    """
+    微批调度器
+
+    submit() 提交一个请求并等待它自己的结果。每个批次作为一个任务交给 InferenceExecutor 的
+    stage 阶段执行：batch_fn(model, items) 返回与 items 一一对应的结果列表，
+    某一项的结果如果是异常对象，只会抛给提交这一项的会话。
+
+    batched=True 表示 batch_fn 真正做一次批量前向：请求在 window_ms 内攒批，
+    攒满 max_batch 条立即下发。batched=False（如 generate_each 逐项调用）时攒批
+    没有吞吐收益，不等窗口：有空闲副本就立即下发；副本都忙时请求先排队，
+    某个批次结束、副本空出来时把排队的请求一起下发。此时假定该阶段的副本只由本调度器使用。
+    """
+    def __init__(self, executor, stage, batch_fn, window_ms=15, max_batch=16, batched=True):
+        self.executor = executor
+        self.stage = stage
+        self.batch_fn = batch_fn
+        self.batched = batched
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending = []
+        self._timer = None
+        self._inflight = set()
+        # 占用率统计
+        self.batches = 0
+        self.items = 0
+        self.size_counts = collections.Counter()
+        self.wait_time = 0.0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if not self.batched:
+            self._dispatch_idle()
+        elif len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            self._start(self._pending[: self.max_batch])
+            del self._pending[: self.max_batch]
+
+    def _dispatch_idle(self):
+        # 每个空闲副本取一个批次；按副本总数均分排队的请求，不让一个副本包揽全部
+        replicas = max(1, self.executor.concurrency(self.stage))
+        idle = replicas - len(self._inflight)
+        while self._pending and idle > 0:
+            size = min(self.max_batch, -(-len(self._pending) // replicas))
+            self._start(self._pending[:size])
+            del self._pending[:size]
+            idle -= 1
+
+    def _start(self, batch):
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._inflight.discard(task)
+        if not self.batched:
+            self._dispatch_idle()
+
+    async def _run_batch(self, batch):
+        now = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        self.size_counts[len(batch)] += 1
+        self.wait_time += sum(now - queued_at for _, _, queued_at in batch)
+        try:
+            results = await self.executor.run(self.stage, self.batch_fn, [item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """批次占用率统计"""
+        return {
+            "stage": self.stage,
+            "batches": self.batches,
+            "items": self.items,
+            "pending": len(self._pending),
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000 if self.batched else 0.0,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "occupancy": self.items / (self.batches * self.max_batch) if self.batches else 0.0,
+            "mean_wait_ms": self.wait_time / self.items * 1000 if self.items else 0.0,
+            "batch_sizes": dict(sorted(self.size_counts.items())),
+        }
+
+
+def generate_each(model, items):
+    """
+    逐项调用 model.generate，items 为 (input, kwargs) 列表
+
+    AutoModel 的流式 Paraformer 不支持把不同会话的 encoder/decoder cache 拼成
+    一个 batch 前向，所以一个批次在同一个推理任务里依次执行，每个会话仍使用自己的
+    cache。这样省掉了每个会话单独排队、切换线程的开销，也让同一批请求独占一个模型副本。
+    """
+    results = []
+    for audio_in, kwargs in items:
+        try:
+            results.append(model.generate(input=audio_in, **kwargs))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _group_key(kwargs):
+    return tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+
+def generate_batched(model, items):
+    """
+    非流式模型的批量识别，items 为 (input, kwargs) 列表
+
+    参数（如 hotword）相同的请求合并成一次 generate 调用，组内按音频长度降序排列，
+    让 padding 尽量少；结果按原顺序返回。合并调用失败时退回逐项调用，
+    避免一条坏数据拖垮整批。
+    """
+    results = [None] * len(items)
+    groups = collections.OrderedDict()
+    for i, (audio_in, kwargs) in enumerate(items):
+        groups.setdefault(_group_key(kwargs), []).append(i)
+    for indices in groups.values():
+        indices.sort(key=lambda i: len(items[i][0]), reverse=True)
+        kwargs = dict(items[indices[0]][1])
+        kwargs["batch_size"] = len(indices)
+        try:
+            batch_result = model.generate(input=[items[i][0] for i in indices], **kwargs)
+            if len(batch_result) != len(indices):
+                raise RuntimeError(f"batch result size mismatch: {len(batch_result)} != {len(indices)}")
+            for i, res in zip(indices, batch_result):
+                results[i] = [res]
+        except Exception:
+            for i, res in zip(indices, generate_each(model, [items[i] for i in indices])):
+                results[i] = res
+    return results
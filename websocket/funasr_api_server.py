@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os
-import tempfile
+import argparse
+import asyncio
+import json
 import traceback
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import uuid
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from funasr import AutoModel
 import logging
+import numpy as np
 import uvicorn
 import torch
 
+from audio_codecs import UnsupportedAudioFormat
+from upload_stream import AudioUploadSink, MalformedUpload, UploadTooLarge, read_multipart_upload
+from inference_executor import InferenceExecutor
+from jobs import JobManager, JobQueueFull, SUCCEEDED, CANCELLED
+from result_cache import ResultCache, make_cache_key
+from model_registry import compose_model, shared_registry
+from long_audio import vad_segment_kwargs
+from speaker_cluster import OnlineSpeakerClusterer
+from speaker_index import SpeakerIndex
+from transcript_store import MAX_SEARCH_LIMIT, TranscriptStore, check_meeting_id
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,32 +41,167 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局模型变量
-model = None
+# 推理执行器，模型副本数即识别任务的并发数
+executor = None
+# 识别任务队列
+jobs = None
+# 识别结果缓存
+result_cache = ResultCache()
+
+# 上传大小上限（字节），0 表示不限制
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024
+
+# 文件识别使用的模型，同时作为结果缓存键的一部分
+MODEL_PATHS = {
+    "model": "/home/dell/mnt/ai-work/Meeting/models/speech_paraformer-large-vad-punc-spk_asr_nat-zh-cn",
+    "vad_model": "/home/dell/mnt/ai-work/Meeting/models/speech_fsmn_vad_zh-cn-16k-common-pytorch",
+    "punc_model": "/home/dell/mnt/ai-work/Meeting/models/punc_ct-transformer_zh-cn-common-vocab272727-pytorch",
+    "spk_model": "/home/dell/mnt/ai-work/Meeting/models/speech_campplus_sv_zh-cn_16k-common",
+}
+# 模型版本，本地目录加载时不起作用
+MODEL_REVISIONS = {}
+# 模型所在设备，与 websocket 服务一致时两者共用同一份模型
+DEVICE = "cuda"
+
+# 流式返回时分段识别：第一段短一些，尽快给出第一批结果
+SAMPLE_RATE = 16000
+FIRST_CHUNK_S = 30
+CHUNK_S = 120
+# 每个说话人最多取多少秒音频计算说话人向量，用于跨段对应说话人
+SPEAKER_PROBE_S = 20
+# 已登记说话人的向量索引，为 None 时不做身份识别
+speaker_index = None
+# 说话人向量与登记向量的余弦相似度达到该值才标注为登记的名字
+SPEAKER_ID_THRESHOLD = 0.5
+# 可检索的转录库，为 None 时识别结果不落盘
+transcript_store = None
+# 登记时最多取的音频秒数
+ENROLL_MAX_S = 60
+# 流式返回格式及其 Content-Type
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def build_part(name, replica=0):
+    model_path, model_revision = MODEL_PATHS[name], MODEL_REVISIONS.get(name, "")
+    key = shared_registry.make_key(model_path, model_revision, DEVICE, replica)
+    return shared_registry.acquire(
+        key,
+        lambda: AutoModel(model=model_path, model_revision=model_revision or None, device=DEVICE, disable_update=True),
+    )
+
+def build_file_model(replica=0):
+    """
+    从共享注册表取出 ASR / VAD / 标点 / 说话人模型拼成文件识别模型
+
+    同一进程中的 websocket 服务加载过的同路径模型（如 VAD）不会再加载一份。
+    """
+    parts = {name: build_part(name, replica) for name in MODEL_PATHS}
+    return compose_model(parts["model"], parts["vad_model"], parts["punc_model"], parts["spk_model"])
 
-def init_model():
-    """初始化FunASR模型"""
-    global model
+def init_jobs(inference_executor, num_workers=1, max_queue=100):
+    """使用给定的推理执行器创建任务队列，文件识别模型由调用方注册为 file 阶段"""
+    global executor, jobs
+    executor = inference_executor
+    jobs = JobManager(run_recognition_job, num_workers=num_workers, max_queue=max_queue, on_finish=release_job_upload)
+
+def init_model(num_workers=1, max_queue=100):
+    """初始化FunASR模型和任务队列"""
     try:
         logger.info("正在初始化FunASR模型...")
-        model = AutoModel(
-            model="/home/dell/mnt/ai-work/Meeting/models/speech_paraformer-large-vad-punc-spk_asr_nat-zh-cn", 
-            # model_revision="v2.0.4",
-            vad_model="/home/dell/mnt/ai-work/Meeting/models/speech_fsmn_vad_zh-cn-16k-common-pytorch", 
-            # vad_model_revision="v2.0.4",
-            punc_model="/home/dell/mnt/ai-work/Meeting/models/punc_ct-transformer_zh-cn-common-vocab272727-pytorch", 
-            # punc_model_revision="v2.0.4",
-            spk_model="/home/dell/mnt/ai-work/Meeting/models/speech_campplus_sv_zh-cn_16k-common", 
-            # spk_model_revision="v2.0.2",
-            disable_update=True
-        )
+        # 同一个模型实例不能并发调用，每个 worker 使用一个模型副本
+        inference_executor = InferenceExecutor(max_workers=num_workers)
+        inference_executor.register_stage("file", [build_file_model(i) for i in range(num_workers)])
+        init_jobs(inference_executor, num_workers=num_workers, max_queue=max_queue)
         logger.info("FunASR模型初始化完成")
     except Exception as e:
         logger.error(f"模型初始化失败: {e}")
         logger.error(traceback.format_exc())
         raise e
 
-def process_recognition_result(res):
+def configure(max_upload_mb=2048, cache_entries=64, cache_dir="", cache_disk_mb=1024):
+    """设置上传大小上限和结果缓存"""
+    global MAX_UPLOAD_BYTES, result_cache
+    MAX_UPLOAD_BYTES = max_upload_mb * 1024 * 1024
+    result_cache = ResultCache(
+        memory_entries=cache_entries,
+        disk_dir=cache_dir,
+        disk_budget_bytes=cache_disk_mb * 1024 * 1024,
+    )
+
+def configure_speaker_index(directory="", threshold=0.5, dtype="float16"):
+    """打开已登记说话人的向量索引，directory 为空时不做身份识别"""
+    global speaker_index, SPEAKER_ID_THRESHOLD
+    speaker_index = SpeakerIndex(directory, dtype=dtype) if directory else None
+    SPEAKER_ID_THRESHOLD = threshold
+
+def configure_transcript_store(directory=""):
+    """打开转录库，directory 为空时不保存识别结果"""
+    global transcript_store
+    transcript_store = TranscriptStore(directory) if directory else None
+    if transcript_store is not None:
+        logger.info(f"转录库已加载: {len(transcript_store)} 段，耗时 {transcript_store.load_seconds:.2f}s")
+
+def check_model_ready():
+    if executor is None:
+        raise HTTPException(status_code=500, detail="模型未初始化")
+    if not executor.has_stage("file"):
+        raise HTTPException(status_code=503, detail="模型加载中，请稍后重试")
+
+def default_speaker_label(spk):
+    return f'说话人{spk}'
+
+def format_segment(speaker, start_sec, end_sec, text):
+    return {
+        'speaker': speaker,
+        'start_time': start_sec,
+        'end_time': end_sec,
+        'text': text,
+        'time_range': f"{int(start_sec // 60)}:{start_sec % 60:04.1f}-{int(end_sec // 60)}:{end_sec % 60:04.1f}"
+    }
+
+class SegmentMerger:
+    """
+    按说话人和时间段增量合并句子
+
+    同一说话人、与上一句间隔不超过 max_gap_s 秒的句子合并成一段。add(sentence)
+    返回因这一句而结束的段（0 或 1 个），flush() 返回最后一段，
+    分批送入句子与一次送入整个文件的合并结果相同。labeler(spk) 在段结束时
+    给出说话人名称，默认为“说话人N”。
+    """
+    def __init__(self, max_gap_s=1, labeler=None):
+        self.max_gap_s = max_gap_s
+        self.labeler = labeler or default_speaker_label
+        self.last_spk = None
+        self.last_end_time = 0
+        self.merged_text = ""
+        self.merged_start_time = 0
+
+    def add(self, sentence):
+        start_sec = sentence.get('start', 0) / 1000  # 毫秒转秒
+        end_sec = sentence.get('end', 0) / 1000      # 毫秒转秒
+        spk = sentence.get('spk', 0)
+        text = sentence.get('text', '')
+        
+        # 如果当前说话人与上一次相同，且时间连续
+        if spk == self.last_spk and start_sec <= self.last_end_time + self.max_gap_s:
+            self.merged_text += text
+            self.last_end_time = end_sec
+            return []
+        # 如果不是连续的，结束上一次合并的结果
+        closed = self.flush()
+        self.merged_text = text
+        self.merged_start_time = start_sec
+        self.last_spk = spk
+        self.last_end_time = end_sec
+        return closed
+
+    def flush(self):
+        if self.last_spk is None:
+            return []
+        segment = format_segment(self.labeler(self.last_spk), self.merged_start_time, self.last_end_time, self.merged_text)
+        self.last_spk = None
+        return [segment]
+
+def process_recognition_result(res, labeler=None):
     """处理识别结果，按说话人和时间段合并"""
     if not res or len(res) == 0:
         return []
@@ -60,99 +210,366 @@ def process_recognition_result(res):
     if 'sentence_info' not in result_dict:
         return []
     
-    # 初始化变量
-    last_spk = None
-    last_end_time = 0
-    merged_text = ""
-    merged_start_time = 0
+    merger = SegmentMerger(labeler=labeler)
     results = []
-    
-    # 遍历句子信息
     for sentence in result_dict['sentence_info']:
-        start_sec = sentence.get('start', 0) / 1000  # 毫秒转秒
-        end_sec = sentence.get('end', 0) / 1000      # 毫秒转秒
-        spk = sentence.get('spk', 0)
-        text = sentence.get('text', '')
-        
-        # 如果当前说话人与上一次相同，且时间连续
-        if spk == last_spk and start_sec <= last_end_time + 1:  # 时间差小于1秒认为是连续的
-            merged_text += text
-            last_end_time = end_sec
-        else:
-            # 如果不是连续的，保存上一次合并的结果
-            if last_spk is not None:
-                results.append({
-                    'speaker': f'说话人{last_spk}',
-                    'start_time': merged_start_time,
-                    'end_time': last_end_time,
-                    'text': merged_text,
-                    'time_range': f"{int(merged_start_time // 60)}:{merged_start_time % 60:04.1f}-{int(last_end_time // 60)}:{last_end_time % 60:04.1f}"
-                })
-            
-            # 更新合并信息
-            merged_text = text
-            merged_start_time = start_sec
-            last_spk = spk
-            last_end_time = end_sec
-    
-    # 保存最后一次合并的结果
-    if last_spk is not None:
-        results.append({
-            'speaker': f'说话人{last_spk}',
-            'start_time': merged_start_time,
-            'end_time': last_end_time,
-            'text': merged_text,
-            'time_range': f"{int(merged_start_time // 60)}:{merged_start_time % 60:04.1f}-{int(last_end_time // 60)}:{last_end_time % 60:04.1f}"
-        })
-    
+        results.extend(merger.add(sentence))
+    results.extend(merger.flush())
     return results
 
-@app.post("/api/recognize")
-async def recognize_audio(
-    audio: UploadFile = File(...),
-    batch_size_s: int = Form(300),
-    hotword: str = Form("")
-):
-    """语音识别API接口"""
+def run_recognition(file_model, audio_input, batch_size_s, hotword):
+    """在推理线程中执行识别并合并结果"""
+    torch.set_num_threads(4)
+    # 调用模型进行识别
+    res = file_model.generate(
+        input=audio_input,
+        batch_size_s=batch_size_s,
+        hotword=hotword if hotword else None
+    )
+    # 处理识别结果，登记过的说话人换成其名字
+    names = {}
+    if speaker_index is not None and len(speaker_index) and isinstance(audio_input, np.ndarray) and res:
+        names = identify_speakers(speaker_embeddings(file_model, audio_input, res[0].get('sentence_info', [])))
+    return process_recognition_result(res, labeler=lambda spk: names.get(spk) or default_speaker_label(spk))
+
+def identify_speakers(embeddings):
+    """说话人向量与登记库比对，返回 {说话人编号: 登记的名字}，只含相似度达到阈值的说话人"""
+    names = {}
+    for spk, (embedding, _) in embeddings.items():
+        match = speaker_index.identify(embedding, threshold=SPEAKER_ID_THRESHOLD)
+        if match is not None:
+            names[spk] = match["name"]
+    return names
+
+def find_chunk_end(file_model, audio, start, chunk_s):
+    """
+    从 start 开始取至多 chunk_s 秒，返回这一段的结束采样偏移
+
+    用 VAD 找窗口内最后一处静音，切在静音中间，不会把句子切成两半；
+    窗口内没有静音时只能在窗口末尾切开。
+    """
+    end = min(len(audio), start + int(chunk_s * SAMPLE_RATE))
+    if end == len(audio):
+        return end
+    res = file_model.inference(
+        audio[start:end], model=file_model.vad_model, kwargs=file_model.vad_kwargs, **vad_segment_kwargs()
+    )
+    segments = [seg for seg in res[0]["value"] if seg[1] > seg[0]]
+    window_ms = (end - start) * 1000 // SAMPLE_RATE
+    if not segments:
+        return end
+    if window_ms - segments[-1][1] >= 200:
+        cut_ms = (segments[-1][1] + window_ms) // 2
+    elif len(segments) >= 2:
+        cut_ms = (segments[-2][1] + segments[-1][0]) // 2
+    else:
+        return end
+    return start + max(1, cut_ms * SAMPLE_RATE // 1000)
+
+def speaker_embeddings(file_model, audio, sentences):
+    """
+    计算这一段里每个说话人的说话人向量
+
+    每个说话人按时间顺序取其句子的音频，至多 SPEAKER_PROBE_S 秒。
+    返回 {本段说话人编号: (向量, 音频秒数)}，没有说话人模型时返回空字典。
+    """
+    if file_model.spk_model is None:
+        return {}
+    budget = SPEAKER_PROBE_S * SAMPLE_RATE
+    clips = {}
+    for sentence in sentences:
+        pieces = clips.setdefault(sentence.get('spk', 0), [])
+        beg = sentence.get('start', 0) * SAMPLE_RATE // 1000
+        end = min(sentence.get('end', 0) * SAMPLE_RATE // 1000, beg + budget - sum(len(p) for p in pieces))
+        if end > beg:
+            pieces.append(audio[beg:end])
+    embeddings = {}
+    for spk, pieces in clips.items():
+        if not pieces:
+            continue
+        clip = np.concatenate(pieces)
+        res = file_model.inference(clip, model=file_model.spk_model, kwargs=file_model.spk_kwargs)
+        embeddings[spk] = (res[0]["spk_embedding"].detach().cpu().numpy(), len(clip) / SAMPLE_RATE)
+    return embeddings
+
+def recognize_chunk(file_model, audio, start, chunk_s, batch_size_s, hotword):
+    """在推理线程中识别从 start 开始的一段，返回 (结束偏移, 句子列表, 本段说话人向量)"""
+    torch.set_num_threads(4)
+    end = find_chunk_end(file_model, audio, start, chunk_s)
+    chunk = audio[start:end]
+    res = file_model.generate(
+        input=chunk,
+        batch_size_s=batch_size_s,
+        hotword=hotword if hotword else None
+    )
+    sentences = res[0].get('sentence_info', []) if res else []
+    return end, sentences, speaker_embeddings(file_model, chunk, sentences)
+
+async def run_streaming_recognition(job):
+    """
+    分段识别，每段识别完立即把合并好的段放入 payload["events"]
+
+    各段的说话人编号只在段内有效，用说话人向量经 OnlineSpeakerClusterer 对应到
+    整个文件一致的编号；同一个 SegmentMerger 跨段合并，因此段边界处同一说话人的
+    连续句子仍合并成一段。返回全部合并结果。
+    """
+    payload = job.payload
+    audio = payload["audio_input"]
+    events = payload["events"]
+    # 全局说话人一旦认出登记的名字就不再改变，之后结束的段都用该名字
+    names = {}
+    merger = SegmentMerger(labeler=lambda spk: names.get(spk) or default_speaker_label(spk))
+    clusterer = OnlineSpeakerClusterer()
+    results = []
+
+    def emit(segments):
+        results.extend(segments)
+        record_transcript(payload, segments)
+        for segment in segments:
+            events.put_nowait(("segment", segment))
+
+    start = 0
+    chunk_s = FIRST_CHUNK_S
+    job.processed_seconds = 0.0
+    while start < len(audio):
+        if job.cancel_requested:
+            raise RuntimeError("任务已取消")
+        end, sentences, embeddings = await executor.run(
+            "file", recognize_chunk, audio, start, chunk_s, payload["batch_size_s"], payload["hotword"]
+        )
+        local_spks = sorted(embeddings)
+        mapping = dict(zip(local_spks, clusterer.assign(
+            [embeddings[spk][0] for spk in local_spks], weights=[embeddings[spk][1] for spk in local_spks]
+        )))
+        if speaker_index is not None and len(speaker_index):
+            centroids = clusterer.centroids()
+            for label in set(mapping.values()) - set(names):
+                match = speaker_index.identify(centroids[label], threshold=SPEAKER_ID_THRESHOLD)
+                if match is not None:
+                    names[label] = match["name"]
+        offset_ms = start * 1000 // SAMPLE_RATE
+        for sentence in sentences:
+            spk = sentence.get('spk', 0)
+            emit(merger.add(dict(
+                sentence,
+                start=sentence.get('start', 0) + offset_ms,
+                end=sentence.get('end', 0) + offset_ms,
+                spk=mapping.get(spk, spk),
+            )))
+        start = end
+        chunk_s = CHUNK_S
+        job.processed_seconds = end / SAMPLE_RATE
+        events.put_nowait(("progress", {"progress_seconds": job.processed_seconds, "audio_seconds": job.audio_seconds}))
+    emit(merger.flush())
+    return results
+
+async def run_recognition_job(job):
+    payload = job.payload
+    logger.info(f"开始识别音频文件: {job.filename}")
+    events = payload.get("events")
+    if events is not None and isinstance(payload["audio_input"], np.ndarray):
+        processed_results = await run_streaming_recognition(job)
+    else:
+        # 交给模型自己解码的文件只能整体识别，完成后一次性输出
+        processed_results = await executor.run(
+            "file", run_recognition, payload["audio_input"], payload["batch_size_s"], payload["hotword"]
+        )
+        record_transcript(payload, processed_results)
+        for segment in processed_results if events is not None else []:
+            events.put_nowait(("segment", segment))
+    logger.info(f"识别完成，共识别出 {len(processed_results)} 个语音段")
+    result_cache.put(payload["cache_key"], processed_results)
+    return processed_results
+
+def record_transcript(payload, segments):
+    """合并好的段写入转录库，分段识别时每段识别完就写入"""
+    if transcript_store is None or not segments:
+        return
     try:
-        if model is None:
-            raise HTTPException(status_code=500, detail="模型未初始化")
+        transcript_store.append(payload["meeting_id"], segments, title=payload["title"], source="api")
+    except OSError as e:
+        logger.error(f"写入转录库失败: {e}")
+
+def release_job_upload(job):
+    """任务结束后清理上传数据，并结束流式输出"""
+    job.payload["sink"].cleanup()
+    events = job.payload.get("events")
+    if events is not None:
+        events.put_nowait(None)
+
+def encode_event(fmt, event, data):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+async def stream_job_events(job, events, fmt):
+    """
+    流式输出识别进度
+
+    事件依次为 job（任务 id 和排队位置）、若干 segment（合并好的一段，格式同
+    非流式结果的一项）和 progress（已识别的音频秒数），最后是 done 或 error。
+    客户端中途断开时取消任务。
+    """
+    try:
+        yield encode_event(fmt, "job", {
+            "job_id": job.id,
+            "state": job.state,
+            "queue_position": jobs.position(job),
+            "audio_seconds": job.audio_seconds,
+            "meeting_id": job.meeting_id,
+        })
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield encode_event(fmt, *item)
+        if job.state == SUCCEEDED:
+            yield encode_event(fmt, "done", {"total_segments": len(job.result)})
+        else:
+            yield encode_event(fmt, "error", {
+                "state": job.state,
+                "detail": "任务已取消" if job.state == CANCELLED else f"识别失败: {job.error}",
+            })
+    finally:
+        if not job.finished:
+            logger.info(f"客户端断开，取消任务: {job.id}")
+            jobs.cancel(job.id)
+
+async def receive_upload(request):
+    """
+    接收 multipart 上传
+
+    表单字段：audio（音频文件）、batch_size_s（默认300）、hotword（默认空）、priority（默认0）、
+    stream（ndjson/sse，默认按 Accept 头决定，不流式时为空）、meeting_id 和 title（启用转录库时
+    结果写入的会议，默认新建、以文件名为标题）。请求体边接收边解码，WAV/PCM 直接解码成数组交给模型，其他格式写入临时文件。
+    返回任务 payload，出错时抛出 HTTPException 并清理已接收的数据。
+    """
+    # 检查上传大小
+    content_length = int(request.headers.get("content-length") or 0)
+    if MAX_UPLOAD_BYTES and content_length > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件过大，最大支持 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+    
+    # 流式接收并解码音频
+    sink = AudioUploadSink(expected_bytes=content_length or None)
+    try:
+        try:
+            fields, filename = await read_multipart_upload(request, "audio", sink, max_bytes=MAX_UPLOAD_BYTES)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大支持 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+        except MalformedUpload as e:
+            raise HTTPException(status_code=400, detail=f"请求格式错误: {e}")
         
         # 检查文件
-        if not audio.filename:
+        if not filename:
             raise HTTPException(status_code=400, detail="未选择文件")
-        
-        # 保存临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            content = await audio.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        try:
+            batch_size_s = int(fields.get("batch_size_s", 300))
+            priority = int(fields.get("priority", 0))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="batch_size_s 和 priority 必须是整数")
+        stream = fields.get("stream", "") or stream_format_from_accept(request.headers.get("accept", ""))
+        if stream and stream not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"stream 只支持 {', '.join(STREAM_MEDIA_TYPES)}")
+        meeting_id = None
+        if transcript_store is not None:
+            try:
+                meeting_id = check_meeting_id(fields.get("meeting_id", "").strip() or uuid.uuid4().hex)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
         try:
-            logger.info(f"开始识别音频文件: {audio.filename}")
-            torch.set_num_threads(4)
-            # 调用模型进行识别
-            res = model.generate(
-                input=temp_file_path,
-                batch_size_s=batch_size_s,
-                hotword=hotword if hotword else None
+            audio_input = sink.finish()
+        except UnsupportedAudioFormat as e:
+            raise HTTPException(status_code=400, detail=f"无法解析音频: {e}")
+    except BaseException:
+        sink.cleanup()
+        raise
+    
+    logger.info(f"接收音频文件: {filename}, {sink.bytes_received} 字节")
+    hotword = fields.get("hotword", "")
+    # 分段识别的说话人对应方式与整体识别不同，结果分开缓存
+    key_params = {"chunked": True} if stream else {}
+    if speaker_index is not None:
+        # 登记库变化后说话人名字可能不同
+        key_params["speakers"] = speaker_index.fingerprint()
+    return {
+        "filename": filename,
+        "sink": sink,
+        "audio_input": audio_input,
+        "audio_seconds": sink.duration_s,
+        "batch_size_s": batch_size_s,
+        "hotword": hotword,
+        "priority": priority,
+        "stream": stream,
+        "events": asyncio.Queue() if stream else None,
+        "meeting_id": meeting_id,
+        "title": fields.get("title", "") or filename,
+        "cache_key": make_cache_key(
+            sink.digest.hexdigest(), hotword=hotword, batch_size_s=batch_size_s, models=MODEL_PATHS, **key_params
+        ),
+    }
+
+def stream_format_from_accept(accept):
+    for fmt, media_type in STREAM_MEDIA_TYPES.items():
+        if media_type in accept:
+            return fmt
+    return ""
+
+def submit_job(payload):
+    """提交识别任务，命中结果缓存时直接返回已完成的任务"""
+    cached = result_cache.get(payload["cache_key"])
+    if cached is not None:
+        payload["sink"].cleanup()
+        logger.info(f"命中结果缓存: {payload['filename']}")
+        # 同一段录音再次提交也是一次会议，结果照常写入转录库
+        record_transcript(payload, cached)
+        if payload["events"] is not None:
+            for segment in cached:
+                payload["events"].put_nowait(("segment", segment))
+            payload["events"].put_nowait(None)
+        job = jobs.add_completed(cached, audio_seconds=payload["audio_seconds"], filename=payload["filename"])
+    else:
+        try:
+            job = jobs.submit(
+                payload,
+                priority=payload["priority"],
+                audio_seconds=payload["audio_seconds"],
+                filename=payload["filename"],
             )
-            torch.set_num_threads(4)
-            # 处理识别结果
-            processed_results = process_recognition_result(res)
-            
-            logger.info(f"识别完成，共识别出 {len(processed_results)} 个语音段")
-            
-            return {
-                'success': True,
-                'data': processed_results,
-                'total_segments': len(processed_results)
-            }
-            
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+        except JobQueueFull:
+            payload["sink"].cleanup()
+            raise HTTPException(status_code=503, detail="识别任务队列已满，请稍后重试")
+    job.meeting_id = payload["meeting_id"]
+    return job
+
+@app.post("/api/recognize")
+async def recognize_audio(request: Request):
+    """语音识别API接口，识别完成后返回结果；stream=ndjson/sse 时边识别边返回合并好的段"""
+    try:
+        check_model_ready()
+        
+        payload = await receive_upload(request)
+        job = submit_job(payload)
+        if payload["stream"]:
+            return StreamingResponse(
+                stream_job_events(job, payload["events"], payload["stream"]),
+                media_type=STREAM_MEDIA_TYPES[payload["stream"]],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        await job.wait()
+        if job.state == CANCELLED:
+            raise HTTPException(status_code=409, detail="任务已取消")
+        if job.state != SUCCEEDED:
+            raise RuntimeError(job.error)
+        
+        response = {
+            'success': True,
+            'data': job.result,
+            'total_segments': len(job.result)
+        }
+        if job.meeting_id:
+            response['meeting_id'] = job.meeting_id
+        return response
                 
     except HTTPException:
         raise
@@ -161,23 +578,202 @@ async def recognize_audio(
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"识别失败: {str(e)}")
 
+@app.post("/api/jobs")
+async def create_job(request: Request):
+    """提交识别任务，立即返回任务 id"""
+    check_model_ready()
+    job = submit_job(await receive_upload(request))
+    return {'success': True, 'data': job.to_dict(position=jobs.position(job))}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """查询任务状态、进度和结果"""
+    job = jobs.get(job_id) if jobs is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {'success': True, 'data': job.to_dict(position=jobs.position(job))}
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """取消任务，运行中的任务会在模型调用结束后丢弃结果"""
+    job = jobs.cancel(job_id) if jobs is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {'success': True, 'data': job.to_dict(position=jobs.position(job))}
+
+def check_speaker_index():
+    if speaker_index is None:
+        raise HTTPException(status_code=404, detail="未启用说话人登记，请用 --speaker_index_dir 指定索引目录")
+
+def extract_embedding(file_model, audio_input):
+    """在推理线程中计算一段录音的说话人向量"""
+    if isinstance(audio_input, np.ndarray):
+        audio_input = audio_input[:ENROLL_MAX_S * SAMPLE_RATE]
+    res = file_model.inference(audio_input, model=file_model.spk_model, kwargs=file_model.spk_kwargs)
+    return res[0]["spk_embedding"]
+
+async def receive_speaker_embedding(request):
+    """接收 multipart 上传的录音（audio 字段）并计算说话人向量，返回 (其余表单字段, 向量)"""
+    sink = AudioUploadSink(expected_bytes=int(request.headers.get("content-length") or 0) or None)
+    try:
+        try:
+            fields, filename = await read_multipart_upload(request, "audio", sink, max_bytes=MAX_UPLOAD_BYTES)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大支持 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+        except MalformedUpload as e:
+            raise HTTPException(status_code=400, detail=f"请求格式错误: {e}")
+        if not filename:
+            raise HTTPException(status_code=400, detail="未选择文件")
+        try:
+            audio_input = sink.finish()
+        except UnsupportedAudioFormat as e:
+            raise HTTPException(status_code=400, detail=f"无法解析音频: {e}")
+        embedding = await executor.run("file", extract_embedding, audio_input)
+    finally:
+        sink.cleanup()
+    return fields, embedding
+
+@app.post("/api/speakers")
+async def enroll_speaker(request: Request):
+    """
+    登记说话人
+
+    表单字段：audio（该说话人单独说话的录音）、name、speaker_id（可选，默认新生成）。
+    同一 speaker_id 再次登记时增加一条向量，识别时取最相似的一条。
+    """
+    check_speaker_index()
+    check_model_ready()
+    fields, embedding = await receive_speaker_embedding(request)
+    name = fields.get("name", "").strip()
+    if not name:
+        raise HTTPException(status_code=400, detail="缺少 name")
+    speaker_id = fields.get("speaker_id", "").strip() or uuid.uuid4().hex
+    try:
+        speaker_index.add(speaker_id, name, embedding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"登记说话人: {name} ({speaker_id})")
+    return {'success': True, 'data': {'speaker_id': speaker_id, 'name': name}}
+
+@app.get("/api/speakers")
+def list_speakers():
+    """已登记的说话人"""
+    check_speaker_index()
+    return {'success': True, 'data': speaker_index.speakers(), 'stats': speaker_index.stats()}
+
+@app.delete("/api/speakers/{speaker_id}")
+def delete_speaker(speaker_id: str):
+    """删除说话人及其全部向量"""
+    check_speaker_index()
+    if not speaker_index.remove(speaker_id):
+        raise HTTPException(status_code=404, detail="说话人不存在")
+    return {'success': True}
+
+@app.post("/api/speakers/search")
+async def search_speakers(request: Request):
+    """按录音检索最相似的已登记说话人，表单字段 audio、k（默认5）"""
+    check_speaker_index()
+    check_model_ready()
+    fields, embedding = await receive_speaker_embedding(request)
+    try:
+        k = int(fields.get("k", 5))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="k 必须是整数")
+    return {'success': True, 'data': speaker_index.search(embedding, k=k), 'threshold': SPEAKER_ID_THRESHOLD}
+
+def check_transcript_store():
+    if transcript_store is None:
+        raise HTTPException(status_code=404, detail="未启用转录库，请用 --transcript_dir 指定目录")
+
+@app.get("/api/transcripts/search")
+def search_transcripts(q: str, limit: int = 20, meeting_id: str = None, speaker: str = None,
+                       since: float = None, until: float = None):
+    """
+    在已保存的转录中检索短语
+
+    返回包含该短语的段（会议、说话人、起止时间和原文），从新到旧至多 limit 条
+    （不超过 MAX_SEARCH_LIMIT）；可按会议、说话人和会议创建时间（unix 秒，since 含、
+    until 不含）过滤。
+    """
+    check_transcript_store()
+    try:
+        result = transcript_store.search(
+            q, limit=min(max(limit, 1), MAX_SEARCH_LIMIT), meeting_id=meeting_id, speaker=speaker,
+            since=since, until=until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {'success': True, 'data': result.pop("results"), **result}
+
+@app.get("/api/transcripts")
+def list_transcripts():
+    """已保存的会议，从新到旧"""
+    check_transcript_store()
+    return {'success': True, 'data': transcript_store.meetings()}
+
+@app.get("/api/transcripts/{meeting_id}")
+def get_transcript(meeting_id: str):
+    """会议的全部段"""
+    check_transcript_store()
+    segments = transcript_store.segments(meeting_id)
+    if segments is None:
+        raise HTTPException(status_code=404, detail="会议不存在")
+    return {'success': True, 'data': segments}
+
 @app.get("/api/health")
 def health_check():
     """健康检查接口"""
     return {
         'status': 'ok',
-        'model_loaded': model is not None
+        'model_loaded': executor is not None and executor.has_stage("file"),
+        'jobs': jobs.stats() if jobs is not None else None,
+        'cache': result_cache.stats()
+    }
+
+@app.get("/api/status")
+def status():
+    """模型共享与推理队列状态"""
+    return {
+        'success': True,
+        'data': {
+            'models': shared_registry.stats(),
+            'speakers': speaker_index.stats() if speaker_index is not None else None,
+            'transcripts': transcript_store.stats() if transcript_store is not None else None,
+            'inference': executor.stats if executor is not None else None,
+            'jobs': jobs.stats() if jobs is not None else None,
+        }
     }
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="host ip, localhost, 0.0.0.0")
+    parser.add_argument("--port", type=int, default=10096, help="http server port")
+    parser.add_argument("--certfile", type=str, default="/home/dell/mnt/ai-work/Meeting/ssl_key/server.crt", help="certfile for ssl")
+    parser.add_argument("--keyfile", type=str, default="/home/dell/mnt/ai-work/Meeting/ssl_key/server.key", help="keyfile for ssl")
+    parser.add_argument("--max_upload_mb", type=int, default=2048, help="max upload size in MB, 0 for unlimited")
+    parser.add_argument("--job_workers", type=int, default=1, help="concurrent recognition jobs, one model replica each")
+    parser.add_argument("--job_queue_size", type=int, default=100, help="max queued recognition jobs")
+    parser.add_argument("--cache_entries", type=int, default=64, help="recognition results kept in memory")
+    parser.add_argument("--cache_dir", type=str, default="", help="directory of the on-disk result cache, empty to disable")
+    parser.add_argument("--cache_disk_mb", type=int, default=1024, help="size budget of the on-disk result cache in MB")
+    parser.add_argument("--device", type=str, default="cuda", help="cuda, cpu")
+    parser.add_argument("--speaker_index_dir", type=str, default="", help="directory of the enrolled speaker index, empty to disable")
+    parser.add_argument("--speaker_id_threshold", type=float, default=0.5, help="cosine similarity needed to label a speaker with an enrolled name")
+    parser.add_argument("--transcript_dir", type=str, default="", help="directory of the searchable transcript store, empty to disable")
+    parser.add_argument("--speaker_index_dtype", type=str, default="float16", choices=["float16", "float32"], help="storage type of a new speaker index")
+    args = parser.parse_args()
+    configure_speaker_index(args.speaker_index_dir, args.speaker_id_threshold, args.speaker_index_dtype)
+    configure_transcript_store(args.transcript_dir)
+    DEVICE = args.device
+    configure(args.max_upload_mb, args.cache_entries, args.cache_dir, args.cache_disk_mb)
     try:
         # 初始化模型
-        init_model()
+        init_model(num_workers=args.job_workers, max_queue=args.job_queue_size)
         
         # 启动服务器
         logger.info("启动FunASR API服务器...")
-        uvicorn.run(app, host="0.0.0.0", port=10096,ssl_keyfile="/home/dell/mnt/ai-work/Meeting/ssl_key/server.key",
-            ssl_certfile="/home/dell/mnt/ai-work/Meeting/ssl_key/server.crt")
+        uvicorn.run(app, host=args.host, port=args.port, ssl_keyfile=args.keyfile or None,
+            ssl_certfile=args.certfile or None)
         
     except Exception as e:
         logger.error(f"服务器启动失败: {e}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一服务器：在同一进程、同一事件循环中提供 websocket 流式识别和 REST 文件识别
+
+两套接口共用一个模型注册表（同路径的模型只加载一份）和一个推理执行器
+（文件识别注册为 file 阶段），线程池大小即整个进程的推理并发上限。
+本文件只解析统一服务器自己的参数，其余参数原样交给 funasr_wss_server。
+"""
+import argparse
+import asyncio
+import sys
+
+import uvicorn
+
+
+parser = argparse.ArgumentParser(description="FunASR websocket + REST server in one process")
+parser.add_argument("--ws_port", type=int, default=10095, help="websocket server port")
+parser.add_argument("--api_port", type=int, default=10096, help="http server port")
+parser.add_argument("--file_model", type=str, default="", help="asr model for file recognition, empty for the api default")
+parser.add_argument("--file_punc_model", type=str, default="", help="punc model for file recognition, empty for the api default")
+parser.add_argument("--spk_model", type=str, default="", help="speaker model for file recognition, empty for the api default")
+parser.add_argument(
+    "--online_spk", type=int, default=0, help="1 to label websocket offline results with speakers using the same speaker model"
+)
+parser.add_argument("--max_upload_mb", type=int, default=2048, help="max upload size in MB, 0 for unlimited")
+parser.add_argument("--job_workers", type=int, default=1, help="concurrent recognition jobs, one model replica each")
+parser.add_argument("--job_queue_size", type=int, default=100, help="max queued recognition jobs")
+parser.add_argument("--cache_entries", type=int, default=64, help="recognition results kept in memory")
+parser.add_argument("--cache_dir", type=str, default="", help="directory of the on-disk result cache, empty to disable")
+parser.add_argument("--cache_disk_mb", type=int, default=1024, help="size budget of the on-disk result cache in MB")
+args, wss_argv = parser.parse_known_args()
+
+import funasr_api_server as api  # noqa: E402
+
+if args.online_spk:
+    # 流式会话的说话人标注与文件识别使用同一个说话人模型，注册表中只有一份
+    wss_argv += ["--spk_model", args.spk_model or api.MODEL_PATHS["spk_model"]]
+# 其余参数（--host、模型路径、--device、证书等）由 websocket 服务解析；
+# 多进程 supervisor 与单进程共享模型的目的相反，这里固定为单进程
+sys.argv = [sys.argv[0]] + wss_argv + ["--port", str(args.ws_port), "--num_workers", "0"]
+
+import funasr_wss_server as wss  # noqa: E402
+
+
+def setup_file_recognition():
+    """文件识别模型交给 websocket 服务的加载器，与其他模型一起并行加载"""
+    api.DEVICE = wss.args.device
+    api.MODEL_PATHS["vad_model"] = wss.args.vad_model
+    api.MODEL_REVISIONS["vad_model"] = wss.args.vad_model_revision
+    for key, value in (("model", args.file_model), ("punc_model", args.file_punc_model), ("spk_model", args.spk_model)):
+        if value:
+            api.MODEL_PATHS[key] = value
+    if wss.args.spk_model:
+        api.MODEL_REVISIONS["spk_model"] = wss.args.spk_model_revision
+    # 登记库只能由一个实例追加写，两套接口共用 websocket 服务打开的索引
+    api.speaker_index = wss.speaker_index
+    api.SPEAKER_ID_THRESHOLD = wss.args.speaker_id_threshold
+    # 转录库同理，流式会议和文件识别写入同一个库，/api/transcripts/search 一并检索
+    api.transcript_store = wss.transcript_store
+    api.configure(args.max_upload_mb, args.cache_entries, args.cache_dir, args.cache_disk_mb)
+    api.init_jobs(wss.executor, num_workers=args.job_workers, max_queue=args.job_queue_size)
+    if wss.args.stub_models:
+        print("stub models: file recognition is disabled", flush=True)
+        return
+    wss.model_loader.add(
+        "file",
+        api.MODEL_PATHS["model"],
+        "",
+        args.job_workers,
+        build=lambda model_path, model_revision, replica: api.build_file_model(replica),
+    )
+
+
+if __name__ == "__main__":
+    setup_file_recognition()
+    loop = asyncio.get_event_loop()
+    loading = loop.create_task(wss.load_models())
+    if not wss.args.early_bind:
+        loop.run_until_complete(loading)
+    loop.run_until_complete(wss.start_servers())
+    server = uvicorn.Server(
+        uvicorn.Config(
+            api.app,
+            host=wss.args.host,
+            port=args.api_port,
+            ssl_keyfile=wss.args.keyfile or None,
+            ssl_certfile=wss.args.certfile or None,
+            # websocket 由 websockets 服务提供，REST 端不需要
+            ws="none",
+        )
+    )
+    print(f"http api on {wss.args.host}:{args.api_port}", flush=True)
+    # uvicorn 在当前事件循环中运行，直到收到退出信号
+    loop.run_until_complete(server.serve())
@@ -0,0 +1,335 @@
+"""
+压测客户端：按 React 客户端相同的协议（JSON 配置 + 二进制 PCM）把 WAV 文件推给
+funasr_wss_server，模拟多个并发客户端，统计中间/最终结果延迟、丢失与迟到的消息、
+服务端实时率和内存增长
+
+例：
+python funasr_wss_bench.py --port 10095 --clients 10 --speed 1 \
+    --metrics_url http://127.0.0.1:10098/metrics
+"""
+import argparse
+import asyncio
+import bisect
+import glob
+import json
+import os
+import ssl
+import time
+import urllib.request
+import wave
+
+import numpy as np
+import websockets
+
+
+DEFAULT_AUDIO = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "models", "speech_campplus_sv_zh-cn_16k-common", "examples", "*.wav",
+)
+
+
+def load_wav(path):
+    """读取 16kHz 16 位 WAV，多声道取平均，返回 PCM 字节"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getframerate() != 16000:
+            raise ValueError(f"{path}: need 16kHz 16-bit pcm wav")
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        if f.getnchannels() > 1:
+            data = data.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)
+    return data.tobytes()
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p90_ms": float(np.percentile(arr, 90)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def parse_metrics(text):
+    """解析 Prometheus 文本格式，返回 {(name, labels): value}"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_part, _, value = line.rpartition(" ")
+        if "{" in name_part:
+            name, labels = name_part.split("{", 1)
+            labels = labels.rstrip("}")
+        else:
+            name, labels = name_part, ""
+        try:
+            samples[(name, labels)] = float(value.replace("+Inf", "inf"))
+        except ValueError:
+            continue
+    return samples
+
+
+def scrape(url):
+    if not url:
+        return None
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return parse_metrics(resp.read().decode("utf-8"))
+    except OSError as e:
+        print(f"failed to scrape {url}: {e}")
+        return None
+
+
+def histogram_delta(before, after, name, label_prefix=""):
+    """两次抓取之间某个直方图新增的观测，返回 (桶上界列表, 各桶累计数, 总和, 次数)"""
+    buckets = []
+    for (metric, labels), value in after.items():
+        if metric != f"{name}_bucket" or not labels.startswith(label_prefix):
+            continue
+        le = labels.rsplit('le="', 1)[1].rstrip('"')
+        bound = float(le.replace("+Inf", "inf"))
+        buckets.append((bound, value - before.get((metric, labels), 0.0)))
+    buckets.sort()
+    plain = label_prefix.rstrip(",")
+    key = lambda suffix: (f"{name}_{suffix}", plain)
+    total = after.get(key("sum"), 0.0) - before.get(key("sum"), 0.0)
+    count = after.get(key("count"), 0.0) - before.get(key("count"), 0.0)
+    return buckets, total, count
+
+
+def histogram_summary(before, after, name, label_prefix=""):
+    """按桶线性插值估算分位数（秒）"""
+    buckets, total, count = histogram_delta(before, after, name, label_prefix)
+    if count <= 0:
+        return {"count": 0}
+
+    def quantile(q):
+        rank = q * count
+        prev_bound, prev_count = 0.0, 0.0
+        for bound, cumulative in buckets:
+            if cumulative >= rank:
+                if bound == float("inf"):
+                    return prev_bound
+                span = cumulative - prev_count
+                frac = (rank - prev_count) / span if span else 1.0
+                return prev_bound + (bound - prev_bound) * frac
+            prev_bound, prev_count = bound, cumulative
+        return prev_bound
+
+    return {
+        "count": int(count),
+        "mean": total / count,
+        "p50": quantile(0.5),
+        "p90": quantile(0.9),
+        "p99": quantile(0.99),
+    }
+
+
+class ClientStats:
+    def __init__(self):
+        self.partial_latency = []
+        self.final_latency = []
+        self.messages = 0
+        self.partials = 0
+        self.offline_results = 0
+        self.errors = 0
+        self.late_partials = 0
+        self.missing_finals = 0
+        self.failed_sessions = 0
+        self.send_lag = []
+        self.audio_seconds = 0.0
+
+
+async def run_session(args, index, audio, wav_name, stats):
+    """一个客户端会话：发送配置、按节奏推送音频、发送结束标记并等待最终结果"""
+    chunk_size = [int(x) for x in args.chunk_size.split(",")]
+    stride_ms = 60 * chunk_size[1] / args.chunk_interval
+    stride_bytes = int(stride_ms * 16) * 2
+    scheme = "wss" if args.ssl else "ws"
+    ssl_context = None
+    if args.ssl:
+        ssl_context = ssl.SSLContext()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    trigger_times = []
+    state = {"end_at": None}
+    final_received = asyncio.Event()
+
+    try:
+        async with websockets.connect(
+            f"{scheme}://{args.host}:{args.port}",
+            subprotocols=["binary"],
+            ping_interval=None,
+            ssl=ssl_context,
+            max_size=None,
+        ) as ws:
+            async def receive():
+                async for raw in ws:
+                    now = time.perf_counter()
+                    stats.messages += 1
+                    try:
+                        msg = json.loads(raw)
+                    except ValueError:
+                        continue
+                    mode = msg.get("mode", "")
+                    if mode == "error":
+                        stats.errors += 1
+                    elif mode.endswith("online"):
+                        stats.partials += 1
+                        pos = bisect.bisect_right(trigger_times, now)
+                        if pos:
+                            latency = now - trigger_times[pos - 1]
+                            stats.partial_latency.append(latency)
+                            if latency * 1000 > args.late_ms:
+                                stats.late_partials += 1
+                    elif mode.endswith("offline"):
+                        stats.offline_results += 1
+                        if state["end_at"] is not None and not final_received.is_set():
+                            stats.final_latency.append(now - state["end_at"])
+                            final_received.set()
+
+            receiver = asyncio.ensure_future(receive())
+            await ws.send(json.dumps({
+                "mode": args.mode,
+                "chunk_size": chunk_size,
+                "chunk_interval": args.chunk_interval,
+                "wav_name": wav_name,
+                "is_speaking": True,
+                "itn": False,
+                "wav_format": "pcm",
+                "audio_fs": 16000,
+                "hotwords": [],
+            }))
+            start = time.perf_counter()
+            for i, pos in enumerate(range(0, len(audio), stride_bytes)):
+                await ws.send(audio[pos:pos + stride_bytes])
+                if (i + 1) % args.chunk_interval == 0:
+                    trigger_times.append(time.perf_counter())
+                if args.speed > 0:
+                    target = start + (i + 1) * stride_ms / 1000 / args.speed
+                    delay = target - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        stats.send_lag.append(-delay)
+            await ws.send(json.dumps({"is_speaking": False}))
+            state["end_at"] = time.perf_counter()
+            stats.audio_seconds += len(audio) / 32000
+            if args.mode == "online":
+                # online 模式没有离线结果，留一点时间接收最后的中间结果
+                await asyncio.sleep(0.5)
+            else:
+                try:
+                    await asyncio.wait_for(final_received.wait(), timeout=args.final_timeout_s)
+                except asyncio.TimeoutError:
+                    stats.missing_finals += 1
+            receiver.cancel()
+    except (OSError, websockets.WebSocketException) as e:
+        print(f"client {index}: session failed: {e}")
+        stats.failed_sessions += 1
+
+
+async def run_client(args, index, files, stats):
+    await asyncio.sleep(index * args.ramp_s / max(args.clients, 1))
+    for round_index in range(args.rounds):
+        path, audio = files[(index + round_index) % len(files)]
+        await run_session(args, index, audio, f"bench-{index}-{os.path.basename(path)}", stats)
+
+
+async def sample_memory(url, samples, interval=1.0):
+    while True:
+        metrics = await asyncio.get_running_loop().run_in_executor(None, scrape, url)
+        if metrics:
+            rss = metrics.get(("process_resident_memory_bytes", ""))
+            if rss is not None:
+                samples.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def main(args):
+    paths = []
+    for pattern in args.audio_in.split(","):
+        paths.extend(sorted(glob.glob(pattern)))
+    if not paths:
+        raise SystemExit(f"no wav files match {args.audio_in}")
+    files = [(path, load_wav(path)) for path in paths]
+    print(f"{len(files)} files, {args.clients} clients, {args.rounds} rounds, speed {args.speed or 'max'}")
+
+    before = scrape(args.metrics_url)
+    memory_samples = []
+    sampler = asyncio.ensure_future(sample_memory(args.metrics_url, memory_samples)) if args.metrics_url else None
+    stats = ClientStats()
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(args, i, files, stats) for i in range(args.clients)])
+    wall = time.perf_counter() - start
+    if sampler is not None:
+        sampler.cancel()
+        # 等服务端处理完连接关闭，会话实时率在关闭时才记录
+        await asyncio.sleep(args.settle_s)
+    after = scrape(args.metrics_url)
+
+    report = {
+        "clients": args.clients,
+        "sessions": args.clients * args.rounds,
+        "wall_s": wall,
+        "audio_s": stats.audio_seconds,
+        "throughput_x_realtime": stats.audio_seconds / wall if wall else 0.0,
+        "messages": stats.messages,
+        "partials": stats.partials,
+        "offline_results": stats.offline_results,
+        "errors": stats.errors,
+        "late_partials": stats.late_partials,
+        "missing_finals": stats.missing_finals,
+        "failed_sessions": stats.failed_sessions,
+        "client_send_lag": percentiles(stats.send_lag),
+        "partial_latency": percentiles(stats.partial_latency),
+        "final_latency": percentiles(stats.final_latency),
+    }
+    if before and after:
+        report["server"] = {
+            "session_rtf": histogram_summary(before, after, "asr_session_rtf"),
+            "first_partial_latency_s": histogram_summary(before, after, "asr_first_partial_latency_seconds"),
+            "final_latency_s": histogram_summary(before, after, "asr_final_latency_seconds"),
+            "stage_latency_s": {
+                stage: histogram_summary(before, after, "asr_stage_latency_seconds", f'stage="{stage}",')
+                for stage in ("vad", "online", "offline", "punc")
+            },
+        }
+        rss_before = before.get(("process_resident_memory_bytes", ""))
+        rss_after = after.get(("process_resident_memory_bytes", ""))
+        if rss_before is not None and rss_after is not None:
+            report["server"]["memory"] = {
+                "rss_before_mb": rss_before / 2**20,
+                "rss_after_mb": rss_after / 2**20,
+                "rss_peak_mb": max(memory_samples + [rss_after]) / 2**20,
+                "growth_mb": (rss_after - rss_before) / 2**20,
+            }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="server host")
+    parser.add_argument("--port", type=int, default=10095, help="server port")
+    parser.add_argument("--ssl", type=int, default=0, help="1 for wss://, 0 for ws://")
+    parser.add_argument("--audio_in", type=str, default=DEFAULT_AUDIO, help="comma separated wav globs")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent simulated clients")
+    parser.add_argument("--rounds", type=int, default=1, help="files each client streams one after another")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 for real time, 2 for twice as fast, 0 for no pacing")
+    parser.add_argument("--ramp_s", type=float, default=1.0, help="spread client start times over this many seconds")
+    parser.add_argument("--mode", type=str, default="2pass", help="offline, online, 2pass")
+    parser.add_argument("--chunk_size", type=str, default="5,10,5", help="chunk size sent in the config message")
+    parser.add_argument("--chunk_interval", type=int, default=10, help="chunk interval sent in the config message")
+    parser.add_argument("--late_ms", type=float, default=1000, help="partials slower than this count as late")
+    parser.add_argument("--final_timeout_s", type=float, default=30, help="wait for the final result after the last chunk")
+    parser.add_argument("--metrics_url", type=str, default="", help="server /metrics url for rtf and memory figures")
+    parser.add_argument("--settle_s", type=float, default=2.0, help="wait before the last metrics scrape")
+    parser.add_argument("--output", type=str, default="", help="write the json report to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -3,12 +3,20 @@ import json
 import websockets
 import time
 import logging
-import tracemalloc
-import numpy as np
 import argparse
 import ssl
-import torch
-import gc
+import os
+import sys
+import itertools
+import functools
+import concurrent.futures
+import uuid
+
+try:
+    import torch
+except ImportError:
+    # --stub_models 压测时可以不安装 torch
+    torch = None
 
 
 parser = argparse.ArgumentParser()
@@ -44,6 +52,13 @@ parser.add_argument(
     help="model from modelscope",
 )
 parser.add_argument("--punc_model_revision", type=str, default="v2.0.4", help="")
+parser.add_argument(
+    "--spk_model",
+    type=str,
+    default="",
+    help="speaker embedding model (CAM++) labelling each offline result with a speaker, empty to disable",
+)
+parser.add_argument("--spk_model_revision", type=str, default="v2.0.2", help="")
 parser.add_argument("--ngpu", type=int, default=1, help="0 for cpu, 1 for gpu")
 parser.add_argument("--device", type=str, default="cuda", help="cuda, cpu")
 parser.add_argument("--ncpu", type=int, default=4, help="cpu cores")
@@ -62,58 +77,182 @@ parser.add_argument(
     required=False,
     help="keyfile for ssl",
 )
+parser.add_argument(
+    "--inference_workers", type=int, default=4, help="size of the inference thread pool shared by all sessions"
+)
+parser.add_argument("--vad_instances", type=int, default=1, help="vad model replicas (vad stage concurrency)")
+parser.add_argument("--online_instances", type=int, default=1, help="online asr model replicas (online stage concurrency)")
+parser.add_argument("--offline_instances", type=int, default=1, help="offline asr model replicas (offline stage concurrency)")
+parser.add_argument("--punc_instances", type=int, default=1, help="punc model replicas (punc stage concurrency)")
+parser.add_argument("--spk_instances", type=int, default=1, help="speaker model replicas (spk stage concurrency)")
+parser.add_argument(
+    "--spk_threshold", type=float, default=0.6, help="cosine similarity above which an utterance joins a known speaker"
+)
+parser.add_argument("--spk_max_speakers", type=int, default=16, help="max speakers tracked per session")
+parser.add_argument(
+    "--speaker_index_dir", type=str, default="", help="directory of the enrolled speaker index used to name speakers, empty to disable"
+)
+parser.add_argument(
+    "--speaker_id_threshold", type=float, default=0.5, help="cosine similarity needed to label a speaker with an enrolled name"
+)
+parser.add_argument(
+    "--speaker_index_dtype", type=str, default="float16", choices=["float16", "float32"], help="storage type of a new speaker index"
+)
+parser.add_argument(
+    "--transcript_dir", type=str, default="", help="directory of the searchable transcript store, empty to disable"
+)
+parser.add_argument(
+    "--spk_min_ms",
+    type=int,
+    default=1000,
+    help="shorter utterances are matched to a known speaker without updating its centroid",
+)
+parser.add_argument(
+    "--online_max_batch", type=int, default=16, help="max online asr chunks run back to back on one replica when all are busy"
+)
+parser.add_argument(
+    "--offline_batch_window_ms",
+    type=float,
+    default=30,
+    help="max time a finished utterance waits for others before the offline pass runs",
+)
+parser.add_argument("--offline_max_batch", type=int, default=8, help="max utterances per offline asr / punc batch")
+parser.add_argument(
+    "--long_audio_batch_s",
+    type=float,
+    default=60,
+    help="audio seconds per decode batch when a long utterance is split by vad",
+)
+parser.add_argument(
+    "--offline_pipeline_depth", type=int, default=4, help="queue size between offline decode, punc and send stages"
+)
+parser.add_argument(
+    "--num_workers",
+    type=int,
+    default=0,
+    help="run as supervisor of N worker processes, each with its own models; 0 serves in this process",
+)
+parser.add_argument("--worker_base_port", type=int, default=20095, help="local port of the first worker")
+parser.add_argument("--status_port", type=int, default=0, help="supervisor http status port, 0 to disable")
+parser.add_argument(
+    "--pin_workers", action="store_true", help="pin each worker to its own --ncpu cores"
+)
+parser.add_argument("--cpu_affinity", type=str, default="", help="comma separated cpu ids to pin this process to")
+parser.add_argument(
+    "--memory_budget_mb",
+    type=int,
+    default=0,
+    help="memory budget for in-flight offline decodes (gpu memory on cuda, rss on cpu), 0 for 80%% of free memory",
+)
+parser.add_argument(
+    "--silence_gate", type=int, default=1, help="1 to skip vad and online asr on frames the energy gate deems silent"
+)
+parser.add_argument("--gate_margin_db", type=float, default=6.0, help="energy above the noise floor counted as speech")
+parser.add_argument("--gate_min_energy_db", type=float, default=-55.0, help="frames below this dBFS are never speech")
+parser.add_argument("--gate_zcr", type=float, default=0.25, help="zero crossing rate marking weak frames as unvoiced speech")
+parser.add_argument("--gate_hangover_ms", type=int, default=600, help="time the gate stays open after the last speech frame")
+parser.add_argument("--gate_preroll_ms", type=int, default=300, help="audio before the resume point replayed to vad")
+parser.add_argument("--metrics_port", type=int, default=0, help="prometheus /metrics http port, 0 to disable")
+parser.add_argument("--metrics_host", type=str, default="0.0.0.0", help="listen address of the metrics port")
+parser.add_argument(
+    "--modes", type=str, default="2pass,online,offline", help="comma separated modes to serve; only their models are loaded"
+)
+parser.add_argument("--load_workers", type=int, default=4, help="models loaded in parallel at startup")
+parser.add_argument("--warmup", type=int, default=1, help="1 to run one warm-up inference per model after loading")
+parser.add_argument(
+    "--early_bind", type=int, default=1, help="1 to accept connections while models are still loading"
+)
+parser.add_argument(
+    "--startup_policy",
+    type=str,
+    default="queue",
+    choices=["queue", "reject"],
+    help="clients arriving before their models are ready wait (queue) or get an error (reject)",
+)
+parser.add_argument("--startup_timeout_s", type=float, default=600, help="max time a queued client waits for models")
+parser.add_argument("--send_high_water", type=int, default=64, help="queued outbound messages per session that count as a slow client")
+parser.add_argument(
+    "--send_overflow",
+    type=str,
+    default="coalesce",
+    choices=["coalesce", "disconnect"],
+    help="at the high-water mark keep coalescing partials (coalesce) or close the connection (disconnect)",
+)
+parser.add_argument("--upload_ttl_s", type=float, default=300, help="seconds an interrupted file upload can be resumed, 0 to disable")
+parser.add_argument("--upload_ack_ms", type=int, default=5000, help="audio between upload offset acknowledgements")
+parser.add_argument("--upload_max_parked", type=int, default=64, help="max interrupted uploads kept for resuming")
+parser.add_argument(
+    "--stub_models",
+    action="store_true",
+    help="replace the four models with deterministic stubs (no weights needed), for benchmarking the server itself",
+)
+parser.add_argument("--stub_rtf", type=float, default=0.02, help="stub compute time per audio second")
+parser.add_argument("--stub_overhead_ms", type=float, default=2.0, help="stub compute time per generate call")
+parser.add_argument("--stub_busy", action="store_true", help="stubs busy-wait on cpu instead of sleeping")
+parser.add_argument(
+    "--memory_pressure", type=float, default=0.9, help="release cached memory only when usage exceeds this share of the budget"
+)
 args = parser.parse_args()
 
+if args.cpu_affinity and hasattr(os, "sched_setaffinity"):
+    os.sched_setaffinity(0, {int(x) for x in args.cpu_affinity.split(",")})
+
+if args.num_workers > 0:
+    from supervisor import Supervisor
+
+    Supervisor(args, sys.argv[1:]).run()
+    sys.exit(0)
+
 
 websocket_users = set()
+session_ids = itertools.count(1)
+
+from inference_executor import InferenceExecutor
+from batching import MicroBatcher, generate_batched, generate_each
+from audio_ring import AudioRing
+from long_audio import transcribe_long_audio
+from pipeline import StagePipeline, pipeline_stats
+from admission import AdmissionController, RssMemoryBackend, default_memory_backend
+from vad_gate import SilenceGate, gate_stats
+from metrics import Registry, RTF_BUCKETS
+from side_http import start_http_server
+from model_loader import MODE_STAGES, ModelLoader
+from model_registry import shared_registry
+from outbound import OutboundQueue
+from transcript import TranscriptAccumulator
+from upload_sessions import UploadStore
+from audio_codecs import UnsupportedAudioFormat, make_transport_decoder
+from speaker_cluster import OnlineSpeakerClusterer
+from speaker_index import SpeakerIndex
+from transcript_store import MAX_SEARCH_LIMIT, TranscriptStore, check_meeting_id
+
+
+def build_model(model_path, model_revision, replica=0):
+    """经共享注册表取得模型：同一进程中路径、版本、设备、副本号相同的模型只加载一份"""
+    device = "stub" if args.stub_models else args.device
+    key = shared_registry.make_key(model_path, model_revision, device, replica)
+    return shared_registry.acquire(key, lambda: create_model(model_path, model_revision))
+
+
+def create_model(model_path, model_revision):
+    if args.stub_models:
+        from stub_models import build_stub_model
+
+        kinds = {
+            args.vad_model: "vad",
+            args.punc_model: "punc",
+            args.asr_model_online: "online",
+            args.asr_model: "offline",
+            args.spk_model: "spk",
+        }
+        return build_stub_model(
+            kinds[model_path], rtf=args.stub_rtf, overhead_ms=args.stub_overhead_ms, busy=args.stub_busy
+        )
+    from funasr import AutoModel
 
-print("model loading")
-from funasr import AutoModel
-
-# asr
-model_asr = AutoModel(
-    model=args.asr_model,
-    model_revision=args.asr_model_revision,
-    ngpu=args.ngpu,
-    ncpu=args.ncpu,
-    device=args.device,
-    disable_pbar=True,
-    disable_log=True,
-    disable_update=True,  # 禁用版本检查以减少警告
-    trust_remote_code=False,  # 设为False以避免远程代码警告
-    local_files_only=True,
-)
-# asr
-model_asr_streaming = AutoModel(
-    model=args.asr_model_online,
-    model_revision=args.asr_model_online_revision,
-    ngpu=args.ngpu,
-    ncpu=args.ncpu,
-    device=args.device,
-    disable_pbar=True,
-    disable_log=True,
-    disable_update=True,  # 禁用版本检查以减少警告
-    trust_remote_code=False,  # 设为False以避免远程代码警告
-    local_files_only=True,
-)
-# vad
-model_vad = AutoModel(
-    model=args.vad_model,
-    model_revision=args.vad_model_revision,
-    ngpu=args.ngpu,
-    ncpu=args.ncpu,
-    device=args.device,
-    disable_pbar=True,
-    disable_log=True,
-    disable_update=True,  # 禁用版本检查以减少警告
-    trust_remote_code=False,  # 设为False以避免远程代码警告
-    local_files_only=True,
-)
-
-if args.punc_model != "":
-    model_punc = AutoModel(
-        model=args.punc_model,
-        model_revision=args.punc_model_revision,
+    return AutoModel(
+        model=model_path,
+        model_revision=model_revision,
         ngpu=args.ngpu,
         ncpu=args.ncpu,
         device=args.device,
@@ -123,15 +262,177 @@ if args.punc_model != "":
         trust_remote_code=False,  # 设为False以避免远程代码警告
         local_files_only=True,
     )
-else:
-    model_punc = None
+
+
+# 推理执行器：每个阶段的并发上限等于模型副本数，同一副本同一时刻只服务一个调用
+executor = InferenceExecutor(max_workers=args.inference_workers)
+
+# 只加载启用的识别模式需要的模型；各阶段并行加载，加载完成后才注册到执行器
+enabled_modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+for mode in enabled_modes:
+    if mode not in MODE_STAGES:
+        raise SystemExit(f"unknown mode {mode}, expected one of {', '.join(MODE_STAGES)}")
+required_stages = {stage for mode in enabled_modes for stage in MODE_STAGES[mode]}
+if args.punc_model == "":
+    required_stages.discard("punc")
+# 说话人标注是离线结果的附加信息，不在 MODE_STAGES 中，加载完成前的结果不带说话人
+if args.spk_model and "offline" in required_stages:
+    required_stages.add("spk")
+stage_models = {
+    "vad": (args.vad_model, args.vad_model_revision, args.vad_instances),
+    "online": (args.asr_model_online, args.asr_model_online_revision, args.online_instances),
+    "offline": (args.asr_model, args.asr_model_revision, args.offline_instances),
+    "punc": (args.punc_model, args.punc_model_revision, args.punc_instances),
+    "spk": (args.spk_model, args.spk_model_revision, args.spk_instances),
+}
+model_loader = ModelLoader(
+    executor, build_model, max_parallel=args.load_workers, warmup=bool(args.warmup), release=shared_registry.release
+)
+for stage in ("vad", "online", "offline", "punc", "spk"):
+    if stage in required_stages:
+        model_loader.add(stage, *stage_models[stage])
+punc_enabled = "punc" in required_stages
+spk_enabled = "spk" in required_stages
+# 已登记说话人的索引：会话中的说话人质心与之匹配时，用登记的名字代替“说话人N”
+speaker_index = SpeakerIndex(args.speaker_index_dir, dtype=args.speaker_index_dtype) if args.speaker_index_dir else None
+# 可检索的转录库：离线结果按会议追加写入并编入索引
+transcript_store = TranscriptStore(args.transcript_dir) if args.transcript_dir else None
+# 转录检索专用的线程，与推理线程池分开，检索再多也不占推理的并发
+search_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="search")
+if transcript_store is not None:
+    print(f"transcript store: {len(transcript_store)} segments loaded in {transcript_store.load_seconds:.2f}s", flush=True)
+
+# 流式识别调度：流式模型不能把不同会话的片段合并成一次前向，有空闲副本时片段立即执行；
+# 副本都忙时片段排队，在下一个空出的副本上依次执行，省掉逐个排队、切换线程的开销
+online_batcher = MicroBatcher(
+    executor,
+    "online",
+    generate_each,
+    max_batch=args.online_max_batch,
+    batched=False,
+)
+# 2pass 离线识别：不同会话同时结束的句子合并成按长度排序的批次，再批量加标点
+offline_batcher = MicroBatcher(
+    executor,
+    "offline",
+    generate_batched,
+    window_ms=args.offline_batch_window_ms,
+    max_batch=args.offline_max_batch,
+)
+punc_batcher = MicroBatcher(
+    executor,
+    "punc",
+    generate_each,
+    max_batch=args.offline_max_batch,
+    batched=False,
+) if punc_enabled else None
+
+
+# 指标：各阶段延迟（含排队与批处理等待）、会话实时率、首个中间结果与最终结果延迟
+metrics_registry = Registry()
+stage_latency = metrics_registry.histogram(
+    "asr_stage_latency_seconds", "Latency of each model stage including queueing", ["stage"]
+)
+vad_latency = stage_latency.labels("vad")
+online_latency = stage_latency.labels("online")
+offline_latency = stage_latency.labels("offline")
+punc_latency = stage_latency.labels("punc")
+spk_latency = stage_latency.labels("spk")
+session_rtf = metrics_registry.histogram(
+    "asr_session_rtf", "Model time divided by audio duration, observed when a session closes", buckets=RTF_BUCKETS
+)
+first_partial_latency = metrics_registry.histogram(
+    "asr_first_partial_latency_seconds", "Time from vad speech start to the first non-empty partial result"
+)
+final_latency = metrics_registry.histogram(
+    "asr_final_latency_seconds", "Time from end of speech to the offline result being sent"
+)
+send_latency = metrics_registry.histogram(
+    "asr_send_latency_seconds", "Time a message waits in the session's outbound queue until written", ["kind"]
+)
+metrics_registry.gauge("asr_outbound_queue_depth", "Messages waiting in each session's outbound queue", ["session"]).set_function(
+    lambda: {(websocket.session_id,): websocket.outbound.stats()["depth"] for websocket in websocket_users}
+)
+audio_seconds_total = metrics_registry.counter("asr_audio_seconds_total", "Audio received from all sessions")
+metrics_registry.gauge("asr_active_sessions", "Connected websocket sessions").set_function(
+    lambda: {(): len(websocket_users)}
+)
+
+
+def queue_depths():
+    depths = {}
+    for stage, stats in executor.stats.items():
+        depths[("executor", stage)] = stats["waiting"]
+    for batcher in (online_batcher, offline_batcher, punc_batcher):
+        if batcher is not None:
+            depths[("batcher", batcher.stage)] = batcher.stats()["pending"]
+    for stage, stats in pipeline_stats().items():
+        depths[("pipeline", stage)] = stats["queue_depth"]
+    depths[("admission", "offline")] = admission.stats()["waiting"]
+    return depths
+
+
+metrics_registry.gauge("asr_queue_depth", "Items waiting in each queue", ["queue", "stage"]).set_function(queue_depths)
+metrics_registry.gauge("process_resident_memory_bytes", "Resident memory of this process").set_function(
+    lambda: {(): RssMemoryBackend().used()}
+)
+metrics_registry.gauge("asr_model_ready", "1 when the stage's models are loaded and warm", ["stage"]).set_function(
+    lambda: {(stage,): int(executor.has_stage(stage)) for stage in model_loader.stages}
+)
+metrics_registry.gauge(
+    "asr_model_load_seconds", "Load and warm-up time of each model replica", ["stage", "replica", "phase"]
+).set_function(
+    lambda: {
+        (t["stage"], t["replica"], phase): t[f"{phase}_s"]
+        for t in model_loader.timings
+        for phase in ("load", "warmup")
+    }
+)
+metrics_registry.gauge("asr_silence_skipped_share", "Share of received audio skipped by the silence gate").set_function(
+    lambda: {(): gate_stats()["skipped_share"]}
+)
+
+
+def session_stats():
+    """各会话的发送队列深度与发送延迟"""
+    return {
+        websocket.session_id: dict(websocket.outbound.stats(), mode=getattr(websocket, "mode", ""))
+        for websocket in websocket_users
+    }
+
+
+class stage_timer:
+    """统计一次模型阶段调用的耗时，同时计入会话的模型时间"""
+    def __init__(self, websocket, histogram):
+        self.websocket = websocket
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed)
+        self.websocket.model_time += elapsed
+        return False
+
+
+def observe_session_end(websocket):
+    """会话结束时记录实时率，只记录一次"""
+    if getattr(websocket, "metrics_done", True):
+        return
+    websocket.metrics_done = True
+    audio_s = websocket.audio_ring.end / websocket.audio_ring.sample_rate
+    if audio_s > 0:
+        session_rtf.observe(websocket.model_time / audio_s)
 
 
 def get_gpu_memory_info():
     """
     获取GPU显存使用情况
     """
-    if torch.cuda.is_available():
+    if torch is not None and torch.cuda.is_available():
         device = torch.cuda.current_device()
         total_memory = torch.cuda.get_device_properties(device).total_memory / (1024**3)  # GB
         allocated_memory = torch.cuda.memory_allocated(device) / (1024**3)  # GB
@@ -146,140 +447,211 @@ def get_gpu_memory_info():
         }
     return None
 
-def clear_gpu_memory():
-    """
-    清理GPU显存
-    """
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-        gc.collect()
-        print("GPU memory cleared")
-
-def check_memory_before_processing(audio_size_bytes):
-    """
-    在处理前检查显存是否足够
-    """
-    memory_info = get_gpu_memory_info()
-    if memory_info:
-        print(f"GPU Memory - Total: {memory_info['total']:.2f}GB, Free: {memory_info['free']:.2f}GB, Allocated: {memory_info['allocated']:.2f}GB")
-        
-        # 估算需要的显存（经验值：音频大小的3-5倍）
-        estimated_memory_gb = (audio_size_bytes * 4) / (1024**3)
-        
-        if memory_info['free'] < estimated_memory_gb:
-            print(f"Warning: Insufficient GPU memory. Need ~{estimated_memory_gb:.2f}GB, but only {memory_info['free']:.2f}GB available")
-            clear_gpu_memory()
-            # 重新检查
-            memory_info = get_gpu_memory_info()
-            print(f"After cleanup - Free: {memory_info['free']:.2f}GB")
-            return memory_info['free'] >= estimated_memory_gb
-        return True
-    return True
-
-
-class AudioBuffer:
-    """
-    音频缓冲区管理类，用于流式音频处理
-    """
-    def __init__(self, max_buffer_size_mb=50):
-        self.buffer = b""
-        self.max_buffer_size = max_buffer_size_mb * 1024 * 1024  # 转换为字节
-        self.processed_size = 0
-        
-    def add_chunk(self, chunk):
-        """添加音频块到缓冲区"""
-        self.buffer += chunk
-        
-        # 如果缓冲区过大，清理已处理的部分
-        if len(self.buffer) > self.max_buffer_size:
-            self.buffer = self.buffer[self.processed_size:]
-            self.processed_size = 0
-            
-    def get_unprocessed_data(self):
-        """获取未处理的音频数据"""
-        if not self.buffer:
-            return b""
-        return self.buffer[self.processed_size:]
-        
-    def mark_processed(self, size):
-        """标记已处理的数据大小"""
-        self.processed_size += size
-        
-    def clear(self):
-        """清空缓冲区"""
-        self.buffer = b""
-        self.processed_size = 0
-        
-    def get_buffer_size(self):
-        """获取缓冲区大小"""
-        return len(self.buffer)
-    
-    def is_likely_active(self):
-        """判断音频缓冲区是否可能包含活动语音"""
-        if len(self.buffer) < 320:  # 至少需要20ms的音频数据 (16kHz * 0.02s = 320 samples)
-            return False
-            
-        # 检查音频数据是否全为零
-        audio_array = np.frombuffer(self.buffer, dtype=np.int16)
-        if np.all(audio_array == 0):
-            return False
-            
-        # 简单的能量检测
-        energy = np.mean(np.abs(audio_array))
-        return energy > 100  # 设置一个较低的能量阈值
-
-
-def merge_stream_results(stream_results):
-    """
-    合并流式识别结果，去重并生成完整文本
-    """
-    if not stream_results:
-        return ""
-    
-    # 提取所有文本片段
-    texts = []
-    for result in stream_results:
-        if result and "text" in result and result["text"]:
-            texts.append(result["text"].strip())
-    
-    # 简单去重和合并
-    merged_text = "".join(texts)
-    return merged_text
-
-
 async def send_final_result(websocket, text, mode="final"):
     """
     发送最终识别结果
     """
     try:
-        message = json.dumps({
+        websocket.outbound.send({
             "mode": mode,
             "text": text,
             "wav_name": websocket.wav_name,
             "is_final": True,
             "timestamp": time.time()
         })
-        await websocket.send(message)
         print(f"Final result sent: {text[:100]}..." if len(text) > 100 else f"Final result sent: {text}")
     except Exception as e:
         print(f"Failed to send final result: {str(e)}")
 
-print("model loaded! only support one client at the same time now!!!!")
-print("GPU Memory Status:")
-memory_info = get_gpu_memory_info()
-if memory_info:
-    print(f"Total: {memory_info['total']:.2f}GB, Free: {memory_info['free']:.2f}GB")
+# 离线解码的内存准入：模型加载完成后重新取基线，预算不足时排队而不是拒绝
+admission = AdmissionController(
+    default_memory_backend(args.device),
+    budget_bytes=args.memory_budget_mb * 1024 * 1024,
+    pressure_ratio=args.memory_pressure,
+)
+
+
+async def load_models():
+    """并行加载、预热启用模式需要的模型，完成后打印各模型耗时"""
+    print(f"model loading: {', '.join(model_loader.stages)} for modes {', '.join(enabled_modes)}", flush=True)
+    await model_loader.load()
+    model_loader.print_report()
+    print(f"model loaded! inference workers: {args.inference_workers}")
+    print("GPU Memory Status:")
+    memory_info = get_gpu_memory_info()
+    if memory_info:
+        print(f"Total: {memory_info['total']:.2f}GB, Free: {memory_info['free']:.2f}GB")
+    admission.reset_baseline()
+    print(f"memory admission: backend {admission.backend.name}, budget {admission.budget_bytes / (1024**3):.2f}GB")
+
+
+# 断线后保留、续传时恢复的会话属性
+UPLOAD_STATE = (
+    "status_dict_asr",
+    "status_dict_asr_online",
+    "status_dict_vad",
+    "status_dict_punc",
+    "chunk_interval",
+    "vad_pre_idx",
+    "sent_text_length",
+    "audio_ring",
+    "vad_origin",
+    "online_offset",
+    "online_frames",
+    "offline_offset",
+    "transcript",
+    "silence_gate",
+    "gate_closed",
+    "wav_name",
+    "mode",
+    "is_speaking",
+    "model_time",
+    "upload_bytes",
+    "audio_format",
+    "audio_decoder",
+    "speakers",
+    "speaker_names",
+    "meeting_id",
+)
+
+
+async def drain_pipeline(pipeline):
+    """断线会话的离线流水线在后台跑完，结果并入转录"""
+    try:
+        await pipeline.join()
+    finally:
+        pipeline.close()
+
+
+def release_upload(state):
+    state["draining"].cancel()
+    state["audio_ring"].clear()
+    state["outbound"].take_held()
+
+
+upload_store = UploadStore(ttl_s=args.upload_ttl_s, max_sessions=args.upload_max_parked, on_expire=release_upload)
+
+
+async def resume_upload(websocket, upload_id):
+    """
+    开始或恢复文件上传会话
+
+    回复 upload-session 消息，带 upload_id 和服务器已收到的字节数，客户端从该位置继续发送；
+    恢复时随后补发断线前后没送达的识别结果。
+    恢复成功时返回断线前的 (speech_start, speech_end_i)，否则返回 None。
+    """
+    state = upload_store.take(upload_id) if upload_id else None
+    restored = None
+    if state is not None:
+        # 等断线前提交的句子识别完，转录按顺序确认
+        await state.pop("draining")
+        restored = (state.pop("speech_start"), state.pop("speech_end_i"))
+        held = state.pop("outbound")
+        for attr, value in state.items():
+            setattr(websocket, attr, value)
+        websocket.upload_id = upload_id
+        print(f"upload {upload_id} resumed at {websocket.upload_bytes} bytes", flush=True)
+    else:
+        websocket.upload_id = upload_store.new_id()
+        websocket.upload_bytes = 0
+    session = {
+        "mode": "upload-session",
+        "upload_id": websocket.upload_id,
+        "offset": websocket.upload_bytes,
+        "resumed": state is not None,
+        "wav_name": websocket.wav_name,
+        "is_final": False,
+    }
+    if upload_id and state is None:
+        # 已过期、被挤出，或暂存在另一个工作进程（--num_workers > 1 时暂存不跨进程共享），
+        # 明确告诉客户端从头重传，而不是让它以为续传成功
+        session["resume_error"] = "unknown upload_id"
+        print(f"upload {upload_id} is not parked in this process, restarting as {websocket.upload_id}", flush=True)
+    websocket.upload_acked = websocket.audio_ring.end
+    websocket.outbound.send(session)
+    if state is not None:
+        # 补发断线时没写出的结果和断线期间识别完成的句子；旧连接的上传确认已过时，不补发
+        replayed = [p for p in held.take_held() if p.get("mode") not in ("upload-ack", "upload-session")]
+        for payload in replayed:
+            websocket.outbound.send(payload)
+        print(f"upload {upload_id} replayed {len(replayed)} undelivered messages", flush=True)
+    return restored
+
+
+def send_upload_ack(websocket):
+    websocket.upload_acked = websocket.audio_ring.end
+    websocket.outbound.send({
+        "mode": "upload-ack",
+        "upload_id": websocket.upload_id,
+        "offset": websocket.upload_bytes,
+        "wav_name": websocket.wav_name,
+        "is_final": False,
+    })
+
+
+def park_upload(websocket, speech_start, speech_end_i):
+    """上传未完成的会话断线时保留其状态，返回 True 表示状态已交给 upload_store"""
+    if getattr(websocket, "upload_id", None) is None or args.upload_ttl_s <= 0:
+        return False
+    state = {attr: getattr(websocket, attr) for attr in UPLOAD_STATE if hasattr(websocket, attr)}
+    state["speech_start"] = speech_start
+    state["speech_end_i"] = speech_end_i
+    # 发送队列停止发送，没写出的消息和后台识别完成的结果留到续传时补发
+    websocket.outbound.hold()
+    state["outbound"] = websocket.outbound
+    state["draining"] = asyncio.ensure_future(drain_pipeline(websocket.offline_pipeline))
+    upload_store.park(websocket.upload_id, state)
+    websocket.upload_parked = True
+    print(f"upload {websocket.upload_id} parked at {websocket.upload_bytes} bytes", flush=True)
+    return True
+
+
+async def wait_for_models(websocket):
+    """
+    按会话的识别模式检查所需模型是否就绪
+
+    未就绪时按 --startup_policy 等待或直接报错；返回 False 表示应断开该会话。
+    """
+    if websocket.mode not in enabled_modes:
+        await send_asr_error(websocket, f"mode {websocket.mode} is not enabled on this server")
+        return False
+    stages = [stage for stage in MODE_STAGES[websocket.mode] if stage in required_stages]
+    if model_loader.is_ready(stages):
+        return True
+    if args.startup_policy == "reject":
+        await send_asr_error(websocket, "models are still loading, please retry later")
+        return False
+    print(f"client waiting for models: {', '.join(stages)}", flush=True)
+    if await model_loader.wait(stages, timeout=args.startup_timeout_s):
+        return True
+    await send_asr_error(websocket, "required models are not available")
+    return False
 
 
 async def ws_reset(websocket):
     """重置WebSocket连接状态"""
     print("ws reset now, total num is ", len(websocket_users))
+    observe_session_end(websocket)
+    print("online dispatch stats:", online_batcher.stats())
+    print("offline batch stats:", offline_batcher.stats())
+    print("offline pipeline stats:", pipeline_stats())
+    print("memory admission stats:", admission.stats())
+    if getattr(websocket, "silence_gate", None) is not None:
+        print("silence gate stats:", websocket.silence_gate.stats(), "all sessions:", gate_stats())
+    # 先把已入队的结果发完再关闭连接
+    await websocket.outbound.close()
+    print("outbound stats:", websocket.outbound.stats())
+    print("upload sessions:", upload_store.stats())
 
-    websocket.status_dict_asr_online["cache"] = {}
-    websocket.status_dict_asr_online["is_final"] = True
-    websocket.status_dict_vad["cache"] = {}
-    websocket.status_dict_vad["is_final"] = True
-    websocket.status_dict_punc["cache"] = {}
+    if not getattr(websocket, "upload_parked", False):
+        # 保留待续传的上传会话时，流水线在后台跑完，各缓存留给续传的连接
+        if hasattr(websocket, "offline_pipeline"):
+            websocket.offline_pipeline.close()
+        websocket.status_dict_asr_online["cache"] = {}
+        websocket.status_dict_asr_online["is_final"] = True
+        websocket.status_dict_vad["cache"] = {}
+        websocket.status_dict_vad["is_final"] = True
+        websocket.status_dict_punc["cache"] = {}
 
     await websocket.close()
 
@@ -290,13 +662,29 @@ async def clear_websocket():
     websocket_users.clear()
 
 
+# 语音起点之前保留的历史音频，VAD 报告的起点可能落在已经收到的音频里
+HISTORY_SAMPLES = 3 * 16000
+# 计算说话人向量时每句最多取的音频
+SPEAKER_PROBE_SAMPLES = 20 * 16000
+
+
+def trim_audio_ring(websocket):
+    """按仍需要的最早偏移裁剪会话音频"""
+    ring = websocket.audio_ring
+    keep = min(ring.end - HISTORY_SAMPLES, websocket.online_offset)
+    if websocket.offline_offset is not None:
+        keep = min(keep, websocket.offline_offset)
+    ring.release(keep)
+
+
 async def ws_serve(websocket, path):
-    frames = []
-    frames_asr = []
-    frames_asr_online = []
     global websocket_users
     # await clear_websocket()
     websocket_users.add(websocket)
+    websocket.session_id = next(session_ids)
+    websocket.outbound = OutboundQueue(
+        websocket, high_water=args.send_high_water, overflow=args.send_overflow, latency_histogram=send_latency
+    ).start()
     websocket.status_dict_asr = {}
     websocket.status_dict_asr_online = {"cache": {}, "is_final": False}
     websocket.status_dict_vad = {"cache": {}, "is_final": False}
@@ -304,13 +692,41 @@ async def ws_serve(websocket, path):
     websocket.chunk_interval = 10
     websocket.vad_pre_idx = 0
     websocket.sent_text_length = 0  # 初始化已发送文本长度计数器
-    websocket.audio_buffer = AudioBuffer(max_buffer_size_mb=100)  # 添加音频缓冲区
-    websocket.stream_results = []  # 存储流式识别结果
+    websocket.audio_ring = AudioRing()  # 会话唯一的音频缓冲区，按采样点偏移寻址
+    websocket.audio_format = ("pcm", 16000)  # 握手声明的传输编码和采样率
+    websocket.audio_decoder = make_transport_decoder(*websocket.audio_format)
+    websocket.vad_origin = 0  # VAD 时间轴零点对应的采样点偏移
+    websocket.online_offset = 0  # 尚未送入流式识别的音频起点
+    websocket.online_frames = 0  # 自上次流式识别以来收到的帧数
+    websocket.offline_offset = None  # 离线识别音频起点，None 表示未在收集
+    websocket.transcript = TranscriptAccumulator()  # 文件上传模式下累积的转录文本
+    # 会话内的在线说话人聚类，只保存各说话人的质心，内存随 --spk_max_speakers 有界
+    websocket.speakers = OnlineSpeakerClusterer(
+        threshold=args.spk_threshold, max_speakers=args.spk_max_speakers
+    ) if spk_enabled else None
+    websocket.speaker_names = {}  # 说话人编号 -> 登记的名字，认出后不再改变
+    websocket.silence_gate = SilenceGate(
+        margin_db=args.gate_margin_db,
+        min_energy_db=args.gate_min_energy_db,
+        zcr_threshold=args.gate_zcr,
+        hangover_ms=args.gate_hangover_ms,
+    ) if args.silence_gate else None
+    websocket.gate_closed = False  # 静音门关闭期间 VAD 和流式识别都未运行
+    websocket.models_ready = False  # 本会话模式所需的模型已确认就绪
+    websocket.model_time = 0.0  # 本会话各模型阶段累计耗时
+    websocket.metrics_done = False
+    websocket.speech_started_at = None  # VAD 检测到语音起点的时间，首个中间结果发出后清空
+    websocket.offline_pipeline = create_offline_pipeline(websocket).start()
     speech_start = False
     speech_end_i = -1
     websocket.wav_name = "microphone"
     websocket.mode = "2pass"
     websocket.is_file_upload = False  # 添加文件上传标识
+    websocket.upload_id = None  # 可续传的上传会话 id，收到 is_file_upload 时分配或恢复
+    websocket.upload_bytes = 0  # 本次上传已收到的音频字节数
+    websocket.upload_acked = 0  # 上次确认时的采样点偏移
+    websocket.upload_parked = False
+    websocket.meeting_id = None  # 转录库中的会议 id，第一次写入时生成，客户端也可以指定
     print("new user connected", flush=True)
 
     try:
@@ -347,145 +763,222 @@ async def ws_serve(websocket, path):
                     websocket.mode = messagejson["mode"]
                 if "is_file_upload" in messagejson:
                     websocket.is_file_upload = messagejson["is_file_upload"]
+                if messagejson.get("meeting_id"):
+                    try:
+                        websocket.meeting_id = check_meeting_id(messagejson["meeting_id"])
+                    except ValueError as e:
+                        await send_asr_error(websocket, str(e))
+                        break
+                if "wav_format" in messagejson or "audio_fs" in messagejson:
+                    audio_format = (
+                        messagejson.get("wav_format", websocket.audio_format[0]),
+                        messagejson.get("audio_fs", websocket.audio_format[1]),
+                    )
+                    if audio_format != websocket.audio_format:
+                        try:
+                            websocket.audio_decoder = make_transport_decoder(*audio_format)
+                        except (UnsupportedAudioFormat, ValueError) as e:
+                            await send_asr_error(websocket, f"unsupported audio format: {e}")
+                            break
+                        websocket.audio_format = audio_format
+                if websocket.is_file_upload and websocket.upload_id is None and args.upload_ttl_s > 0:
+                    # 带 upload_id 重连时恢复断线前的识别状态，否则开始新的上传会话
+                    restored = await resume_upload(websocket, messagejson.get("upload_id"))
+                    if restored is not None:
+                        speech_start, speech_end_i = restored
                 if "upload_complete" in messagejson:
                     # 文件上传完成，立即处理剩余的音频数据
-                    if websocket.is_file_upload and hasattr(websocket, 'audio_buffer'):
-                        remaining_data = websocket.audio_buffer.get_unprocessed_data()
-                        if remaining_data:
+                    if websocket.is_file_upload:
+                        ring = websocket.audio_ring
+                        if websocket.offline_offset is not None and ring.end > websocket.offline_offset:
                             # 处理剩余的音频数据进行最终识别
                             try:
-                                await async_asr(websocket, remaining_data)
+                                await async_asr(
+                                    websocket,
+                                    ring.read_float(websocket.offline_offset),
+                                    time.perf_counter(),
+                                    ring.clamp(websocket.offline_offset),
+                                )
                             except Exception as e:
                                 print(f"Error processing remaining audio: {str(e)}")
+                            websocket.offline_offset = None
+                        # 等待已提交的句子全部识别、发送完毕
+                        await websocket.offline_pipeline.join()
                         
-                        # 发送合并后的完整转录结果
-                        if hasattr(websocket, 'stream_results') and websocket.stream_results:
-                            final_text = merge_stream_results(websocket.stream_results)
-                            if final_text:
-                                try:
-                                    await send_final_result(websocket, final_text, "upload-complete")
-                                except Exception as e:
-                                    print(f"Error sending final result: {str(e)}")
+                        # 发送累积的完整转录结果
+                        if websocket.transcript:
+                            try:
+                                await send_final_result(websocket, websocket.transcript.text(), "upload-complete")
+                            except Exception as e:
+                                print(f"Error sending final result: {str(e)}")
                         
-                        # 清理缓冲区
-                        websocket.audio_buffer.clear()
-                        websocket.stream_results = []
+                        websocket.transcript = TranscriptAccumulator()
+                        websocket.upload_id = None
+                        websocket.meeting_id = None
 
             websocket.status_dict_vad["chunk_size"] = int(
                 websocket.status_dict_asr_online["chunk_size"][1] * 60 / websocket.chunk_interval
             )
-            if len(frames_asr_online) > 0 or len(frames_asr) >= 0 or not isinstance(message, str):
-                if not isinstance(message, str):
-                    frames.append(message)
-                    duration_ms = len(message) // 32
-                    websocket.vad_pre_idx += duration_ms
-                    
-                    # 将音频数据添加到缓冲区
-                    websocket.audio_buffer.add_chunk(message)
-                    
-                    # 检查缓冲区大小，如果过大则进行显存清理
-                    if websocket.audio_buffer.get_buffer_size() > 50 * 1024 * 1024:  # 50MB
-                        clear_gpu_memory()
+            ring = websocket.audio_ring
+            if not isinstance(message, str) and not websocket.models_ready:
+                # 收到第一段音频时模式已确定，检查该模式的模型是否就绪
+                websocket.models_ready = await wait_for_models(websocket)
+                if not websocket.models_ready:
+                    break
+            if not isinstance(message, str):
+                # 按握手声明的编码解码成 16kHz int16，直接写进会话缓冲区
+                frame_start, frame_end = websocket.audio_decoder.decode(message, ring)
+                # 解码器已收下整帧（没有输出的部分留在解码器里），续传偏移按收到的字节计
+                if websocket.upload_id is not None:
+                    websocket.upload_bytes += len(message)
+                if frame_end == frame_start:
+                    continue  # 不足一个编码单元或重采样输出不足一个点，与下一帧一起处理
+                audio_seconds_total.inc((frame_end - frame_start) / ring.sample_rate)
+                # VAD 时间轴按解码后的采样点计算，与传输编码无关
+                websocket.vad_pre_idx = (frame_end - websocket.vad_origin) * 1000 // ring.sample_rate
+
+                # 静音门：VAD 不在语音段内且本帧确定是静音时，跳过 VAD 和流式识别
+                skip = False
+                gate = websocket.silence_gate
+                if gate is not None:
+                    active = gate.process(ring.view(frame_start, frame_end))
+                    skip = not active and not speech_start and websocket.is_speaking
+                    gate.record(frame_end - frame_start, skip)
+                if skip:
+                    websocket.gate_closed = True
+                    websocket.online_offset = frame_end
+                    websocket.online_frames = 0
+                    speech_start_i = speech_end_i = -1
+                    if websocket.is_file_upload and websocket.offline_offset is None:
+                        websocket.offline_offset = frame_start
+                else:
+                    vad_input = ring.view(frame_start, frame_end).tobytes()
+                    if websocket.gate_closed:
+                        # 语音恢复：VAD 从预录起点重新开始计时，连同起点前的一段音频一起送入
+                        websocket.gate_closed = False
+                        resume = ring.clamp(frame_start - ring.ms_to_samples(args.gate_preroll_ms))
+                        websocket.status_dict_vad["cache"] = {}
+                        websocket.vad_origin = resume
+                        websocket.vad_pre_idx = (frame_end - resume) * 1000 // ring.sample_rate
+                        websocket.online_offset = resume
+                        vad_input = ring.view(resume, frame_end).tobytes()
 
                     # asr online - 流式识别处理
-                    frames_asr_online.append(message)
+                    websocket.online_frames += 1
                     websocket.status_dict_asr_online["is_final"] = speech_end_i != -1
-                    
+
                     # 流式处理：无论是否文件上传，都进行实时识别
                     if (
-                        len(frames_asr_online) % websocket.chunk_interval == 0
+                        websocket.online_frames % websocket.chunk_interval == 0
                         or websocket.status_dict_asr_online["is_final"]
                     ):
                         if websocket.mode == "2pass" or websocket.mode == "online":
-                            audio_in = b"".join(frames_asr_online)
+                            audio_in = ring.read_float(websocket.online_offset)
                             try:
                                 result = await async_asr_online(websocket, audio_in)
-                                # 存储流式识别结果
+                                # 流式结果并入当前段的实时假设
                                 if result and websocket.is_file_upload:
-                                    websocket.stream_results.append(result)
+                                    websocket.transcript.add_partial(result.get("text", "").strip())
                             except Exception as e:
                                 print(f"error in asr streaming: {str(e)}")
-                        frames_asr_online = []
-                    
-                    # 文件上传模式下，同时收集音频数据用于最终的离线识别
-                    if websocket.is_file_upload:
-                        frames_asr.append(message)
-                        # 标记音频数据已被处理用于离线识别
-                        websocket.audio_buffer.mark_processed(len(message))
+                        websocket.online_offset = ring.end
+                        websocket.online_frames = 0
+
+                    # 文件上传模式下，持续收集音频用于离线识别
+                    if websocket.is_file_upload and websocket.offline_offset is None:
+                        websocket.offline_offset = frame_start
                     # vad online - 文件上传模式下也启用VAD检测以实现更好的流式处理
-                    if speech_start:
-                        frames_asr.append(message)
                     try:
-                        speech_start_i, speech_end_i = await async_vad(websocket, message)
+                        speech_start_i, speech_end_i = await async_vad(websocket, vad_input)
                     except:
                         print("error in vad")
                     if speech_start_i != -1:
                         speech_start = True
-                        beg_bias = (websocket.vad_pre_idx - speech_start_i) // duration_ms
-                        frames_pre = frames[-beg_bias:]
-                        frames_asr = []
-                        frames_asr.extend(frames_pre)
-                # asr punc offline
-                if speech_end_i != -1 or not websocket.is_speaking:
-                    # print("vad end point")
-                    if websocket.mode == "2pass" or websocket.mode == "offline":
-                        audio_in = b"".join(frames_asr)
-                        try:
-                            await async_asr(websocket, audio_in)
-                        except Exception as e:
-                            print(f"error in asr offline: {str(e)}")
-                            import traceback
-                            traceback.print_exc()
-                    frames_asr = []
-                    speech_start = False
-                    frames_asr_online = []
-                    # 修复：只在用户完全停止说话时才清空在线识别缓存，避免文字跳动
-                    # websocket.status_dict_asr_online["cache"] = {}  # 注释掉这行，保持流式识别的连续性
-                    if not websocket.is_speaking:
-                        websocket.vad_pre_idx = 0
-                        frames = []
-                        websocket.status_dict_vad["cache"] = {}
-                        # 只在用户完全停止说话时才重置在线识别缓存
-                        websocket.status_dict_asr_online["cache"] = {}
-                    else:
-                        frames = frames[-20:]
+                        websocket.speech_started_at = time.perf_counter()
+                        # VAD 起点（毫秒）换算成会话采样点偏移
+                        websocket.offline_offset = ring.clamp(
+                            websocket.vad_origin + ring.ms_to_samples(speech_start_i)
+                        )
+            # asr punc offline
+            if speech_end_i != -1 or not websocket.is_speaking:
+                # print("vad end point")
+                if websocket.mode == "2pass" or websocket.mode == "offline":
+                    start = ring.end if websocket.offline_offset is None else ring.clamp(websocket.offline_offset)
+                    audio_in = ring.read_float(start)
+                    try:
+                        await async_asr(websocket, audio_in, time.perf_counter(), start)
+                    except Exception as e:
+                        print(f"error in asr offline: {str(e)}")
+                        import traceback
+                        traceback.print_exc()
+                websocket.offline_offset = None
+                speech_start = False
+                websocket.speech_started_at = None
+                websocket.online_offset = ring.end
+                websocket.online_frames = 0
+                # 修复：只在用户完全停止说话时才清空在线识别缓存，避免文字跳动
+                # websocket.status_dict_asr_online["cache"] = {}  # 注释掉这行，保持流式识别的连续性
+                if not websocket.is_speaking:
+                    websocket.vad_pre_idx = 0
+                    websocket.vad_origin = ring.end
+                    websocket.status_dict_vad["cache"] = {}
+                    # 只在用户完全停止说话时才重置在线识别缓存
+                    websocket.status_dict_asr_online["cache"] = {}
+            # 每收到 --upload_ack_ms 音频（按解码后的采样点计）确认一次已处理的字节位置
+            if websocket.upload_id is not None and ring.end - websocket.upload_acked >= ring.ms_to_samples(args.upload_ack_ms):
+                send_upload_ack(websocket)
+            trim_audio_ring(websocket)
 
+        # 客户端正常关闭时 async for 直接结束、不抛出 ConnectionClosed，同样要释放会话资源
+        print("Connection finished...", flush=True)
+        if not park_upload(websocket, speech_start, speech_end_i):
+            websocket.audio_ring.clear()
+        await ws_reset(websocket)
     except websockets.ConnectionClosed:
         print("ConnectionClosed...", websocket_users, flush=True)
+        if park_upload(websocket, speech_start, speech_end_i):
+            # 上传未完成：状态保留到 --upload_ttl_s，客户端可带 upload_id 续传
+            await ws_reset(websocket)
+            return
         
-        # 在连接断开前，发送合并后的完整转录结果
-        if hasattr(websocket, 'stream_results') and websocket.stream_results:
-            final_text = merge_stream_results(websocket.stream_results)
-            if final_text:
-                try:
-                    await send_final_result(websocket, final_text, "stream-final")
-                except:
-                    print("Failed to send final stream result before disconnect")
+        # 在连接断开前，发送累积的完整转录结果
+        if hasattr(websocket, 'transcript') and websocket.transcript:
+            try:
+                await send_final_result(websocket, websocket.transcript.text(), "stream-final")
+            except:
+                print("Failed to send final stream result before disconnect")
         
         # 清理资源
-        if hasattr(websocket, 'audio_buffer'):
-            websocket.audio_buffer.clear()
+        if hasattr(websocket, 'audio_ring'):
+            websocket.audio_ring.clear()
         
         await ws_reset(websocket)
-        websocket_users.remove(websocket)
     except websockets.InvalidState:
         print("InvalidState...")
         
         # 清理资源
-        if hasattr(websocket, 'audio_buffer'):
-            websocket.audio_buffer.clear()
+        if hasattr(websocket, 'audio_ring'):
+            websocket.audio_ring.clear()
+        if hasattr(websocket, 'offline_pipeline'):
+            websocket.offline_pipeline.close()
             
     except Exception as e:
         print("Exception:", e)
         
         # 清理资源
-        if hasattr(websocket, 'audio_buffer'):
-            websocket.audio_buffer.clear()
+        if hasattr(websocket, 'audio_ring'):
+            websocket.audio_ring.clear()
+        if hasattr(websocket, 'offline_pipeline'):
+            websocket.offline_pipeline.close()
+    finally:
+        websocket.outbound.abort()
+        websocket_users.discard(websocket)
 
 
 async def async_vad(websocket, audio_in):
     try:
-        segments_result = model_vad.generate(input=audio_in, **websocket.status_dict_vad)[0]["value"]
+        with stage_timer(websocket, vad_latency):
+            segments_result = (await executor.generate("vad", input=audio_in, **websocket.status_dict_vad))[0]["value"]
         # print(segments_result)
 
         speech_start = -1
@@ -505,156 +998,200 @@ async def async_vad(websocket, audio_in):
         return -1, -1
 
 
-def split_audio_chunks(audio_data, chunk_size_mb=10):
+def create_offline_pipeline(websocket):
     """
-    将音频数据分割成小块以避免显存溢出
+    离线识别流水线：解码 -> 标点 -> 发送
+
+    每个会话一条，阶段之间是有界队列，第 N+1 句解码时第 N 句可以同时加标点、发送；
+    标点 cache 仍按会话、按顺序使用。
     """
-    chunk_size_bytes = chunk_size_mb * 1024 * 1024  # 转换为字节
-    chunks = []
-    
-    if len(audio_data) <= chunk_size_bytes:
-        return [audio_data]
-    
-    # 计算每个chunk的样本数（假设16位音频，16kHz采样率）
-    bytes_per_sample = 2  # 16位 = 2字节
-    samples_per_chunk = chunk_size_bytes // bytes_per_sample
-    
-    # 确保chunk边界对齐到样本
-    samples_per_chunk = (samples_per_chunk // 2) * 2  # 确保偶数个字节
-    
-    for i in range(0, len(audio_data), samples_per_chunk * bytes_per_sample):
-        chunk = audio_data[i:i + samples_per_chunk * bytes_per_sample]
-        if len(chunk) > 0:
-            chunks.append(chunk)
-    
-    return chunks
-
-async def async_asr(websocket, audio_in):
+    return StagePipeline(
+        [
+            ("offline_decode", lambda item: offline_decode(websocket, *item)),
+            ("offline_punc", lambda rec_result: offline_punc(websocket, rec_result)),
+            ("offline_emit", lambda rec_result: offline_emit(websocket, rec_result)),
+        ],
+        maxsize=args.offline_pipeline_depth,
+    )
+
+
+async def async_asr(websocket, audio_in, speech_end_at=None, start=None):
+    """
+    提交一句音频做离线识别，流水线队列满时等待；speech_end_at 为语音结束时刻，用于统计最终结果延迟，
+    start 为这句音频在会话中的采样点偏移，写入转录库时换算成时间
+
+    同时结束转录的当前段，离线结果发送时替换该段的流式结果。
+    """
+    segment = websocket.transcript.end_segment()
+    await websocket.offline_pipeline.submit((audio_in, speech_end_at, segment, start))
+
+
+async def send_asr_error(websocket, text):
     try:
-        if len(audio_in) > 0:
-            print(f"Processing audio data: {len(audio_in)} bytes")
-            
-            # 检查显存是否足够
-            if not check_memory_before_processing(len(audio_in)):
-                error_msg = "Insufficient GPU memory for processing this audio file"
-                print(error_msg)
-                error_message = json.dumps({
-                    "mode": "error",
-                    "text": error_msg,
-                    "wav_name": websocket.wav_name,
-                    "is_final": True
-                })
-                await websocket.send(error_message)
-                return
-            
-            # 检查音频大小，如果超过阈值则分块处理
-            max_chunk_size_mb = 8  # 8MB per chunk to be safe
-            if len(audio_in) > max_chunk_size_mb * 1024 * 1024:
-                print(f"Large audio detected, splitting into chunks...")
-                chunks = split_audio_chunks(audio_in, max_chunk_size_mb)
-                print(f"Split into {len(chunks)} chunks")
-                
-                # 处理每个chunk并合并结果
-                combined_text = ""
-                for i, chunk in enumerate(chunks):
-                    print(f"Processing chunk {i+1}/{len(chunks)}, size: {len(chunk)} bytes")
-                    
-                    # 清理GPU缓存
-                    import torch
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-                    
-                    try:
-                         # 优化推理参数以减少显存占用
-                         optimized_params = websocket.status_dict_asr.copy()
-                         optimized_params.update({
-                             'batch_size': 1,  # 使用最小batch size
-                             'cache_size': 1,  # 减少缓存大小
-                         })
-                         
-                         chunk_result = model_asr.generate(input=chunk, **optimized_params)[0]
-                         if len(chunk_result["text"]) > 0:
-                             combined_text += chunk_result["text"] + " "
-                         print(f"Chunk {i+1} result: {chunk_result['text']}")
-                    except Exception as chunk_e:
-                        print(f"Error processing chunk {i+1}: {str(chunk_e)}")
-                        # 继续处理下一个chunk
-                        continue
-                
-                # 创建合并后的结果
-                rec_result = {"text": combined_text.strip()}
-                print(f"Combined ASR result: {rec_result}")
-            else:
-                 # 小文件直接处理，但仍使用优化参数
-                 optimized_params = websocket.status_dict_asr.copy()
-                 optimized_params.update({
-                     'batch_size': 1,  # 使用最小batch size
-                     'cache_size': 1,  # 减少缓存大小
-                 })
-                 
-                 rec_result = model_asr.generate(input=audio_in, **optimized_params)[0]
-                 print(f"ASR result: {rec_result}")
-            
-            # 处理完成后清理显存
-            clear_gpu_memory()
-            # print("offline_asr, ", rec_result)
-            if model_punc is not None and len(rec_result["text"]) > 0:
-                print("Applying punctuation model")
-                # print("offline, before punc", rec_result, "cache", websocket.status_dict_punc)
-                rec_result = model_punc.generate(
-                    input=rec_result["text"], **websocket.status_dict_punc
-                )[0]
-                print(f"Punctuation result: {rec_result}")
-                # print("offline, after punc", rec_result)
-            if len(rec_result["text"]) > 0:
-                # print("offline", rec_result)
-                mode = "2pass-offline" if "2pass" in websocket.mode else websocket.mode
-                message = json.dumps(
-                    {
-                        "mode": mode,
-                        "text": rec_result["text"],
-                        "wav_name": websocket.wav_name,
-                        "is_final": False,  # 在线流式识别始终为临时结果，让客户端处理累积逻辑
-                    }
-                )
-                print(f"Sending message: {message}")
-                await websocket.send(message)
-            else:
-                print("Empty recognition result")
-        else:
-            print("Empty audio input, sending empty result")
-            mode = "2pass-offline" if "2pass" in websocket.mode else websocket.mode
-            message = json.dumps(
-                {
-                    "mode": mode,
-                    "text": "",
-                    "wav_name": websocket.wav_name,
-                    "is_final": False,  # 在线流式识别始终为临时结果，让客户端处理累积逻辑
-                }
-            )
-            await websocket.send(message)
+        websocket.outbound.send({
+            "mode": "error",
+            "text": text,
+            "wav_name": websocket.wav_name,
+            "is_final": True
+        })
+    except:
+        print("Failed to send error message to client")
+
+
+async def offline_decode(websocket, audio_in, speech_end_at=None, segment=None, start=None):
+    if len(audio_in) == 0:
+        print("Empty audio input, sending empty result")
+        return {"text": "", "empty_input": True, "speech_end_at": speech_end_at, "segment": segment}
+    speaker = None
+    try:
+        audio_size_bytes = len(audio_in) * 2  # 按16位PCM折算
+        print(f"Processing audio data: {audio_size_bytes} bytes")
+        
+        optimized_params = websocket.status_dict_asr.copy()
+        optimized_params.update({
+            'cache_size': 1,  # 减少缓存大小
+        })
+        # 检查音频大小，如果超过阈值则分块处理
+        max_chunk_size_mb = 8  # 8MB per chunk to be safe
+        # 说话人向量与解码同时计算，本句结束前完成，聚类按句子顺序更新
+        speaker = asyncio.ensure_future(attribute_speaker(websocket, audio_in))
+        # 按估算的内存开销排队，放行后才进入解码；只在内存紧张时清理缓存
+        with stage_timer(websocket, offline_latency):
+            async with admission.admit(len(audio_in) / 16000):
+                if audio_size_bytes > max_chunk_size_mb * 1024 * 1024:
+                    # 按 VAD 语音段切分、打包成批次并行解码，避免在词中间切开
+                    print(f"Large audio detected, decoding by VAD segments...")
+                    rec_result = await transcribe_long_audio(
+                        executor, audio_in, optimized_params, max_batch_s=args.long_audio_batch_s
+                    )
+                    print(f"Combined ASR result: {rec_result['text']}")
+                else:
+                    # 小音频进入跨会话批处理队列，batch_size 由批次大小决定
+                    rec_result = (await offline_batcher.submit((audio_in, optimized_params)))[0]
+                    print(f"ASR result: {rec_result}")
+        rec_result["speech_end_at"] = speech_end_at
+        rec_result["segment"] = segment
+        rec_result["span"] = None if start is None else (start, start + len(audio_in))
+        rec_result["speaker"] = await speaker
+        return rec_result
     except Exception as e:
+        if speaker is not None:
+            speaker.cancel()
         print(f"Exception in async_asr: {str(e)}")
         import traceback
         traceback.print_exc()
         # 发送错误消息给客户端
-        try:
-            error_message = json.dumps({
-                "mode": "error",
-                "text": f"ASR处理错误: {str(e)}",
-                "wav_name": websocket.wav_name,
-                "is_final": True
-            })
-            await websocket.send(error_message)
-        except:
-            print("Failed to send error message to client")    
+        await send_asr_error(websocket, f"ASR处理错误: {str(e)}")
+        return None
+
+
+async def attribute_speaker(websocket, audio_in):
+    """
+    给一句话标注说话人，返回如 "说话人0"；未启用、模型未就绪或失败时返回 None
+
+    句子的说话人向量并入会话的在线聚类：与已有说话人质心的余弦相似度达到
+    --spk_threshold 时归入该说话人，否则新建说话人。短于 --spk_min_ms 的句子
+    向量不可靠，只匹配最相似的已有说话人，不更新质心。
+    配置了 --speaker_index_dir 时，尚未认出的说话人用其质心检索登记库，
+    相似度达到 --speaker_id_threshold 就标注为登记的名字。
+    """
+    if websocket.speakers is None or not executor.has_stage("spk"):
+        return None
+    try:
+        with stage_timer(websocket, spk_latency):
+            result = await executor.generate("spk", input=audio_in[:SPEAKER_PROBE_SAMPLES])
+        embedding = result[0]["spk_embedding"]
+    except Exception as e:
+        print(f"Speaker embedding failed: {e}")
+        return None
+    speakers = websocket.speakers
+    if len(audio_in) < args.spk_min_ms * 16 and len(speakers):
+        label = speakers.nearest(embedding)[0]
+    else:
+        label = speakers.assign([embedding], weights=[len(audio_in) / 16000])[0]
+    names = websocket.speaker_names
+    if label not in names and speaker_index is not None and len(speaker_index):
+        match = speaker_index.identify(speakers.centroids()[label], threshold=args.speaker_id_threshold)
+        if match is not None:
+            names[label] = match["name"]
+    return names.get(label) or f"说话人{label}"
+
+
+async def offline_punc(websocket, rec_result):
+    # print("offline_asr, ", rec_result)
+    if not punc_enabled or len(rec_result["text"]) == 0:
+        return rec_result
+    print("Applying punctuation model")
+    try:
+        # print("offline, before punc", rec_result, "cache", websocket.status_dict_punc)
+        with stage_timer(websocket, punc_latency):
+            punc_result = (await punc_batcher.submit((rec_result["text"], websocket.status_dict_punc)))[0]
+    except Exception as e:
+        print(f"Exception in punctuation: {str(e)}")
+        await send_asr_error(websocket, f"ASR处理错误: {str(e)}")
+        return None
+    print(f"Punctuation result: {punc_result}")
+    # 长音频按语音段解码时附带各段时间戳，标点处理后保留
+    if rec_result.get("segments"):
+        punc_result["segments"] = rec_result["segments"]
+    punc_result["speech_end_at"] = rec_result.get("speech_end_at")
+    punc_result["segment"] = rec_result.get("segment")
+    punc_result["speaker"] = rec_result.get("speaker")
+    punc_result["span"] = rec_result.get("span")
+    return punc_result
+
+
+async def offline_emit(websocket, rec_result):
+    mode = "2pass-offline" if "2pass" in websocket.mode else websocket.mode
+    if len(rec_result["text"]) == 0 and not rec_result.get("empty_input"):
+        print("Empty recognition result")
+        return None
+    # print("offline", rec_result)
+    result_message = {
+        "mode": mode,
+        "text": rec_result["text"],
+        "wav_name": websocket.wav_name,
+        "is_final": False,  # 在线流式识别始终为临时结果，让客户端处理累积逻辑
+    }
+    if rec_result.get("segments"):
+        result_message["segments"] = rec_result["segments"]
+    if rec_result.get("speaker") is not None:
+        result_message["speaker"] = rec_result["speaker"]
+    if transcript_store is not None and rec_result["text"] and rec_result.get("span") is not None:
+        record_transcript(websocket, rec_result)
+        result_message["meeting_id"] = websocket.meeting_id
+    print(f"Sending message: {result_message}")
+    if websocket.is_file_upload and rec_result["text"] and rec_result.get("segment") is not None:
+        websocket.transcript.commit(rec_result["segment"], rec_result["text"])
+    speech_end_at = rec_result.get("speech_end_at")
+    websocket.outbound.send(
+        result_message,
+        on_sent=None if speech_end_at is None else lambda: final_latency.observe(time.perf_counter() - speech_end_at),
+    )
+    return None
+
+
+def record_transcript(websocket, rec_result):
+    """离线结果写入转录库，时间为这句话在会话音频中的位置（秒）"""
+    if websocket.meeting_id is None:
+        websocket.meeting_id = uuid.uuid4().hex
+    start, end = rec_result["span"]
+    try:
+        transcript_store.append(
+            websocket.meeting_id,
+            [{"speaker": rec_result.get("speaker"), "start_time": start / 16000, "end_time": end / 16000, "text": rec_result["text"]}],
+            title=websocket.wav_name,
+            source="websocket",
+        )
+    except OSError as e:
+        print(f"Failed to store transcript: {e}")
+
 
 async def async_asr_online(websocket, audio_in):
     if len(audio_in) > 0:
         # print(websocket.status_dict_asr_online.get("is_final", False))
-        rec_result = model_asr_streaming.generate(
-            input=audio_in, **websocket.status_dict_asr_online
-        )[0]
+        with stage_timer(websocket, online_latency):
+            rec_result = (await online_batcher.submit((audio_in, websocket.status_dict_asr_online)))[0]
         # print("online, ", rec_result)
         if websocket.mode == "2pass" and websocket.status_dict_asr_online.get("is_final", False):
             return rec_result
@@ -673,34 +1210,83 @@ async def async_asr_online(websocket, audio_in):
                 websocket.sent_text_length = len(full_text)
                 
                 mode = "2pass-online" if "2pass" in websocket.mode else websocket.mode
-                message = json.dumps(
+                on_sent = None
+                if websocket.speech_started_at is not None:
+                    speech_started_at = websocket.speech_started_at
+                    on_sent = lambda: first_partial_latency.observe(time.perf_counter() - speech_started_at)
+                    websocket.speech_started_at = None
+                # 入队即返回；发送协程落后时，未发出的增量与本条合并
+                websocket.outbound.send_partial(
                     {
                         "mode": mode,
                         "text": new_text,
                         "wav_name": websocket.wav_name,
                         "is_final": False,  # 在线流式识别始终为临时结果，让客户端处理累积逻辑
-                    }
+                    },
+                    on_sent=on_sent,
                 )
-                await websocket.send(message)
                 
         return rec_result  # 返回识别结果
     return None
 
 
-if len(args.certfile) > 0:
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-
-    # Generate with Lets Encrypt, copied to this location, chown to current user and 400 permissions
-    ssl_cert = args.certfile
-    ssl_key = args.keyfile
+async def search_transcripts(params):
+    """
+    指标端口的 /transcripts/search?q=...&limit=&meeting_id=&speaker=&since=&until=
 
-    ssl_context.load_cert_chain(ssl_cert, keyfile=ssl_key)
-    start_server = websockets.serve(
-        ws_serve, args.host, args.port, subprotocols=["binary"], ping_interval=None, ssl=ssl_context
-    )
-else:
-    start_server = websockets.serve(
-        ws_serve, args.host, args.port, subprotocols=["binary"], ping_interval=None
+    检索要读日志核对候选段，在检索线程中执行，不阻塞会话所在的事件循环；
+    limit 截断到 MAX_SEARCH_LIMIT。
+    """
+    search = functools.partial(
+        transcript_store.search,
+        params.get("q", ""),
+        limit=min(max(int(params.get("limit", 20)), 1), MAX_SEARCH_LIMIT),
+        meeting_id=params.get("meeting_id"),
+        speaker=params.get("speaker"),
+        since=float(params["since"]) if "since" in params else None,
+        until=float(params["until"]) if "until" in params else None,
     )
-asyncio.get_event_loop().run_until_complete(start_server)
-asyncio.get_event_loop().run_forever()
+    result = await asyncio.get_running_loop().run_in_executor(search_pool, search)
+    return "application/json", json.dumps(result, ensure_ascii=False)
+
+
+async def start_servers():
+    """监听 websocket 端口，配置了 --metrics_port 时同时开启指标端口"""
+    if len(args.certfile) > 0:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+
+        # Generate with Lets Encrypt, copied to this location, chown to current user and 400 permissions
+        ssl_cert = args.certfile
+        ssl_key = args.keyfile
+
+        ssl_context.load_cert_chain(ssl_cert, keyfile=ssl_key)
+        await websockets.serve(
+            ws_serve, args.host, args.port, subprotocols=["binary"], ping_interval=None, ssl=ssl_context
+        )
+    else:
+        await websockets.serve(
+            ws_serve, args.host, args.port, subprotocols=["binary"], ping_interval=None
+        )
+    print(f"listening on {args.host}:{args.port}, models {model_loader.state}", flush=True)
+    if args.metrics_port:
+        await start_http_server(
+            args.metrics_host,
+            args.metrics_port,
+            {
+                "/metrics": metrics_registry.http_handler,
+                "/models": lambda: ("application/json", json.dumps(model_loader.report(), ensure_ascii=False)),
+                "/sessions": lambda: ("application/json", json.dumps(session_stats())),
+            },
+            query_routes={"/transcripts/search": search_transcripts} if transcript_store is not None else None,
+        )
+        print(f"metrics on http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    loading = loop.create_task(load_models())
+    if not args.early_bind:
+        # 模型加载完成后才监听端口（supervisor 以端口可连接判断 worker 就绪）
+        loop.run_until_complete(loading)
+    loop.run_until_complete(start_servers())
+    loop.run_forever()
@@ -0,0 +1,106 @@
+"""
+推理执行器：把模型推理从事件循环中移到有界线程池中执行
+"""
+import asyncio
+import concurrent.futures
+import functools
+import time
+
+
+class InferenceExecutor:
+    """
+    有界推理线程池，按阶段（vad/online/offline/punc）限制并发
+
+    FunASR 的 AutoModel.generate 会把每次调用的参数（包括 cache）写进实例共享的
+    kwargs，同一个模型实例不能被多个线程同时调用。因此每个阶段注册一组模型副本，
+    阶段的并发上限就是副本数量；线程池大小限制所有阶段的总并发。
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._replicas = {}
+        self._queues = {}
+        self.stats = {}
+
+    def register_stage(self, stage, models):
+        """注册阶段及其模型副本列表"""
+        models = [m for m in models if m is not None]
+        if not models:
+            return
+        self._replicas[stage] = models
+        self.stats[stage] = {"waiting": 0, "running": 0, "completed": 0, "failed": 0, "busy_time": 0.0}
+
+    def has_stage(self, stage):
+        return stage in self._replicas
+
+    def concurrency(self, stage):
+        """阶段并发上限（模型副本数）"""
+        return len(self._replicas.get(stage, []))
+
+    def _queue(self, stage):
+        # 队列需要在事件循环内创建
+        queue = self._queues.get(stage)
+        if queue is None:
+            queue = asyncio.Queue()
+            for model in self._replicas[stage]:
+                queue.put_nowait(model)
+            self._queues[stage] = queue
+        return queue
+
+    async def run(self, stage, func, *args, **kwargs):
+        """
+        在线程池中执行 func(model, *args, **kwargs)，model 为该阶段的一个空闲副本
+        """
+        if stage not in self._replicas:
+            raise KeyError(f"inference stage not registered: {stage}")
+        stats = self.stats[stage]
+        queue = self._queue(stage)
+        stats["waiting"] += 1
+        try:
+            model = await queue.get()
+        finally:
+            stats["waiting"] -= 1
+        stats["running"] += 1
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        def release(future):
+            # 线程中的调用真正结束后才归还副本：调用方被取消时模型可能仍在运行
+            stats["running"] -= 1
+            stats["busy_time"] += time.perf_counter() - start
+            if future.cancelled() or future.exception() is not None:
+                stats["failed"] += 1
+            else:
+                stats["completed"] += 1
+            queue.put_nowait(model)
+
+        def on_done(future):
+            try:
+                loop.call_soon_threadsafe(release, future)
+            except RuntimeError:
+                # 事件循环已关闭，不再有调用方等待副本
+                pass
+
+        try:
+            future = self._pool.submit(functools.partial(func, model, *args, **kwargs))
+        except Exception:
+            stats["running"] -= 1
+            stats["failed"] += 1
+            queue.put_nowait(model)
+            raise
+        future.add_done_callback(on_done)
+        # shield：取消调用方只是不再等待结果，不会提前归还副本
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def generate(self, stage, **kwargs):
+        """等价于 model.generate(**kwargs)，在线程池中执行"""
+        return await self.run(stage, _generate, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+def _generate(model, **kwargs):
+    return model.generate(**kwargs)
@@ -0,0 +1,214 @@
+"""
+长音频识别任务队列：提交即返回任务 id，由有界的 worker 按优先级/先后顺序处理
+"""
+import asyncio
+import itertools
+import time
+import uuid
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, payload, priority=0, audio_seconds=None, filename=""):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.priority = priority
+        self.audio_seconds = audio_seconds
+        self.filename = filename
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.estimated_rtf = None
+        self.processed_seconds = None  # 分段识别时由识别协程更新的实际进度
+        self.meeting_id = None  # 结果写入转录库时所属的会议
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.state in (SUCCEEDED, FAILED, CANCELLED)
+
+    def progress_seconds(self):
+        """
+        已处理的音频秒数
+
+        分段识别的任务直接返回已识别到的位置；模型一次处理整个文件时不回报中间进度，
+        运行中的值按最近任务的实时率估算，完成前不会超过音频总时长。
+        """
+        if self.state == SUCCEEDED:
+            return self.audio_seconds
+        if self.state == RUNNING and self.processed_seconds is not None:
+            return self.processed_seconds
+        if self.state != RUNNING or not self.audio_seconds or not self.estimated_rtf:
+            return 0.0
+        elapsed = time.time() - self.started_at
+        return min(elapsed / self.estimated_rtf, self.audio_seconds * 0.99)
+
+    async def wait(self):
+        await self._done.wait()
+
+    def to_dict(self, position=None):
+        info = {
+            "job_id": self.id,
+            "state": self.state,
+            "priority": self.priority,
+            "filename": self.filename,
+            "audio_seconds": self.audio_seconds,
+            "progress_seconds": self.progress_seconds(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if position is not None:
+            info["queue_position"] = position
+        if self.state == SUCCEEDED:
+            info["result"] = self.result
+        if self.error:
+            info["error"] = self.error
+        if self.meeting_id:
+            info["meeting_id"] = self.meeting_id
+        return info
+
+
+class JobManager:
+    """
+    任务管理器
+
+    run_job(job) 是执行一个任务的协程，返回值保存为 job.result。
+    优先级数值越大越先执行，同优先级先进先出。排队中的任务可直接取消；运行中的任务
+    无法打断模型调用，取消后丢弃结果。on_finish(job) 在任务结束（含取消）后调用，
+    用于释放上传数据。
+    """
+    def __init__(self, run_job, num_workers=1, max_queue=100, result_ttl=3600, on_finish=None):
+        self.run_job = run_job
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.on_finish = on_finish
+        self.jobs = {}
+        self._queue = None
+        self._queued = 0
+        self._seq = itertools.count()
+        self._workers = []
+        self._rtf = None  # 最近完成任务的实时率（处理耗时/音频时长）
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.num_workers)]
+
+    def submit(self, payload, priority=0, audio_seconds=None, filename=""):
+        self._ensure_started()
+        self._purge()
+        if self._queued >= self.max_queue:
+            raise JobQueueFull(f"job queue is full ({self.max_queue})")
+        job = Job(payload, priority=priority, audio_seconds=audio_seconds, filename=filename)
+        self.jobs[job.id] = job
+        self._queued += 1
+        self._queue.put_nowait((-priority, next(self._seq), job))
+        return job
+
+    def add_completed(self, result, audio_seconds=None, filename=""):
+        """登记一个无需排队、已有结果的任务（例如命中结果缓存）"""
+        self._purge()
+        job = Job(None, audio_seconds=audio_seconds, filename=filename)
+        job.state = SUCCEEDED
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        job._done.set()
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def position(self, job):
+        """排队任务前面还有多少个任务"""
+        if job.state != QUEUED:
+            return None
+        key = (-job.priority, job.created_at)
+        return sum(
+            1 for other in self.jobs.values()
+            if other.state == QUEUED and other is not job and (-other.priority, other.created_at) < key
+        )
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested = True
+        if job.state == QUEUED:
+            self._queued -= 1
+            self._finish(job, CANCELLED)
+        return job
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state = state
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        try:
+            if self.on_finish is not None:
+                self.on_finish(job)
+        finally:
+            job.payload = None
+            job._done.set()
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.state != QUEUED:
+                # 排队时已取消
+                continue
+            self._queued -= 1
+            job.state = RUNNING
+            job.started_at = time.time()
+            job.estimated_rtf = self._rtf
+            try:
+                result = await self.run_job(job)
+            except Exception as e:
+                self._finish(job, CANCELLED if job.cancel_requested else FAILED, error=str(e))
+                continue
+            elapsed = time.time() - job.started_at
+            if job.audio_seconds:
+                rtf = elapsed / job.audio_seconds
+                self._rtf = rtf if self._rtf is None else 0.7 * self._rtf + 0.3 * rtf
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+            else:
+                self._finish(job, SUCCEEDED, result=result)
+
+    def _purge(self):
+        """清理超过保留时间的已完成任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self):
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self._queued,
+            "max_queue": self.max_queue,
+            "jobs": states,
+            "estimated_rtf": self._rtf,
+        }
@@ -0,0 +1,82 @@
+"""
+长音频识别：先用 VAD 找出语音段，按时长打包成批次并行解码，再按时间顺序合并
+"""
+import asyncio
+
+from batching import generate_batched
+
+
+SAMPLES_PER_MS = 16
+
+
+def vad_segment_kwargs():
+    """
+    整段音频一次性做 VAD 时的参数
+
+    AutoModel 会把每次调用的参数写进实例共享的 kwargs，流式会话留下的 is_final、
+    chunk_size、cache 会被后续调用继承，所以这里显式给出离线 VAD 需要的值。
+    """
+    return {"cache": {}, "is_final": True, "chunk_size": 60000}
+
+
+def pack_segments(segments, max_batch_s=60.0, max_batch_size=32):
+    """
+    把语音段打包成批次，每批总时长不超过 max_batch_s 秒
+
+    先按时长排序，让同一批里的段长度接近以减少 padding；
+    单个超过预算的段独立成批。返回 [[(index, beg_ms, end_ms), ...], ...]。
+    """
+    budget_ms = max_batch_s * 1000
+    order = sorted(range(len(segments)), key=lambda i: segments[i][1] - segments[i][0])
+    batches = []
+    batch = []
+    batch_ms = 0
+    for i in order:
+        beg, end = segments[i]
+        length = end - beg
+        if batch and (batch_ms + length > budget_ms or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+            batch_ms = 0
+        batch.append((i, beg, end))
+        batch_ms += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def transcribe_long_audio(executor, audio, decode_kwargs, max_batch_s=60.0):
+    """
+    识别长音频（16kHz float32 数组）
+
+    返回 {"text": 合并文本, "segments": [{"start": ms, "end": ms, "text": ...}, ...]}。
+    语音段在 VAD 给出的静音处切开，不会把词切成两半；各批次交给执行器的 offline
+    阶段，并发度由 offline 模型副本数决定。
+    """
+    vad_result = await executor.generate("vad", input=audio, **vad_segment_kwargs())
+    segments = [seg for seg in vad_result[0]["value"] if seg[1] > seg[0]]
+    if not segments:
+        return {"text": "", "segments": []}
+
+    batches = pack_segments(segments, max_batch_s=max_batch_s)
+    print(f"Long audio: {len(segments)} speech segments packed into {len(batches)} batches")
+
+    async def decode(batch):
+        items = [
+            (audio[beg * SAMPLES_PER_MS:end * SAMPLES_PER_MS], decode_kwargs) for _, beg, end in batch
+        ]
+        return batch, await executor.run("offline", generate_batched, items)
+
+    texts = [""] * len(segments)
+    for batch, results in await asyncio.gather(*[decode(batch) for batch in batches]):
+        for (index, _, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                print(f"Error decoding segment {segments[index]}: {result}")
+                continue
+            texts[index] = result[0]["text"]
+
+    merged = []
+    for (beg, end), text in zip(segments, texts):
+        if text:
+            merged.append({"start": beg, "end": end, "text": text})
+    return {"text": " ".join(seg["text"] for seg in merged), "segments": merged}
@@ -0,0 +1,172 @@
+"""
+模型加载：互不依赖的模型并行加载，每个副本加载后做一次预热推理，
+加载好的阶段立即注册到推理执行器，并记录每个模型的加载耗时
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# 各识别模式用到的推理阶段
+MODE_STAGES = {
+    "online": ("vad", "online"),
+    "offline": ("vad", "offline", "punc"),
+    "2pass": ("vad", "online", "offline", "punc"),
+}
+
+
+def warmup_audio(seconds=1.0, sample_rate=16000):
+    """预热用的音频：固定随机种子的低电平噪声叠加正弦，避免全零输入走捷径"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.1 * np.sin(2 * np.pi * 220 * t) + noise).astype(np.float32)
+
+
+def warmup_vad(model):
+    model.generate(input=warmup_audio(), cache={}, is_final=True, chunk_size=60000)
+
+
+def warmup_online(model):
+    model.generate(input=warmup_audio(0.6), cache={}, is_final=True, chunk_size=[0, 10, 5])
+
+
+def warmup_offline(model):
+    model.generate(input=warmup_audio())
+
+
+def warmup_punc(model):
+    model.generate(input="欢迎使用语音识别服务", cache={})
+
+
+def warmup_spk(model):
+    model.generate(input=warmup_audio())
+
+
+WARMUPS = {
+    "vad": warmup_vad,
+    "online": warmup_online,
+    "offline": warmup_offline,
+    "punc": warmup_punc,
+    "spk": warmup_spk,
+}
+
+
+class ModelLoader:
+    """
+    按阶段加载模型
+
+    build(model_path, model_revision, replica) 在加载线程池中执行，max_parallel 控制同时
+    加载的模型数。一个阶段的全部副本加载、预热完成后才注册到 executor，
+    之前该阶段不可用；加载失败的阶段记录错误，已加载的副本交给 release 释放，
+    不影响其他阶段。add 可以为单个阶段指定自己的 build 和预热函数。
+    """
+    def __init__(self, executor, build, max_parallel=4, warmup=True, release=None):
+        self.executor = executor
+        self.build = build
+        self.release = release
+        self.max_parallel = max_parallel
+        self.warmup = warmup
+        self.specs = {}
+        self.failed = {}
+        self.timings = []
+        self.started_at = None
+        self.finished_at = None
+        self._events = {}
+
+    def add(self, stage, model_path, model_revision, instances=1, build=None, warmup=None):
+        self.specs[stage] = (model_path, model_revision, max(instances, 1), build or self.build, warmup or WARMUPS.get(stage))
+        self._events[stage] = asyncio.Event()
+
+    @property
+    def stages(self):
+        return list(self.specs)
+
+    async def load(self):
+        self.started_at = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="model-load")
+        try:
+            await asyncio.gather(*[self._load_stage(pool, stage) for stage in self.specs])
+        finally:
+            pool.shutdown(wait=False)
+            self.finished_at = time.perf_counter()
+        return self.report()
+
+    async def _load_stage(self, pool, stage):
+        loop = asyncio.get_running_loop()
+        model_path, model_revision, instances, build, warmup = self.specs[stage]
+
+        async def load_replica(replica):
+            start = time.perf_counter()
+            model = await loop.run_in_executor(pool, build, model_path, model_revision, replica)
+            loaded = time.perf_counter()
+            if self.warmup and warmup is not None:
+                await loop.run_in_executor(pool, warmup, model)
+            self.timings.append({
+                "stage": stage,
+                "replica": replica,
+                "model": model_path,
+                "load_s": loaded - start,
+                "warmup_s": time.perf_counter() - loaded,
+            })
+            return model
+
+        try:
+            results = await asyncio.gather(*[load_replica(i) for i in range(instances)], return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                if self.release is not None:
+                    for model in results:
+                        if not isinstance(model, BaseException):
+                            self.release(model)
+                self.failed[stage] = str(errors[0])
+                print(f"failed to load {stage} model {model_path}: {errors[0]}", flush=True)
+            else:
+                self.executor.register_stage(stage, results)
+                print(f"{stage} models ready ({instances} replicas)", flush=True)
+        finally:
+            self._events[stage].set()
+
+    def is_ready(self, stages):
+        return all(self.executor.has_stage(stage) for stage in stages)
+
+    async def wait(self, stages, timeout=None):
+        """等待指定阶段加载结束，返回这些阶段是否全部可用"""
+        events = [self._events[stage].wait() for stage in stages if stage in self._events]
+        try:
+            await asyncio.wait_for(asyncio.gather(*events), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.is_ready(stages)
+
+    @property
+    def state(self):
+        if self.started_at is None:
+            return "pending"
+        if not all(event.is_set() for event in self._events.values()):
+            return "loading"
+        return "failed" if self.failed else "ready"
+
+    def report(self):
+        """加载耗时明细，每个副本一行"""
+        end = self.finished_at or time.perf_counter()
+        return {
+            "state": self.state,
+            "stages": {
+                stage: "ready" if self.executor.has_stage(stage) else ("failed" if stage in self.failed else "loading")
+                for stage in self.specs
+            },
+            "errors": dict(self.failed),
+            "total_s": end - self.started_at if self.started_at else 0.0,
+            "models": sorted(self.timings, key=lambda t: (t["stage"], t["replica"])),
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"model loading {report['state']} in {report['total_s']:.2f}s", flush=True)
+        for t in report["models"]:
+            print(
+                f"  {t['stage']:<8} #{t['replica']}  load {t['load_s']:6.2f}s  warmup {t['warmup_s']:6.2f}s  {t['model']}",
+                flush=True,
+            )
@@ -0,0 +1,112 @@
+"""
+进程内共享的模型注册表：同一模型（路径、版本、设备、副本号）只加载一份，按引用计数释放，
+同一进程里的 websocket 流式识别和 REST 文件识别共用权重
+"""
+import copy
+import gc
+import os
+import threading
+from concurrent.futures import Future
+
+
+class ModelRegistry:
+    """
+    引用计数的模型注册表
+
+    acquire(key, factory) 在模型不存在时调用 factory() 加载，多个线程同时请求同一模型
+    时只加载一次，其余线程等待结果。release(model) 减少引用，归零时丢弃模型。
+    副本号是键的一部分：同一模型的不同副本各自加载，可以被不同线程同时调用。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {"future": Future, "refs": 引用数}
+        self._keys = {}  # id(model) -> key
+
+    @staticmethod
+    def make_key(model_path, model_revision="", device="", replica=0):
+        # 本地目录直接加载，版本号不起作用，不参与区分
+        if os.path.isdir(model_path):
+            model_path = os.path.abspath(model_path)
+            model_revision = ""
+        return (model_path, model_revision or "", device or "", replica)
+
+    def acquire(self, key, factory):
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = {"future": Future(), "refs": 0}
+                self._entries[key] = entry
+            entry["refs"] += 1
+        if not owner:
+            return entry["future"].result()
+        try:
+            model = factory()
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry["future"].set_exception(e)
+            raise
+        with self._lock:
+            self._keys[id(model)] = key
+        entry["future"].set_result(model)
+        return model
+
+    def release(self, model):
+        # compose_model 拼出的模型不在注册表中，释放它引用的各个子模型
+        for part in getattr(model, "registry_parts", ()):
+            self.release(part)
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry["refs"] -= 1
+            if entry["refs"] > 0:
+                return
+            del self._entries[key]
+            del self._keys[id(model)]
+        gc.collect()
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "model": key[0],
+                    "revision": key[1],
+                    "device": key[2],
+                    "replica": key[3],
+                    "refs": entry["refs"],
+                    "loaded": entry["future"].done(),
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+# 进程内唯一的注册表，两套服务在同一进程中运行时共用
+shared_registry = ModelRegistry()
+
+
+def compose_model(asr, vad=None, punc=None, spk=None, spk_mode="punc_segment"):
+    """
+    用注册表中的单个模型拼出带 VAD / 标点 / 说话人分离的 AutoModel
+
+    与 AutoModel(model=..., vad_model=..., punc_model=..., spk_model=...) 等价，
+    但子模型的权重与其他使用者共享，只读推理；各子模型的 kwargs 复制一份，
+    因为 AutoModel.generate 会把每次调用的参数写进 kwargs。
+    """
+    composite = copy.copy(asr)
+    composite.kwargs = dict(asr.kwargs)
+    composite.registry_parts = [part for part in (asr, vad, punc, spk) if part is not None]
+    for name, part in (("vad", vad), ("punc", punc), ("spk", spk)):
+        setattr(composite, f"{name}_model", part.model if part is not None else None)
+        setattr(composite, f"{name}_kwargs", dict(part.kwargs) if part is not None else {})
+    if spk is not None:
+        from funasr.models.campplus.cluster_backend import ClusterBackend
+
+        composite.cb_model = ClusterBackend().to(asr.kwargs["device"])
+        composite.spk_mode = spk_mode
+    if hasattr(composite, "_store_base_configs"):
+        # 新版 funasr 每次推理前按快照恢复 kwargs，快照需要包含拼上的子模型
+        composite._store_base_configs()
+    return composite
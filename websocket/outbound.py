@@ -0,0 +1,152 @@
+"""
+每个连接的发送队列：识别结果先入队，由独立的发送协程写出，慢客户端不会阻塞该会话的解码
+"""
+import asyncio
+import collections
+import json
+import time
+
+import websockets
+
+
+class OutboundQueue:
+    """
+    会话发送队列
+
+    send_partial 入队流式中间结果（增量文本）：队尾还没发出的中间结果与新结果属于同一段，
+    文本直接拼接成一条，客户端看到的文字和顺序不变，只是帧数变少。
+    send 入队离线结果、错误等其他消息，按顺序发送，从不合并或丢弃。
+    队列长度达到 high_water 时，overflow="disconnect" 以 1013 关闭连接，
+    overflow="coalesce" 继续排队（中间结果照常合并），只打印一次告警。
+    on_sent 回调在消息写出后调用，用于统计端到端延迟。
+
+    连接断开时没写出的消息留在队列里；hold() 之后新入队的消息也只保留不发送，
+    由 take_held() 取走，用于续传时补发。
+    """
+    def __init__(self, websocket, high_water=64, overflow="coalesce", latency_histogram=None):
+        self.websocket = websocket
+        self.high_water = high_water
+        self.overflow = overflow
+        self.latency_histogram = latency_histogram
+        self.closed = False
+        self._held = False
+        self._items = collections.deque()  # [payload, partial, 入队时刻, on_sent]
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._warned = False
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._sent = 0
+        self._coalesced = 0
+        self._max_depth = 0
+        self._overflowed = False
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._writer())
+        return self
+
+    def send(self, payload, on_sent=None):
+        self._put(payload, False, on_sent)
+
+    def send_partial(self, payload, on_sent=None):
+        self._put(payload, True, on_sent)
+
+    def _put(self, payload, partial, on_sent):
+        if self.closed and not self._held:
+            return
+        if partial and self._items:
+            tail = self._items[-1]
+            if tail[1] and tail[0]["mode"] == payload["mode"] and tail[0].get("wav_name") == payload.get("wav_name"):
+                tail[0]["text"] += payload["text"]
+                self._coalesced += 1
+                return
+        self._items.append([payload, partial, time.perf_counter(), on_sent])
+        self._max_depth = max(self._max_depth, len(self._items))
+        if self._held:
+            return
+        self._wakeup.set()
+        if len(self._items) >= self.high_water:
+            self._on_high_water()
+
+    def _on_high_water(self):
+        if self.overflow == "disconnect":
+            print(f"outbound queue reached {self.high_water} messages, disconnecting slow client", flush=True)
+            self._overflowed = True
+            self.closed = True
+            self._items.clear()
+            asyncio.ensure_future(self.websocket.close(code=1013, reason="client too slow"))
+        elif not self._warned:
+            self._warned = True
+            print(f"outbound queue reached {self.high_water} messages, coalescing partial results", flush=True)
+
+    async def _writer(self):
+        try:
+            while not self._held:
+                if not self._items:
+                    if self.closed:
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                item = self._items.popleft()
+                payload, partial, queued_at, on_sent = item
+                try:
+                    await self.websocket.send(json.dumps(payload))
+                except websockets.ConnectionClosed:
+                    # 没写出去的消息放回队首，续传时可以补发
+                    self._items.appendleft(item)
+                    raise
+                latency = time.perf_counter() - queued_at
+                self._sent += 1
+                self._latency_sum += latency
+                self._latency_max = max(self._latency_max, latency)
+                if self.latency_histogram is not None:
+                    self.latency_histogram.labels("partial" if partial else "result").observe(latency)
+                if on_sent is not None:
+                    on_sent()
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"outbound writer failed: {e}", flush=True)
+        finally:
+            self.closed = True
+
+    async def close(self, timeout=5.0):
+        """不再接收新消息，等待已入队的消息发完（最多 timeout 秒）"""
+        self.closed = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+
+    def hold(self):
+        """停止发送：未写出的和之后入队的消息都保留在队列里，等 take_held() 取走"""
+        self._held = True
+        self.closed = True
+
+    def take_held(self):
+        """取走保留的消息（按入队顺序）"""
+        payloads = [item[0] for item in self._items]
+        self._items.clear()
+        return payloads
+
+    def abort(self):
+        self.closed = True
+        if not self._held:
+            self._items.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "max_depth": self._max_depth,
+            "sent": self._sent,
+            "coalesced": self._coalesced,
+            "avg_send_latency_ms": self._latency_sum / self._sent * 1000 if self._sent else 0.0,
+            "max_send_latency_ms": self._latency_max * 1000,
+            "overflowed": self._overflowed,
+        }
@@ -0,0 +1,100 @@
+"""
+分阶段流水线：各阶段由独立的任务处理，阶段之间用有界队列连接，
+前一条数据在后面阶段处理时，下一条数据已经可以进入前面的阶段
+"""
+import asyncio
+import time
+
+
+# 所有会话流水线按阶段汇总的统计
+stage_metrics = {}
+
+
+def _stage_metric(name):
+    metric = stage_metrics.get(name)
+    if metric is None:
+        metric = {"processed": 0, "failed": 0, "queue_depth": 0, "service_time": 0.0, "service_time_max": 0.0}
+        stage_metrics[name] = metric
+    return metric
+
+
+def pipeline_stats():
+    """各阶段的处理数量、当前排队数和平均/最大服务时间（秒）"""
+    stats = {}
+    for name, metric in stage_metrics.items():
+        stats[name] = dict(
+            metric,
+            service_time_mean=metric["service_time"] / metric["processed"] if metric["processed"] else 0.0,
+        )
+    return stats
+
+
+class StagePipeline:
+    """
+    按顺序串联的处理阶段
+
+    stages 为 [(name, handler), ...]，handler(item) 是协程，返回值交给下一阶段，
+    返回 None 表示该条数据到此结束。每个阶段只有一个任务，所以同一条流水线里
+    数据严格按提交顺序经过每个阶段。队列满时 submit() 会等待，形成反压。
+    """
+    def __init__(self, stages, maxsize=4):
+        self.stages = stages
+        self.queues = [asyncio.Queue(maxsize=maxsize) for _ in stages]
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._run_stage(i)) for i in range(len(self.stages))
+            ]
+        return self
+
+    async def submit(self, item):
+        self.start()
+        await self.queues[0].put(item)
+        _stage_metric(self.stages[0][0])["queue_depth"] += 1
+
+    async def _run_stage(self, index):
+        name, handler = self.stages[index]
+        metric = _stage_metric(name)
+        queue = self.queues[index]
+        while True:
+            item = await queue.get()
+            metric["queue_depth"] -= 1
+            start = time.perf_counter()
+            try:
+                out = await handler(item)
+            except asyncio.CancelledError:
+                queue.task_done()
+                raise
+            except Exception as e:
+                metric["failed"] += 1
+                print(f"pipeline stage {name} failed: {e}")
+                out = None
+            elapsed = time.perf_counter() - start
+            metric["processed"] += 1
+            metric["service_time"] += elapsed
+            metric["service_time_max"] = max(metric["service_time_max"], elapsed)
+            if out is not None and index + 1 < len(self.stages):
+                await self.queues[index + 1].put(out)
+                _stage_metric(self.stages[index + 1][0])["queue_depth"] += 1
+            queue.task_done()
+
+    async def join(self):
+        """等待已提交的数据全部走完流水线"""
+        for queue in self.queues:
+            await queue.join()
+
+    def depths(self):
+        return {name: queue.qsize() for (name, _), queue in zip(self.stages, self.queues)}
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        # 丢弃未处理的数据，保持汇总的排队数准确
+        for (name, _), queue in zip(self.stages, self.queues):
+            metric = _stage_metric(name)
+            while not queue.empty():
+                queue.get_nowait()
+                metric["queue_depth"] -= 1
+        self._tasks = []
@@ -0,0 +1,133 @@
+"""
+识别结果缓存：按音频内容哈希和识别参数寻址，内存 LRU + 磁盘两级
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def make_cache_key(audio_digest, **params):
+    """音频字节的 sha256 与识别参数（热词、batch_size_s、模型路径等）共同决定缓存键"""
+    key = hashlib.sha256(audio_digest.encode("ascii"))
+    key.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return key.hexdigest()
+
+
+class ResultCache:
+    """
+    两级结果缓存
+
+    内存层保存最近使用的 memory_entries 条结果；磁盘层（disk_dir 为空时关闭）
+    每条结果一个 JSON 文件，总大小超过 disk_budget_bytes 时按最近访问时间淘汰。
+    磁盘命中的结果会提升到内存层。
+    """
+    def __init__(self, memory_entries=64, disk_dir="", disk_budget_bytes=1024 * 1024 * 1024):
+        self.memory_entries = memory_entries
+        self.disk_dir = disk_dir
+        self.disk_budget_bytes = disk_budget_bytes
+        self._memory = collections.OrderedDict()
+        self._disk = collections.OrderedDict()  # key -> 文件大小，按访问时间从旧到新
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "puts": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self._memory[key]
+            if key in self._disk:
+                path = self._path(key)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        value = json.load(f)
+                    os.utime(path)
+                except (OSError, ValueError):
+                    self._drop_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.counters["disk_hits"] += 1
+                    self._put_memory(key, value)
+                    return value
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self.counters["puts"] += 1
+            self._put_memory(key, value)
+            if self.disk_dir:
+                self._put_disk(key, value)
+
+    def _put_memory(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    def _put_disk(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)
+        size = os.path.getsize(path)
+        self._disk[key] = size
+        self._disk_bytes += size
+        while self._disk_bytes > self.disk_budget_bytes and len(self._disk) > 1:
+            oldest = next(iter(self._disk))
+            self._drop_disk(oldest)
+            self.counters["disk_evictions"] += 1
+
+    def _drop_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key, 0)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return dict(
+                self.counters,
+                hit_rate=hits / lookups if lookups else 0.0,
+                memory_entries=len(self._memory),
+                disk_entries=len(self._disk),
+                disk_bytes=self._disk_bytes,
+                disk_budget_bytes=self.disk_budget_bytes if self.disk_dir else 0,
+            )
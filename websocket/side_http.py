@@ -0,0 +1,60 @@
+"""
+极简旁路 HTTP 服务，用于暴露状态、指标等只读接口，不依赖额外的 Web 框架
+"""
+import asyncio
+from urllib.parse import parse_qsl
+
+
+async def start_http_server(host, port, routes, query_routes=None):
+    """
+    启动 HTTP 服务
+
+    routes 为 {path: handler}，handler() 返回 (content_type, body_str)；
+    query_routes 的 handler 以查询参数字典调用，抛出 ValueError 时返回 400；
+    handler 返回协程时等待其结果，耗时的查询可以放到线程中执行，不阻塞事件循环。
+    只支持 GET，每个请求处理完即关闭连接。
+    """
+    query_routes = query_routes or {}
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 读完请求头
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            parts = request_line.decode("latin-1").split()
+            path, _, query = parts[1].partition("?") if len(parts) >= 2 else ("/", "", "")
+            handler = routes.get(path)
+            if path in query_routes:
+                params = dict(parse_qsl(query))
+                handler = lambda: query_routes[path](params)
+            if len(parts) < 2 or parts[0] != "GET":
+                status, content_type, body = "405 Method Not Allowed", "text/plain", "method not allowed\n"
+            elif handler is None:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            else:
+                try:
+                    result = handler()
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                    content_type, body = result
+                    status = "200 OK"
+                except ValueError as e:
+                    status, content_type, body = "400 Bad Request", "text/plain", f"{e}\n"
+                except Exception as e:
+                    status, content_type, body = "500 Internal Server Error", "text/plain", f"{e}\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
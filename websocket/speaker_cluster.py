@@ -0,0 +1,74 @@
+"""
+在线说话人归并：分段得到的说话人向量按余弦相似度对应到整段音频一致的说话人编号
+"""
+import numpy as np
+
+
+def normalize(vector):
+    """单位化说话人向量；torch 张量（模型输出）先转成 numpy"""
+    if hasattr(vector, "detach"):
+        vector = vector.detach().cpu().numpy()
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class OnlineSpeakerClusterer:
+    """
+    增量说话人聚类
+
+    每个全局说话人保存已归入向量的加权和，方向即质心。assign(embeddings) 把一批
+    向量（同一段音频里已经区分开的不同说话人）对应到已有说话人：按相似度从高到低
+    贪心匹配，同一批里的两个向量不会归到同一个说话人；相似度低于 threshold 的向量
+    新建说话人，说话人数达到 max_speakers 后归入最相似的说话人。
+    """
+    def __init__(self, threshold=0.6, max_speakers=64):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self._sums = []
+
+    def __len__(self):
+        return len(self._sums)
+
+    def centroids(self):
+        """各说话人的单位质心，形状 (说话人数, 维度)"""
+        if not self._sums:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([normalize(s) for s in self._sums])
+
+    def nearest(self, embedding):
+        """最相似的已有说话人编号及相似度，不更新质心；还没有说话人时返回 (None, 0.0)"""
+        if not self._sums:
+            return None, 0.0
+        scores = self.centroids() @ normalize(embedding)
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def assign(self, embeddings, weights=None):
+        """返回与 embeddings 一一对应的全局说话人编号，并把向量并入对应说话人"""
+        vectors = [normalize(e) for e in embeddings]
+        if not vectors:
+            return []
+        weights = [1.0] * len(vectors) if weights is None else list(weights)
+        labels = [None] * len(vectors)
+        if self._sums:
+            scores = np.stack(vectors) @ self.centroids().T
+            taken = set()
+            for flat in np.argsort(-scores, axis=None):
+                i, k = divmod(int(flat), scores.shape[1])
+                if scores[i, k] < self.threshold:
+                    break
+                if labels[i] is None and k not in taken:
+                    labels[i] = k
+                    taken.add(k)
+        for i, vector in enumerate(vectors):
+            if labels[i] is not None:
+                continue
+            if len(self._sums) < self.max_speakers:
+                labels[i] = len(self._sums)
+                self._sums.append(np.zeros_like(vector))
+            else:
+                labels[i] = int(np.argmax(self.centroids() @ vector))
+        for label, vector, weight in zip(labels, vectors, weights):
+            self._sums[label] = self._sums[label] + vector * weight
+        return labels
@@ -0,0 +1,301 @@
+"""
+已登记说话人的向量索引：内存映射的向量矩阵加追加写的登记日志，按余弦相似度批量检索
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from speaker_cluster import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能由一个进程写索引目录
+    fcntl = None
+
+
+class SpeakerIndex:
+    """
+    已登记说话人的说话人向量索引
+
+    目录中有三个文件：meta.json（维度、数据类型）、embeddings.bin（按行存放的单位化
+    向量，np.memmap 映射，容量不足时按两倍扩容）和 entries.jsonl（追加写的登记/删除
+    日志）。启动时映射矩阵、回放日志即可使用，不需要读入全部向量。
+
+    一个说话人可以登记多条向量（不同录音），检索时取各条中的最高分。删除只把对应的行
+    清零并记入日志；被删除的行超过一半、且多于 initial_capacity 行时，remove() 调用
+    compact() 重写两个文件（行数不多时空行占不了多少空间，不值得重写）。
+    向量维度由第一次登记的向量决定，之后写入 meta.json。
+
+    其他进程（如单独部署的 REST 服务）可以写同一个目录：检索、列出等操作前先调用
+    refresh()，只回放日志中新追加的行；日志被 compact() 替换时整体重新加载。
+    进程之间用目录中 index.lock 的 flock 互斥：登记、删除和合并持有排他锁，在锁内先
+    追上日志再分配行号，两个进程不会写同一行；回放持有共享锁，不会读到合并到一半的文件。
+    """
+    def __init__(self, directory, dtype="float16", initial_capacity=1024):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._matrix_path = os.path.join(directory, "embeddings.bin")
+        self._log_path = os.path.join(directory, "entries.jsonl")
+        self.dim = None  # 已有 meta.json 时以其中的维度和数据类型为准
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, "index.lock"), "ab")
+        self._matrix = None
+        self._log = None
+        with self._locked(shared=True):
+            self._reload()
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        # 线程锁之外再对 index.lock 加 flock；同一文件描述符上不嵌套使用
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_matrix(self, capacity=None):
+        row_bytes = self.dim * self.dtype.itemsize
+        size = os.path.getsize(self._matrix_path) if os.path.exists(self._matrix_path) else 0
+        capacity = max(capacity or 0, size // row_bytes, self.initial_capacity)
+        if size < capacity * row_bytes:
+            with open(self._matrix_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self._matrix = np.memmap(self._matrix_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+
+    def _reload(self):
+        # 重新映射矩阵、从头回放日志，日志写句柄指向当前的日志文件
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        if self.dim is not None:
+            self._open_matrix()
+        self._rows = []  # 行号 -> (speaker_id, 说话人名)，已删除为 None
+        self._speakers = {}  # speaker_id -> {"name", "rows", "created_at"}
+        self._fingerprint = None
+        self._log_offset = 0  # 已回放的日志字节数
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._log_path, "ab")
+        self._log_inode = os.fstat(self._log.fileno()).st_ino
+        self._replay_log()
+
+    def _replay_log(self):
+        # 从 _log_offset 回放到最后一个完整的行，写到一半的最后一行留到下次
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry["op"] == "add":
+                self._apply_add(entry)
+            elif entry["op"] == "remove":
+                self._apply_remove(entry["speaker_id"])
+        self._log_offset += end
+        if self._rows and self._matrix is not None and len(self._rows) > len(self._matrix):
+            # 其他进程扩容了矩阵文件
+            self._open_matrix()
+
+    def refresh(self):
+        """回放其他进程新写入日志的登记和删除；只在日志变化时读文件"""
+        with self._locked(shared=True):
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self._log_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            self._reload()  # 日志被 compact() 替换
+        elif stat.st_size > self._log_offset:
+            if self.dim is None and os.path.exists(self._meta_path):
+                self._reload()  # 其他进程登记了第一条向量
+            else:
+                self._replay_log()
+
+    def _apply_add(self, entry):
+        self._fingerprint = None
+        row = entry["row"]
+        while len(self._rows) <= row:
+            self._rows.append(None)
+        self._rows[row] = (entry["speaker_id"], entry["name"])
+        speaker = self._speakers.setdefault(
+            entry["speaker_id"], {"name": entry["name"], "rows": [], "created_at": entry.get("created_at")}
+        )
+        speaker["name"] = entry["name"]
+        if row not in speaker["rows"]:
+            speaker["rows"].append(row)
+
+    def _apply_remove(self, speaker_id):
+        self._fingerprint = None
+        speaker = self._speakers.pop(speaker_id, None)
+        if speaker is None:
+            return []
+        for row in speaker["rows"]:
+            self._rows[row] = None
+        return speaker["rows"]
+
+    def _append_log(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        self._log.write(line)
+        self._log.flush()
+        # 写之前已追上日志末尾时，自己写的行不必再回放
+        if os.fstat(self._log.fileno()).st_size == self._log_offset + len(line):
+            self._log_offset += len(line)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._speakers)
+
+    def add(self, speaker_id, name, embedding):
+        """登记一条说话人向量，已有的 speaker_id 增加一条向量（同时更新名字）"""
+        vector = normalize(embedding)
+        with self._locked():
+            self._refresh()
+            if self.dim is None:
+                self.dim = len(vector)
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+                self._open_matrix()
+            if len(vector) != self.dim:
+                raise ValueError(f"embedding has {len(vector)} dims, index expects {self.dim}")
+            row = len(self._rows)
+            if row >= len(self._matrix):
+                self._matrix.flush()
+                self._open_matrix(2 * len(self._matrix))
+            self._matrix[row] = vector
+            self._matrix.flush()
+            entry = {"op": "add", "row": row, "speaker_id": speaker_id, "name": name, "created_at": time.time()}
+            self._append_log(entry)
+            self._apply_add(entry)
+
+    def remove(self, speaker_id):
+        """删除说话人的全部向量，返回是否存在"""
+        with self._locked():
+            self._refresh()
+            rows = self._apply_remove(speaker_id)
+            if not rows:
+                return False
+            self._matrix[rows] = 0
+            self._matrix.flush()
+            self._append_log({"op": "remove", "speaker_id": speaker_id})
+            dead = sum(1 for r in self._rows if r is None)
+            if dead > max(self.initial_capacity, len(self._rows) - dead):
+                self._compact()
+            return True
+
+    def compact(self):
+        with self._locked():
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # 存活的行按顺序搬到新文件，新日志只含登记记录，替换后重新映射
+        live = [(row, entry) for row, entry in enumerate(self._rows) if entry is not None]
+        capacity = max(self.initial_capacity, 2 * len(live))
+        tmp_matrix = self._matrix_path + ".tmp"
+        tmp_log = self._log_path + ".tmp"
+        matrix = np.memmap(tmp_matrix, dtype=self.dtype, mode="w+", shape=(capacity, self.dim))
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            for new_row, (row, (speaker_id, name)) in enumerate(live):
+                matrix[new_row] = self._matrix[row]
+                created_at = self._speakers[speaker_id].get("created_at")
+                f.write(json.dumps(
+                    {"op": "add", "row": new_row, "speaker_id": speaker_id, "name": name, "created_at": created_at},
+                    ensure_ascii=False,
+                ) + "\n")
+        matrix.flush()
+        del matrix
+        os.replace(tmp_matrix, self._matrix_path)
+        os.replace(tmp_log, self._log_path)
+        self._reload()
+
+    def search(self, embedding, k=5):
+        """
+        与 embedding 最相似的 k 个说话人，按相似度降序
+
+        返回 [{"speaker_id", "name", "score"}, ...]。一次矩阵乘算出与所有行的相似度，
+        argpartition 取前若干行，再按说话人去重。
+        """
+        query = normalize(embedding)
+        with self._locked(shared=True):
+            self._refresh()
+            n = len(self._rows)
+            matrix = self._matrix
+            rows = self._rows
+        if n == 0 or k <= 0:
+            return []
+        # float16 矩阵乘没有 BLAS 加速，按 float32 计算；已删除的行全为零，得分为 0
+        scores = matrix[:n].astype(np.float32) @ query
+        # 一个说话人可能占多行，多取一些行再去重
+        take = min(n, 4 * k)
+        top = np.argpartition(-scores, take - 1)[:take]
+        results = []
+        seen = set()
+        for row in top[np.argsort(-scores[top])]:
+            entry = rows[row]
+            if entry is None or entry[0] in seen:
+                continue
+            seen.add(entry[0])
+            results.append({"speaker_id": entry[0], "name": entry[1], "score": float(scores[row])})
+            if len(results) == k:
+                break
+        return results
+
+    def identify(self, embedding, threshold=0.5):
+        """相似度不低于 threshold 的最相似说话人，没有时返回 None"""
+        best = self.search(embedding, k=1)
+        if best and best[0]["score"] >= threshold:
+            return best[0]
+        return None
+
+    def fingerprint(self):
+        """登记内容的摘要，登记或删除后改变，用作识别结果缓存键的一部分"""
+        with self._locked(shared=True):
+            self._refresh()
+            if self._fingerprint is None:
+                digest = hashlib.sha256()
+                for speaker_id in sorted(self._speakers):
+                    info = self._speakers[speaker_id]
+                    digest.update(json.dumps([speaker_id, info["name"], info["rows"]], ensure_ascii=False).encode("utf-8"))
+                self._fingerprint = digest.hexdigest()
+            return self._fingerprint
+
+    def speakers(self):
+        with self._locked(shared=True):
+            self._refresh()
+            return [
+                {"speaker_id": speaker_id, "name": info["name"], "embeddings": len(info["rows"]),
+                 "created_at": info["created_at"]}
+                for speaker_id, info in self._speakers.items()
+            ]
+
+    def stats(self):
+        with self._locked(shared=True):
+            self._refresh()
+            dead = sum(1 for r in self._rows if r is None)
+            return {
+                "speakers": len(self._speakers),
+                "rows": len(self._rows) - dead,
+                "deleted_rows": dead,
+                "capacity": len(self._matrix) if self._matrix is not None else 0,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+            }
@@ -0,0 +1,177 @@
+"""
+桩模型：接口与 funasr AutoModel.generate 一致，结果只由输入音频决定，计算耗时可配置，
+用于在没有模型权重的 CPU 机器上压测调度、缓冲逻辑
+"""
+import time
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+FRAME_MS = 10
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+# 识别结果取字的字表，同样的音频总是得到同样的文字
+VOCAB = "会议开始今天讨论项目进度请大家依次发言我们下周提交方案需要确认预算和人员安排"
+
+
+def to_float(audio):
+    """bytes（16 位 PCM）或 int16/float 数组统一为 float32"""
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = np.frombuffer(bytes(audio[:len(audio) // 2 * 2]), dtype=np.int16)
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio.astype(np.float32, copy=False)
+
+
+def frame_energy(audio):
+    """按 10ms 帧计算均方根，尾部不足一帧的采样忽略"""
+    n = len(audio) // FRAME_SAMPLES
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n * FRAME_SAMPLES].reshape(n, FRAME_SAMPLES)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def fake_text(audio, ms_per_char=200, threshold=0.01):
+    """每 ms_per_char 毫秒的有声音频产生一个字，字由该段能量决定"""
+    energy = frame_energy(audio)
+    per_char = ms_per_char // FRAME_MS
+    chars = []
+    for i in range(0, len(energy) - per_char + 1, per_char):
+        block = energy[i:i + per_char]
+        if block.mean() > threshold:
+            chars.append(VOCAB[int(block.sum() * 1000) % len(VOCAB)])
+    return "".join(chars)
+
+
+class StubModel:
+    """
+    桩模型基类
+
+    每次 generate 调用耗时 overhead_ms + rtf * 音频秒数（批量调用按总时长计，
+    只算一次 overhead）。默认用 sleep 模拟，与 GPU 推理一样不占用 GIL；busy=True 时
+    改为忙等，模拟占满 CPU 的推理。
+    """
+    def __init__(self, rtf=0.02, overhead_ms=2.0, busy=False):
+        self.rtf = rtf
+        self.overhead_ms = overhead_ms
+        self.busy = busy
+        self.kwargs = {}
+
+    def _spend(self, audio_seconds):
+        cost = self.overhead_ms / 1000 + self.rtf * audio_seconds
+        if cost <= 0:
+            return
+        if self.busy:
+            deadline = time.perf_counter() + cost
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(cost)
+
+    def generate(self, input, **kwargs):
+        self.kwargs.update(kwargs)
+        inputs = input if isinstance(input, list) else [input]
+        results = [self._one(item, kwargs) for item in inputs]
+        self._spend(sum(self._seconds(item) for item in inputs))
+        return results
+
+    def _seconds(self, item):
+        if isinstance(item, str):
+            return 0.0
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            return len(item) / 2 / SAMPLE_RATE
+        return len(item) / SAMPLE_RATE
+
+    def _one(self, item, kwargs):
+        raise NotImplementedError
+
+
+class StubVad(StubModel):
+    """
+    能量门限 VAD
+
+    流式调用时状态保存在 kwargs["cache"] 中，每次最多返回一个起点或终点（毫秒，
+    以该 cache 的第一帧为零点）；is_final 且 cache 为空时按整段音频返回全部语音段。
+    """
+    def __init__(self, threshold=0.01, min_silence_ms=500, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.min_silence_frames = min_silence_ms // FRAME_MS
+
+    def _one(self, item, kwargs):
+        audio = to_float(item)
+        cache = kwargs.get("cache")
+        if cache is None:
+            cache = {}
+        offline = kwargs.get("is_final") and not cache
+        if not cache:
+            cache.update({"frames": 0, "in_speech": False, "silence": 0, "tail": np.zeros(0, np.float32)})
+        audio = np.concatenate([cache["tail"], audio])
+        n = len(audio) // FRAME_SAMPLES
+        cache["tail"] = audio[n * FRAME_SAMPLES:]
+        voiced = frame_energy(audio) > self.threshold
+        events = []
+        for i, is_voice in enumerate(voiced):
+            index = cache["frames"] + i
+            if is_voice:
+                cache["silence"] = 0
+                if not cache["in_speech"]:
+                    cache["in_speech"] = True
+                    events.append([index * FRAME_MS, -1])
+            elif cache["in_speech"]:
+                cache["silence"] += 1
+                if cache["silence"] >= self.min_silence_frames:
+                    cache["in_speech"] = False
+                    end_ms = (index - cache["silence"] + 1) * FRAME_MS
+                    if events and events[-1][1] == -1:
+                        events[-1][1] = end_ms
+                    else:
+                        events.append([-1, end_ms])
+        cache["frames"] += n
+        if offline:
+            if cache["in_speech"]:
+                end_ms = cache["frames"] * FRAME_MS
+                if events and events[-1][1] == -1:
+                    events[-1][1] = end_ms
+                else:
+                    events.append([-1, end_ms])
+            return {"key": "stub", "value": [seg for seg in events if seg[0] != -1 and seg[1] != -1]}
+        return {"key": "stub", "value": events}
+
+
+class StubAsr(StubModel):
+    """离线/流式识别：文字由音频能量决定，流式调用只返回本块音频对应的文字"""
+    def _one(self, item, kwargs):
+        audio = to_float(item)
+        return {"key": "stub", "text": fake_text(audio)}
+
+
+class StubPunc(StubModel):
+    """标点：在句末补一个句号"""
+    def _one(self, item, kwargs):
+        text = item if isinstance(item, str) else ""
+        return {"key": "stub", "text": text + "。" if text else text}
+
+
+class StubSpk(StubModel):
+    """说话人向量：前两秒音频的分频带对数能量，频谱相近的音频向量相近"""
+    def __init__(self, bands=32, **kwargs):
+        super().__init__(**kwargs)
+        self.bands = bands
+
+    def _one(self, item, kwargs):
+        audio = to_float(item)[:2 * SAMPLE_RATE]
+        spectrum = np.abs(np.fft.rfft(audio, n=2 * SAMPLE_RATE)) ** 2
+        bands = np.array_split(spectrum[1:], self.bands)
+        embedding = np.log1p([band.sum() for band in bands]).astype(np.float32)
+        return {"key": "stub", "spk_embedding": (embedding - embedding.mean())[None]}
+
+
+STUB_CLASSES = {"vad": StubVad, "online": StubAsr, "offline": StubAsr, "punc": StubPunc, "spk": StubSpk}
+
+
+def build_stub_model(kind, rtf=0.02, overhead_ms=2.0, busy=False):
+    """kind 为 vad / online / offline / punc / spk"""
+    return STUB_CLASSES[kind](rtf=rtf, overhead_ms=overhead_ms, busy=busy)
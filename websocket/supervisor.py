@@ -0,0 +1,243 @@
+"""
+多进程分片：主进程作为 supervisor 启动 K 个 worker 进程（各自加载一份模型），
+对外监听端口，把每个新连接转发给当前会话数最少的 worker
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+from side_http import start_http_server
+
+
+# supervisor 自己使用、不传给 worker 的参数
+SUPERVISOR_ONLY_ARGS = {
+    "--host": True,
+    "--port": True,
+    "--num_workers": True,
+    "--worker_base_port": True,
+    "--status_port": True,
+    "--pin_workers": False,
+    "--cpu_affinity": True,
+    "--metrics_port": True,
+    "--early_bind": True,
+}
+
+
+def strip_args(argv, names):
+    """从命令行参数中去掉指定参数，names 为 {参数名: 是否带值}"""
+    out = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in names:
+            skip = names[name] and "=" not in arg
+            continue
+        out.append(arg)
+    return out
+
+
+class Worker:
+    def __init__(self, index, port, cpus):
+        self.index = index
+        self.port = port
+        self.cpus = cpus
+        self.process = None
+        self.sessions = 0
+        self.total_sessions = 0
+        self.restarts = 0
+        self.ready = False
+        self.started_at = None
+        self.last_exit_code = None
+
+    def status(self):
+        return {
+            "index": self.index,
+            "port": self.port,
+            "pid": self.process.pid if self.process else None,
+            "ready": self.ready,
+            "alive": self.process is not None and self.process.returncode is None,
+            "sessions": self.sessions,
+            "total_sessions": self.total_sessions,
+            "restarts": self.restarts,
+            "uptime": time.time() - self.started_at if self.started_at else 0,
+            "last_exit_code": self.last_exit_code,
+            "cpus": self.cpus,
+        }
+
+
+class Supervisor:
+    """
+    worker 监督进程
+
+    连接在 TCP 层原样转发（TLS 由 worker 终结），因此一个会话从建立到断开始终
+    留在同一个 worker 上。worker 退出后自动重启，其余 worker 上的会话不受影响。
+    """
+    def __init__(self, args, argv, restart_delay=3.0, health_interval=2.0):
+        self.args = args
+        self.restart_delay = restart_delay
+        self.health_interval = health_interval
+        self.worker_argv = strip_args(argv, SUPERVISOR_ONLY_ARGS)
+        self.workers = []
+        cpu_count = os.cpu_count() or 1
+        for i in range(args.num_workers):
+            cpus = None
+            if args.pin_workers:
+                cpus = sorted({(i * args.ncpu + j) % cpu_count for j in range(args.ncpu)})
+            self.workers.append(Worker(i, args.worker_base_port + i, cpus))
+        self._stopping = False
+
+    def _command(self, worker):
+        cmd = [sys.executable, os.path.abspath(sys.argv[0])] + self.worker_argv
+        # worker 在模型加载完成后才监听端口，健康检查据此判断就绪；对外由 supervisor 提前监听
+        cmd += ["--host", "127.0.0.1", "--port", str(worker.port), "--num_workers", "0", "--early_bind", "0"]
+        if worker.cpus:
+            cmd += ["--cpu_affinity", ",".join(str(c) for c in worker.cpus)]
+        if getattr(self.args, "metrics_port", 0):
+            # 每个 worker 单独暴露指标，端口依次排在 --metrics_port 之后
+            cmd += ["--metrics_port", str(self.args.metrics_port + 1 + worker.index)]
+        return cmd
+
+    async def _keep_alive(self, worker):
+        """启动 worker，退出后按间隔重启"""
+        while not self._stopping:
+            worker.ready = False
+            worker.started_at = time.time()
+            worker.process = await asyncio.create_subprocess_exec(*self._command(worker))
+            print(f"worker {worker.index} started, pid {worker.process.pid}, port {worker.port}", flush=True)
+            worker.last_exit_code = await worker.process.wait()
+            worker.ready = False
+            if self._stopping:
+                break
+            worker.restarts += 1
+            print(
+                f"worker {worker.index} exited with code {worker.last_exit_code}, "
+                f"restarting in {self.restart_delay}s",
+                flush=True,
+            )
+            await asyncio.sleep(self.restart_delay)
+
+    async def _health_check(self):
+        """
+        worker 端口可连接即视为就绪（模型加载完成后才会监听）
+
+        就绪之后只检查进程是否存活，转发失败时重新探测端口。
+        """
+        while not self._stopping:
+            for worker in self.workers:
+                if worker.process is None or worker.process.returncode is not None:
+                    worker.ready = False
+                    continue
+                if worker.ready:
+                    continue
+                try:
+                    _, writer = await asyncio.wait_for(
+                        asyncio.open_connection("127.0.0.1", worker.port), timeout=1
+                    )
+                    writer.close()
+                    print(f"worker {worker.index} ready", flush=True)
+                    worker.ready = True
+                except (OSError, asyncio.TimeoutError):
+                    worker.ready = False
+            await asyncio.sleep(self.health_interval)
+
+    def _pick_worker(self):
+        ready = [w for w in self.workers if w.ready]
+        if not ready:
+            return None
+        return min(ready, key=lambda w: (w.sessions, w.total_sessions))
+
+    async def _handle_client(self, client_reader, client_writer):
+        worker = self._pick_worker()
+        if worker is None:
+            print("no worker ready, rejecting connection", flush=True)
+            client_writer.close()
+            return
+        try:
+            worker_reader, worker_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+        except OSError as e:
+            print(f"failed to connect worker {worker.index}: {e}", flush=True)
+            worker.ready = False
+            client_writer.close()
+            return
+        worker.sessions += 1
+        worker.total_sessions += 1
+        try:
+            await asyncio.gather(
+                _pipe(client_reader, worker_writer),
+                _pipe(worker_reader, client_writer),
+            )
+        finally:
+            worker.sessions -= 1
+            worker_writer.close()
+            client_writer.close()
+
+    def status(self):
+        return {
+            "workers": [w.status() for w in self.workers],
+            "sessions": sum(w.sessions for w in self.workers),
+            "ready_workers": sum(1 for w in self.workers if w.ready),
+        }
+
+    async def _report(self, interval=30):
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            loads = ", ".join(
+                f"#{w.index}:{'up' if w.ready else 'down'}/{w.sessions}" for w in self.workers
+            )
+            print(f"supervisor status - sessions per worker: {loads}", flush=True)
+
+    async def serve(self):
+        tasks = [asyncio.ensure_future(self._keep_alive(w)) for w in self.workers]
+        tasks.append(asyncio.ensure_future(self._health_check()))
+        tasks.append(asyncio.ensure_future(self._report()))
+        server = await asyncio.start_server(self._handle_client, self.args.host, self.args.port)
+        print(f"supervisor listening on {self.args.host}:{self.args.port} with {len(self.workers)} workers", flush=True)
+        if self.args.status_port:
+            await start_http_server(
+                self.args.host,
+                self.args.status_port,
+                {"/status": lambda: ("application/json", json.dumps(self.status(), ensure_ascii=False))},
+            )
+            print(f"supervisor status on http://{self.args.host}:{self.args.status_port}/status", flush=True)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            server.close()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stopping = True
+            for worker in self.workers:
+                if worker.process is not None and worker.process.returncode is None:
+                    worker.process.terminate()
+                    loop.run_until_complete(worker.process.wait())
+            loop.close()
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (OSError, RuntimeError):
+            pass
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 服务端模块按顶层模块互相导入（from audio_ring import AudioRing），测试同样从 websocket/ 导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,113 @@
+"""
+传输编码解码器的校验：G.711 查表、IMA-ADPCM 的半字节顺序、分块与整段重采样一致
+"""
+import warnings
+
+import numpy as np
+import pytest
+
+from audio_codecs import (
+    ALAW_TABLE,
+    IMA_INDEX_ADJUST,
+    IMA_STEP_TABLE,
+    ULAW_TABLE,
+    ImaAdpcmDecoder,
+    PolyphaseResampler,
+    make_transport_decoder,
+)
+from audio_ring import AudioRing
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # Python 3.13 起标准库不再提供 audioop
+        audioop = None
+
+needs_audioop = pytest.mark.skipif(audioop is None, reason="audioop is not available")
+ALL_BYTES = bytes(range(256))
+
+
+def decode_all(decoder, frames):
+    ring = AudioRing(initial_seconds=1)
+    for frame in frames:
+        decoder.decode(frame, ring)
+    return ring.view(0).copy()
+
+
+def reference_ima(data, predictor=0, index=0):
+    """逐个采样的 IMA-ADPCM 参考实现，每字节低 4 位在前"""
+    out = []
+    for byte in data:
+        for code in (byte & 0x0F, byte >> 4):
+            step = int(IMA_STEP_TABLE[index])
+            diff = step >> 3
+            if code & 4:
+                diff += step
+            if code & 2:
+                diff += step >> 1
+            if code & 1:
+                diff += step >> 2
+            predictor += -diff if code & 8 else diff
+            predictor = min(max(predictor, -32768), 32767)
+            index = min(max(index + int(IMA_INDEX_ADJUST[code]), 0), 88)
+            out.append(predictor)
+    return np.array(out, dtype=np.int16)
+
+
+def swap_nibbles(data):
+    return bytes(((b & 0x0F) << 4) | (b >> 4) for b in data)
+
+
+@needs_audioop
+def test_g711_tables_match_audioop():
+    assert np.array_equal(ULAW_TABLE, np.frombuffer(audioop.ulaw2lin(ALL_BYTES, 2), dtype="<i2"))
+    assert np.array_equal(ALAW_TABLE, np.frombuffer(audioop.alaw2lin(ALL_BYTES, 2), dtype="<i2"))
+
+
+def test_g711_decoder_uses_tables():
+    data = np.random.default_rng(0).integers(0, 256, 4000, dtype=np.uint8).tobytes()
+    decoded = decode_all(make_transport_decoder("ulaw"), [data[:1234], data[1234:]])
+    assert np.array_equal(decoded, ULAW_TABLE[np.frombuffer(data, dtype=np.uint8)])
+
+
+def test_ima_adpcm_low_nibble_first():
+    rng = np.random.default_rng(1)
+    # 随机码流会让预测值频繁饱和，覆盖逐个饱和的分支
+    data = rng.integers(0, 256, 5000, dtype=np.uint8).tobytes()
+    frames = [data[i:i + 333] for i in range(0, len(data), 333)]
+    assert np.array_equal(decode_all(ImaAdpcmDecoder(), frames), reference_ima(data))
+
+
+@needs_audioop
+def test_ima_adpcm_matches_audioop_with_swapped_nibbles():
+    # audioop 每字节先读高 4 位，本码流先读低 4 位，交换半字节后结果一致
+    data = np.random.default_rng(2).integers(0, 256, 5000, dtype=np.uint8).tobytes()
+    expected, _ = audioop.adpcm2lin(swap_nibbles(data), 2, None)
+    assert np.array_equal(decode_all(ImaAdpcmDecoder(), [data]), np.frombuffer(expected, dtype="<i2"))
+
+
+@pytest.mark.parametrize("in_rate", [8000, 22050, 44100, 48000])
+def test_resampler_chunked_matches_whole(in_rate):
+    rng = np.random.default_rng(in_rate)
+    x = (rng.standard_normal(in_rate) * 3000).astype(np.float32)
+    whole = PolyphaseResampler(in_rate, 16000).process(x)
+    chunked_resampler = PolyphaseResampler(in_rate, 16000)
+    sizes = [1, 2, 3, 7, 160, 441, 1000]
+    pieces, pos, i = [], 0, 0
+    while pos < len(x):
+        pieces.append(chunked_resampler.process(x[pos:pos + sizes[i % len(sizes)]]))
+        pos += sizes[i % len(sizes)]
+        i += 1
+    chunked = np.concatenate(pieces)
+    assert len(whole) == len(chunked) == -(-len(x) * 16000 // in_rate)
+    np.testing.assert_allclose(chunked, whole, rtol=0, atol=1e-2)
+
+
+def test_resampler_keeps_a_tone():
+    t = np.arange(44100) / 44100
+    y = PolyphaseResampler(44100, 16000).process((np.sin(2 * np.pi * 1000 * t) * 10000).astype(np.float32))
+    steady = y[1000:-1000]  # 去掉滤波器起始段
+    assert abs(np.sqrt(np.mean(steady ** 2)) - 10000 / np.sqrt(2)) < 0.01 * 10000
+    spectrum = np.abs(np.fft.rfft(steady * np.hanning(len(steady))))
+    assert abs(np.argmax(spectrum) * 16000 / len(steady) - 1000) < 2
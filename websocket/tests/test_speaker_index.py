@@ -0,0 +1,55 @@
+"""
+说话人索引的校验：多个进程同时登记同一目录时行号不冲突，合并后其他进程能重新加载
+"""
+import multiprocessing
+
+import numpy as np
+
+from speaker_index import SpeakerIndex
+
+DIM = 16
+
+
+def vector(seed):
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def enroll(directory, worker, count):
+    index = SpeakerIndex(directory, dtype="float32", initial_capacity=8)
+    for i in range(count):
+        index.add(f"w{worker}-{i}", f"说话人{worker}-{i}", vector(worker * 1000 + i))
+
+
+def test_concurrent_writers_get_distinct_rows(tmp_path):
+    directory = str(tmp_path)
+    SpeakerIndex(directory, dtype="float32", initial_capacity=8).add("seed", "seed", vector(999999))
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=enroll, args=(directory, w, 40)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    index = SpeakerIndex(directory, dtype="float32")
+    assert len(index) == 4 * 40 + 1
+    for w in range(4):
+        for i in range(0, 40, 7):
+            best = index.search(vector(w * 1000 + i), k=1)[0]
+            assert best["speaker_id"] == f"w{w}-{i}"
+            assert best["score"] > 0.999
+
+
+def test_compact_is_seen_by_another_process(tmp_path):
+    directory = str(tmp_path)
+    writer = SpeakerIndex(directory, dtype="float32", initial_capacity=4)
+    reader = SpeakerIndex(directory, dtype="float32", initial_capacity=4)
+    for i in range(20):
+        writer.add(f"s{i}", f"s{i}", vector(i))
+    for i in range(0, 20, 2):
+        writer.remove(f"s{i}")
+    writer.compact()
+    assert writer.stats()["deleted_rows"] == 0
+    assert {s["speaker_id"] for s in reader.speakers()} == {f"s{i}" for i in range(1, 20, 2)}
+    assert reader.search(vector(5), k=1)[0]["speaker_id"] == "s5"
+    reader.add("late", "late", vector(100))
+    assert writer.search(vector(100), k=1)[0]["speaker_id"] == "late"
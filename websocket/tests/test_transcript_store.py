@@ -0,0 +1,108 @@
+"""
+转录库检索的校验：与逐段扫描的结果一致（快照、增量表、合并、重启、多进程共用目录）
+"""
+import pytest
+
+from transcript_store import TranscriptStore, normalize_text
+from transcript_store_bench import SyntheticTranscripts
+
+
+def brute_force(texts, query, meeting_id=None, speaker=None):
+    """逐段扫描，返回 (meeting_id, 段文本) 集合"""
+    norm = normalize_text(query)
+    return {
+        (mid, seg["text"])
+        for mid, segments in texts.items()
+        for seg in segments
+        if norm in normalize_text(seg["text"])
+        and (meeting_id is None or mid == meeting_id)
+        and (speaker is None or seg["speaker"] == speaker)
+    }
+
+
+def found(store, query, **filters):
+    result = store.search(query, limit=100000, max_verified=None, **filters)
+    assert not result["truncated"]
+    return {(r["meeting_id"], r["text"]) for r in result["results"]}
+
+
+@pytest.fixture
+def corpus():
+    return SyntheticTranscripts(vocabulary_size=300, seed=3)
+
+
+def fill(store, corpus, texts, meetings, segments, batch=7):
+    for m in range(meetings):
+        meeting_id = f"m{len(texts)}"
+        texts[meeting_id] = corpus.meeting(segments)
+        for i in range(0, segments, batch):
+            store.append(meeting_id, texts[meeting_id][i:i + batch], title=meeting_id)
+
+
+def queries(corpus, texts, n=150):
+    sample = [seg["text"] for segments in texts.values() for seg in segments]
+    return [corpus.phrase(sample) for _ in range(n)] + [corpus.sentence(2, 5) for _ in range(n)]
+
+
+def test_search_matches_brute_force_across_snapshot_and_delta(tmp_path, corpus):
+    # snapshot_segments 设得很大，由测试显式合并，结果不依赖后台线程的时机
+    store = TranscriptStore(str(tmp_path), snapshot_segments=10**9)
+    texts = {}
+    fill(store, corpus, texts, meetings=6, segments=200)
+    store.compact()  # 前 6 个会议进快照
+    fill(store, corpus, texts, meetings=3, segments=150)  # 后 3 个只在增量表
+    assert store.stats()["snapshot_segments"] == 1200
+    for query in queries(corpus, texts):
+        assert found(store, query) == brute_force(texts, query), query
+
+
+def test_reopen_and_filters(tmp_path, corpus):
+    store = TranscriptStore(str(tmp_path), snapshot_segments=10**9)
+    texts = {}
+    fill(store, corpus, texts, meetings=4, segments=150)
+    store.compact()
+    fill(store, corpus, texts, meetings=2, segments=100)
+    # 重启：快照映射，快照之后的段从日志回放
+    reopened = TranscriptStore(str(tmp_path), snapshot_segments=10**9)
+    assert len(reopened) == len(store) == 800
+    for query in queries(corpus, texts, n=50):
+        assert found(reopened, query) == brute_force(texts, query), query
+        assert found(reopened, query, meeting_id="m1") == brute_force(texts, query, meeting_id="m1")
+        assert found(reopened, query, speaker="说话人2") == brute_force(texts, query, speaker="说话人2")
+
+
+def test_results_newest_first_and_limit(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    for i in range(5):
+        store.append(f"m{i}", [{"speaker": "A", "start_time": 0, "end_time": 1, "text": f"第{i}次，明天开会"}])
+    result = store.search("明天开会", limit=3)
+    assert [r["meeting_id"] for r in result["results"]] == ["m4", "m3", "m2"]
+    assert result["truncated"]
+
+
+def test_verification_is_capped(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    store.append("m", [{"speaker": "A", "start_time": i, "end_time": i + 1, "text": f"开会{i}明天开"} for i in range(50)])
+    # 每段都含“明天”“天开”“开会”三个二元组，但都不含短语“明天开会”
+    result = store.search("明天开会", limit=10, max_verified=20)
+    assert result["candidates"] == 50
+    assert result["verified"] == 20
+    assert result["truncated"] and not result["results"]
+
+
+def test_normalization_ignores_punctuation_and_case(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    store.append("m", [{"speaker": "A", "start_time": 0, "end_time": 1, "text": "下周三 Review，项目进度。"}])
+    assert len(store.search("review项目")["results"]) == 1
+    assert len(store.search("三，Re")["results"]) == 1
+    with pytest.raises(ValueError):
+        store.search("，三")
+
+
+def test_second_process_sees_new_meetings(tmp_path, corpus):
+    writer = TranscriptStore(str(tmp_path))
+    reader = TranscriptStore(str(tmp_path), refresh_interval_s=0)
+    texts = {}
+    fill(writer, corpus, texts, meetings=2, segments=50)
+    for query in queries(corpus, texts, n=20):
+        assert found(reader, query) == brute_force(texts, query), query
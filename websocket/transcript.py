@@ -0,0 +1,78 @@
+"""
+会话转录文本的增量累积：识别结果到达时即合并，只保留已确认文本和尚未确认的实时假设
+"""
+
+
+def overlap_length(tail, text, min_overlap=2, max_overlap=32):
+    """
+    tail 的结尾与 text 的开头重合的最长长度
+
+    短于 min_overlap 的重合不算（避免误删“哈哈”这类叠字）；text 至少保留一个字，
+    整句与上一句相同时视为重复说了一遍，不去重。
+    """
+    limit = min(len(tail), len(text) - 1, max_overlap)
+    for k in range(limit, min_overlap - 1, -1):
+        if tail.endswith(text[:k]):
+            return k
+    return 0
+
+
+class TranscriptAccumulator:
+    """
+    按语音段累积转录文本
+
+    流式中间结果（增量文本）追加到当前段的实时假设；每提交一句离线识别调用一次
+    end_segment() 结束当前段，离线结果回来后 commit(segment, text) 用它替换该段
+    的实时假设。离线流水线按提交顺序出结果，commit 时更早的、没有离线结果的段
+    （空结果或识别失败）按实时假设确认。
+
+    去重只在同一段的实时假设之间进行：相邻中间结果重合的部分去掉。离线结果来自
+    不同的音频段，与前文重合的字是真实说出的话，原样追加。
+
+    已确认文本超过 compact_pieces 段时合并成一个字符串，text() 只拼接有限的几段。
+    """
+    def __init__(self, compact_pieces=32, max_overlap=32):
+        self.compact_pieces = compact_pieces
+        self.max_overlap = max_overlap
+        self._committed = []
+        self._live = {}  # 段号 -> 实时假设片段列表，按段号递增
+        self._segment = 0
+
+    @property
+    def segment(self):
+        return self._segment
+
+    def add_partial(self, text):
+        if not text:
+            return
+        pieces = self._live.setdefault(self._segment, [])
+        if pieces:
+            text = text[overlap_length(pieces[-1], text, max_overlap=self.max_overlap):]
+        pieces.append(text)
+
+    def end_segment(self):
+        """结束当前段，返回其段号；之后的中间结果属于下一段"""
+        segment = self._segment
+        self._segment += 1
+        return segment
+
+    def commit(self, segment, text):
+        for pending in [s for s in self._live if s < segment]:
+            self._append("".join(self._live.pop(pending)))
+        self._live.pop(segment, None)
+        self._append(text)
+
+    def _append(self, text):
+        if not text:
+            return
+        self._committed.append(text)
+        if len(self._committed) > self.compact_pieces:
+            self._committed = ["".join(self._committed)]
+
+    def text(self):
+        """已确认文本加上各段尚未确认的实时假设"""
+        live = ["".join(pieces) for pieces in self._live.values()]
+        return "".join(self._committed + live)
+
+    def __bool__(self):
+        return bool(self._committed) or any(self._live.values())
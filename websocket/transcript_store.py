@@ -0,0 +1,585 @@
+"""
+会议转录存储：每个会议一个追加写的分段日志，按字符二元组建倒排索引，支持短语检索
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from array import array
+
+import numpy as np
+
+_STRIP = re.compile(r"[\W_]+")
+_MEETING_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+# 启动时日志中未进快照的段按块批量建索引，限制临时数组的大小
+BUILD_CHUNK_SEGMENTS = 200000
+# 一次检索至多返回的条数（服务端按此截断客户端给的 limit）和至多读原文核对的候选段数，
+# 常见短语的候选段可能有几十万，不设上限时单个查询要读几十万次日志
+MAX_SEARCH_LIMIT = 200
+MAX_VERIFIED_CANDIDATES = 5000
+
+
+def normalize_text(text):
+    """检索用的规范化文本：NFKC、小写，去掉空白和标点，标点不同也能匹配"""
+    return _STRIP.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def bigram_keys(norm):
+    """
+    规范化文本中所有相邻两个字符组成的 32 位键
+
+    每个字符取码位低 16 位，BMP 以外的字符可能与其他字符同键，只会多出候选段，
+    检索时逐段核对原文，不影响结果。
+    """
+    return {((ord(a) & 0xFFFF) << 16) | (ord(b) & 0xFFFF) for a, b in zip(norm, norm[1:])}
+
+
+def check_meeting_id(meeting_id):
+    """meeting_id 用作文件名，只允许字母、数字、下划线和连字符"""
+    if not _MEETING_ID.match(meeting_id or ""):
+        raise ValueError("meeting_id may only contain letters, digits, '_' and '-' (at most 128)")
+    return meeting_id
+
+
+def _empty_part():
+    return np.zeros(0, dtype=np.uint32), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+
+
+def _build_part(texts, first_seg):
+    """
+    批量建索引，返回 (键, 各键起止位置, 段编号)
+
+    拼接全部文本取相邻码位对，按键稳定排序（同一键内段编号保持升序）后去重。
+    """
+    codes = np.frombuffer("\0".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    segs = np.repeat(np.arange(first_seg, first_seg + len(texts), dtype=np.uint32), lengths + 1)[:len(codes)]
+    # 跨越分隔符的码位对不属于任何一段
+    valid = (codes[:-1] != 0) & (codes[1:] != 0)
+    low = codes & 0xFFFF
+    keys = ((low[:-1] << 16) | low[1:])[valid]
+    segs = segs[:-1][valid]
+    order = np.argsort(keys, kind="stable")
+    keys, segs = keys[order], segs[order]
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = (keys[1:] != keys[:-1]) | (segs[1:] != segs[:-1])
+    keys, segs = keys[keep], segs[keep]
+    unique, starts = np.unique(keys, return_index=True)
+    return unique, np.append(starts, len(keys)).astype(np.int64), segs
+
+
+def _part_from_postings(postings):
+    """增量表 {键: array("I")} 转成与 _build_part 相同的数组形式"""
+    keys = np.array(sorted(postings), dtype=np.uint32)
+    lengths = np.fromiter((len(postings[k]) for k in keys.tolist()), dtype=np.int64, count=len(keys))
+    starts = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    segs = np.frombuffer(b"".join(postings[k].tobytes() for k in keys.tolist()), dtype=np.uint32)
+    return keys, starts, segs
+
+
+def _merge(base, part):
+    """合并两组索引，part 的段编号都大于 base 的，同一键下 base 的编号在前"""
+    base_keys, base_starts, base_segs = base
+    part_keys, part_starts, part_segs = part
+    if not len(part_keys):
+        return base
+    if not len(base_keys):
+        return part
+    keys = np.union1d(base_keys, part_keys)
+    base_pos = np.searchsorted(keys, base_keys)
+    part_pos = np.searchsorted(keys, part_keys)
+    base_counts = np.zeros(len(keys), dtype=np.int64)
+    base_counts[base_pos] = np.diff(base_starts)
+    counts = base_counts.copy()
+    counts[part_pos] += np.diff(part_starts)
+    starts = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    segs = np.empty(starts[-1], dtype=np.uint32)
+    _scatter(segs, base_segs, base_starts, starts[base_pos])
+    _scatter(segs, part_segs, part_starts, starts[part_pos] + base_counts[part_pos])
+    return keys, starts, segs
+
+
+def _scatter(out, segs, starts, dest, block=1 << 22):
+    # 各键的编号表整体搬到 dest 开始的位置；按键分块，临时下标数组不超过 block 项
+    k, n = 0, len(starts) - 1
+    while k < n:
+        end = max(k + 1, int(np.searchsorted(starts, starts[k] + block, side="right")) - 1)
+        lo, hi = starts[k], starts[end]
+        shift = np.repeat(dest[k:end] - starts[k:end], np.diff(starts[k:end + 1]))
+        out[np.arange(lo, hi) + shift] = segs[lo:hi]
+        k = end
+
+
+def _intersect(a, b):
+    # 两个升序数组求交：短数组在长数组里二分查找，代价只随短数组长度增长
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    idx = np.searchsorted(b, a)
+    hit = idx < len(b)
+    hit[hit] = b[idx[hit]] == a[hit]
+    return a[hit]
+
+
+def _load_array(path):
+    # 空数组无法映射
+    data = np.load(path, mmap_mode="r")
+    return data if data.size else np.load(path)
+
+
+class TranscriptStore:
+    """
+    会议转录库
+
+    目录 meetings/ 下每个会议一个 <meeting_id>.jsonl：第一行是会议信息（标题、来源、
+    创建时间），之后每行一段（speaker、start_time、end_time、text），只追加不修改。
+
+    每段有一个全局编号，倒排索引的键为规范化文本中的字符二元组，值为升序的段编号。
+    索引分三层：index/ 下的快照（有序键、各键起止位置、段编号和各段所在日志位置，
+    np.load 映射，启动时不读入内存）、正在合并进快照的冻结表、新追加段的增量表
+    （键 -> array），后一层的段编号都大于前一层，按层拼接即为升序。增量超过
+    snapshot_segments 段时后台线程把它并入新快照。启动时只需回放日志中快照之后的部分。
+
+    短语检索对各二元组的编号表求交，再读出候选段核对整个短语。
+    多个进程可以共用一个目录（各自写自己的会议）：检索前至多每 refresh_interval_s
+    秒扫描一次目录，把其他进程新写的内容编入索引。
+    """
+    def __init__(self, directory, refresh_interval_s=1.0, snapshot_segments=50000):
+        self.directory = directory
+        self._dir = os.path.join(directory, "meetings")
+        self._index_dir = os.path.join(directory, "index")
+        os.makedirs(self._dir, exist_ok=True)
+        os.makedirs(self._index_dir, exist_ok=True)
+        self.refresh_interval_s = refresh_interval_s
+        self.snapshot_segments = snapshot_segments
+        self._lock = threading.Lock()
+        self._meetings = []  # 会议编号 -> 会议信息
+        self._meeting_index = {}  # meeting_id -> 会议编号
+        # 快照中的段：索引和各段所在位置（会议编号、日志中的字节偏移）
+        self._base = _empty_part()
+        self._base_segments = 0
+        self._base_seg_meeting = np.zeros(0, dtype=np.uint32)
+        self._base_seg_offset = np.zeros(0, dtype=np.uint64)
+        self._generation = None
+        # 快照之后的段
+        self._seg_meeting = array("I")
+        self._seg_offset = array("Q")
+        self._frozen = {}
+        self._delta = {}
+        self._compacting = False
+        self.snapshots = 0
+        self._refreshed_at = time.monotonic()
+        start = time.perf_counter()
+        self._load()
+        self.load_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return self._base_segments + len(self._seg_meeting)
+
+    def _meeting_path(self, meeting_id):
+        return os.path.join(self._dir, f"{meeting_id}.jsonl")
+
+    def _load(self):
+        self._open_snapshot()
+        headers = []
+        for entry in os.scandir(self._dir):
+            if entry.name.endswith(".jsonl") and entry.name[:-len(".jsonl")] not in self._meeting_index:
+                info = self._read_header(entry.path)
+                if info is not None:
+                    headers.append(info)
+        # 快照之后的新会议按创建时间编号，检索结果按段编号从新到旧排列
+        for info in sorted(headers, key=lambda info: info["created_at"]):
+            self._register(info)
+        # 日志中快照之后的段：不多时逐段编入增量表，多时分块批量建索引并写一份新快照
+        pending = []
+        for info in self._meetings:
+            if os.path.exists(info["path"]) and os.path.getsize(info["path"]) > info["size"]:
+                pending.extend((info, offset, record.get("text")) for offset, record in self._read_new(info))
+        if len(pending) < self.snapshot_segments:
+            for info, offset, text in pending:
+                self._index_segment(info, offset, text)
+            return
+        base = self._base
+        for i in range(0, len(pending), BUILD_CHUNK_SEGMENTS):
+            texts = []
+            for info, offset, text in pending[i:i + BUILD_CHUNK_SEGMENTS]:
+                self._seg_meeting.append(info["index"])
+                self._seg_offset.append(offset)
+                texts.append(normalize_text(text))
+            base = _merge(base, _build_part(texts, len(self) - len(texts)))
+        self._install(self._write_snapshot(base, len(self), self._meeting_states()), len(self))
+
+    def _open_snapshot(self):
+        try:
+            with open(os.path.join(self._index_dir, "CURRENT")) as f:
+                generation = json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return
+        path = os.path.join(self._index_dir, generation)
+        with open(os.path.join(path, "meetings.json"), encoding="utf-8") as f:
+            meetings = json.load(f)
+        for state in meetings:
+            self._register(dict(state, path=self._meeting_path(state["meeting_id"])))
+        self._base = tuple(_load_array(os.path.join(path, f"{name}.npy")) for name in ("keys", "starts", "segs"))
+        self._base_seg_meeting = _load_array(os.path.join(path, "seg_meeting.npy"))
+        self._base_seg_offset = _load_array(os.path.join(path, "seg_offset.npy"))
+        self._base_segments = len(self._base_seg_meeting)
+        self._generation = generation
+
+    def _meeting_states(self):
+        return [
+            {key: info[key] for key in ("meeting_id", "title", "source", "created_at", "size", "segments", "duration")}
+            for info in self._meetings
+        ]
+
+    def _write_snapshot(self, part, segments, meetings):
+        """把索引和前 segments 段的位置写成新快照，全部写完后再切换 CURRENT，返回快照名"""
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        path = os.path.join(self._index_dir, generation)
+        os.makedirs(path)
+        tail = segments - self._base_segments
+        seg_meeting = np.concatenate([self._base_seg_meeting, np.array(self._seg_meeting[:tail], dtype=np.uint32)])
+        seg_offset = np.concatenate([self._base_seg_offset, np.array(self._seg_offset[:tail], dtype=np.uint64)])
+        for name, data in zip(("keys", "starts", "segs", "seg_meeting", "seg_offset"), part + (seg_meeting, seg_offset)):
+            np.save(os.path.join(path, f"{name}.npy"), data)
+        with open(os.path.join(path, "meetings.json"), "w", encoding="utf-8") as f:
+            json.dump(meetings, f, ensure_ascii=False)
+        current = os.path.join(self._index_dir, "CURRENT")
+        with open(current + ".tmp", "w") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(current + ".tmp", current)
+        return generation
+
+    def _install(self, generation, segments):
+        """换成新快照，快照已包含的段从增量的位置表中去掉"""
+        path = os.path.join(self._index_dir, generation)
+        tail = segments - self._base_segments
+        self._base = tuple(_load_array(os.path.join(path, f"{name}.npy")) for name in ("keys", "starts", "segs"))
+        self._base_seg_meeting = _load_array(os.path.join(path, "seg_meeting.npy"))
+        self._base_seg_offset = _load_array(os.path.join(path, "seg_offset.npy"))
+        self._seg_meeting = self._seg_meeting[tail:]
+        self._seg_offset = self._seg_offset[tail:]
+        self._base_segments = segments
+        old, self._generation = self._generation, generation
+        self.snapshots += 1
+        if old is not None:
+            # 已映射的文件删除后仍可读，其他进程不受影响
+            shutil.rmtree(os.path.join(self._index_dir, old), ignore_errors=True)
+
+    def compact(self):
+        """把增量表并入新快照；合并和写文件在锁外进行，期间检索和追加照常"""
+        with self._lock:
+            if self._compacting or not self._delta:
+                return
+            self._compacting = True
+            self._frozen, self._delta = self._delta, {}
+            segments = len(self)
+            meetings = self._meeting_states()
+            base = self._base
+        try:
+            generation = self._write_snapshot(_merge(base, _part_from_postings(self._frozen)), segments, meetings)
+            with self._lock:
+                self._install(generation, segments)
+                self._frozen = {}
+        except Exception:
+            # 写快照失败时冻结表放回增量表，下次再合并
+            with self._lock:
+                for key, segs in self._frozen.items():
+                    self._delta[key] = segs + self._delta.get(key, array("I"))
+                self._frozen = {}
+            raise
+        finally:
+            self._compacting = False
+
+    def _read_header(self, path):
+        try:
+            with open(path, "rb") as f:
+                line = f.readline()
+        except OSError:
+            return None
+        if not line.endswith(b"\n"):
+            return None  # 另一个进程正在创建
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return None
+        return {
+            "meeting_id": header["meeting_id"],
+            "title": header.get("title", ""),
+            "source": header.get("source", ""),
+            "created_at": header.get("created_at", 0),
+            "path": path,
+            "size": len(line),  # 已编入索引的字节数
+            "segments": 0,
+            "duration": 0.0,
+        }
+
+    def _register(self, info):
+        info["index"] = len(self._meetings)
+        self._meetings.append(info)
+        self._meeting_index[info["meeting_id"]] = info["index"]
+
+    def _read_new(self, info):
+        """读出日志中尚未编入索引的完整行，返回 [(字节偏移, 记录)]；写到一半的行留到下次"""
+        with open(info["path"], "rb") as f:
+            f.seek(info["size"])
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        records = []
+        pos = 0
+        while pos < end:
+            next_pos = data.index(b"\n", pos) + 1
+            try:
+                record = json.loads(data[pos:next_pos])
+            except ValueError:
+                record = None  # 崩溃时残留的半行
+            if isinstance(record, dict):
+                records.append((info["size"] + pos, record))
+                info["segments"] += 1
+                info["duration"] = max(info["duration"], float(record.get("end_time") or 0))
+            pos = next_pos
+        info["size"] += end
+        return records
+
+    def _index_segment(self, info, offset, text):
+        seg = len(self)
+        self._seg_meeting.append(info["index"])
+        self._seg_offset.append(offset)
+        for key in bigram_keys(normalize_text(text)):
+            segs = self._delta.get(key)
+            if segs is None:
+                segs = self._delta[key] = array("I")
+            segs.append(seg)
+
+    def _catch_up(self, info):
+        for offset, record in self._read_new(info):
+            self._index_segment(info, offset, record.get("text"))
+
+    def append(self, meeting_id, segments, title="", source=""):
+        """
+        追加会议的若干段并立即编入索引，会议不存在时创建
+
+        segments 为 {"speaker", "start_time", "end_time", "text"}（秒），与文件识别
+        合并结果的格式相同；title、source 只在创建会议时记录。
+        """
+        check_meeting_id(meeting_id)
+        records = [
+            {
+                "speaker": s.get("speaker"),
+                "start_time": round(float(s.get("start_time") or 0), 3),
+                "end_time": round(float(s.get("end_time") or 0), 3),
+                "text": s.get("text") or "",
+            }
+            for s in segments
+        ]
+        if not records:
+            return
+        lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records]
+        with self._lock:
+            info = self._open_meeting(meeting_id, title, source)
+            # 同一会议的日志也可能被其他进程写过，先补上
+            if os.path.getsize(info["path"]) > info["size"]:
+                self._catch_up(info)
+            fd = os.open(info["path"], os.O_WRONLY | os.O_APPEND)
+            try:
+                # O_APPEND 一次写入整批，其他进程不会插在中间
+                os.write(fd, b"".join(lines))
+                end = os.lseek(fd, 0, os.SEEK_CUR)
+            finally:
+                os.close(fd)
+            offset = end - sum(map(len, lines))
+            info["size"] = end
+            for line, record in zip(lines, records):
+                self._index_segment(info, offset, record["text"])
+                offset += len(line)
+                info["segments"] += 1
+                info["duration"] = max(info["duration"], record["end_time"])
+            compact = len(self._seg_meeting) >= self.snapshot_segments and not self._compacting
+        if compact:
+            threading.Thread(target=self.compact, name="transcript-compact", daemon=True).start()
+
+    def _open_meeting(self, meeting_id, title, source):
+        index = self._meeting_index.get(meeting_id)
+        if index is not None:
+            return self._meetings[index]
+        path = self._meeting_path(meeting_id)
+        header = {"meeting_id": meeting_id, "title": title, "source": source, "created_at": time.time()}
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            # 上次刷新之后由其他进程创建
+            info = self._read_header(path)
+            if info is None:
+                raise
+        else:
+            try:
+                os.write(fd, (json.dumps(header, ensure_ascii=False) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+            info = self._read_header(path)
+        self._register(info)
+        return info
+
+    def refresh(self):
+        """把其他进程写入目录的新会议和新段编入索引"""
+        with self._lock:
+            self._refreshed_at = time.monotonic()
+            for entry in os.scandir(self._dir):
+                if not entry.name.endswith(".jsonl"):
+                    continue
+                index = self._meeting_index.get(entry.name[:-len(".jsonl")])
+                if index is None:
+                    info = self._read_header(entry.path)
+                    if info is None or info["meeting_id"] in self._meeting_index:
+                        continue
+                    self._register(info)
+                else:
+                    info = self._meetings[index]
+                    if entry.stat().st_size <= info["size"]:
+                        continue
+                self._catch_up(info)
+
+    def _postings(self, key):
+        keys, starts, segs = self._base
+        # 键用 uint32 标量，避免整个键数组被提升成 int64
+        i = int(np.searchsorted(keys, np.uint32(key)))
+        parts = []
+        if i < len(keys) and keys[i] == key:
+            parts.append(segs[starts[i]:starts[i + 1]])
+        for table in (self._frozen, self._delta):
+            if key in table:
+                parts.append(np.array(table[key], dtype=np.uint32))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+
+    def search(self, query, limit=20, meeting_id=None, speaker=None, since=None, until=None,
+               max_verified=MAX_VERIFIED_CANDIDATES):
+        """
+        短语检索
+
+        返回 {"results", "candidates", "verified", "truncated", "took_ms"}。results 按从新到旧
+        排列，每项含 meeting_id、title、created_at、speaker、start_time、end_time、text；
+        meeting_id、speaker 只保留对应会议、说话人的段，since/until 按会议创建时间
+        （unix 秒）过滤。规范化后不足两个字符的查询抛出 ValueError。
+        至多读出 max_verified 个候选段核对（None 不限），凑够 limit 条或读满时
+        truncated 为 True，更早的结果需缩小条件再查。
+        """
+        norm = normalize_text(query)
+        if len(norm) < 2:
+            raise ValueError("query needs at least 2 letters or characters")
+        if time.monotonic() - self._refreshed_at >= self.refresh_interval_s:
+            self.refresh()
+        start = time.perf_counter()
+        with self._lock:
+            lists = sorted((self._postings(key) for key in bigram_keys(norm)), key=len)
+            candidates = lists[0]
+            for segs in lists[1:]:
+                candidates = _intersect(candidates, segs)
+            # 定位段所需的表：快照中的表只读，快照之后的表拷贝一份，在锁外使用
+            base_segments = self._base_segments
+            base_meeting, base_offset = self._base_seg_meeting, self._base_seg_offset
+            tail_meeting = np.array(self._seg_meeting, dtype=np.int64)
+            tail_offset = np.array(self._seg_offset, dtype=np.int64)
+            meetings = list(self._meetings)
+        meeting_index = self._meeting_index.get(meeting_id, -1) if meeting_id is not None else None
+        created = None
+        if since is not None or until is not None:
+            created = np.array([info["created_at"] for info in meetings])
+        # 从新到旧分块定位候选段，按会议条件过滤后读出原文核对短语，凑够 limit 条即停
+        results = []
+        verified = 0
+        truncated = False
+        end = len(candidates)
+        block = max(64, 4 * limit)
+        while end > 0 and not truncated:
+            chunk = candidates[max(0, end - block):end][::-1].astype(np.int64)
+            end -= len(chunk)
+            in_base = chunk < base_segments
+            seg_meeting = np.empty(len(chunk), dtype=np.int64)
+            seg_offset = np.empty(len(chunk), dtype=np.int64)
+            seg_meeting[in_base] = base_meeting[chunk[in_base]]
+            seg_offset[in_base] = base_offset[chunk[in_base]]
+            seg_meeting[~in_base] = tail_meeting[chunk[~in_base] - base_segments]
+            seg_offset[~in_base] = tail_offset[chunk[~in_base] - base_segments]
+            keep = np.ones(len(chunk), dtype=bool)
+            if meeting_index is not None:
+                keep &= seg_meeting == meeting_index
+            if since is not None:
+                keep &= created[seg_meeting] >= since
+            if until is not None:
+                keep &= created[seg_meeting] < until
+            for index, offset in zip(seg_meeting[keep].tolist(), seg_offset[keep].tolist()):
+                if len(results) == limit or verified == max_verified:
+                    truncated = True
+                    break
+                info = meetings[index]
+                verified += 1
+                record = self._read_segment(info, offset)
+                if record is None or norm not in normalize_text(record.get("text")):
+                    continue
+                if speaker is not None and record.get("speaker") != speaker:
+                    continue
+                results.append(dict(
+                    record, meeting_id=info["meeting_id"], title=info["title"], created_at=info["created_at"]
+                ))
+        return {
+            "results": results,
+            "candidates": len(candidates),
+            "verified": verified,
+            "truncated": truncated,
+            "took_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def _read_segment(self, info, offset):
+        try:
+            with open(info["path"], "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def meetings(self):
+        """全部会议，从新到旧"""
+        with self._lock:
+            return [
+                {key: info[key] for key in ("meeting_id", "title", "source", "created_at", "segments", "duration")}
+                for info in reversed(self._meetings)
+            ]
+
+    def segments(self, meeting_id):
+        """会议的全部段，会议不存在时返回 None"""
+        with self._lock:
+            index = self._meeting_index.get(meeting_id)
+            if index is None:
+                return None
+            path = self._meetings[index]["path"]
+        segments = []
+        with open(path, "rb") as f:
+            f.readline()  # 会议信息
+            for line in f:
+                try:
+                    segments.append(json.loads(line))
+                except ValueError:
+                    continue
+        return segments
+
+    def stats(self):
+        with self._lock:
+            return {
+                "meetings": len(self._meetings),
+                "segments": len(self),
+                "snapshot_segments": self._base_segments,
+                "snapshot_bigrams": len(self._base[0]),
+                "snapshot_postings": len(self._base[2]),
+                "delta_segments": len(self._seg_meeting),
+                "delta_bigrams": len(self._delta) + len(self._frozen),
+                "snapshots": self.snapshots,
+                "load_seconds": self.load_seconds,
+            }
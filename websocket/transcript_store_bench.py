@@ -0,0 +1,171 @@
+"""
+转录库压测：生成合成会议写入 TranscriptStore，统计追加耗时、重启加载耗时和短语检索延迟
+
+合成文本由常用汉字组成的词按 Zipf 分布抽取，每段 8~40 个字；检索词从已写入的段中
+截取（必然命中）或随机拼接（多半不命中）。
+
+例（约 2000 会议小时，144 万段）：
+python transcript_store_bench.py --dir /tmp/transcripts --hours 2000 --queries 2000
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from transcript_store import TranscriptStore
+
+
+CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后"
+    "多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合"
+    "还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只"
+    "没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边"
+    "流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造"
+    "百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清美再采转更单风切打白教速花带安场身车例真"
+    "务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究"
+)
+
+
+def make_vocabulary(size=3000, seed=0):
+    """由 1~4 个常用字组成的词表"""
+    rng = np.random.default_rng(seed)
+    chars = np.array(list(CHARS))
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(chars, rng.integers(1, 5))))
+    return sorted(words)
+
+
+class SyntheticTranscripts:
+    """按 Zipf 分布抽词拼成的会议转录"""
+    def __init__(self, vocabulary_size=3000, seed=0):
+        self.words = make_vocabulary(vocabulary_size, seed)
+        ranks = np.arange(1, len(self.words) + 1)
+        self.weights = 1.0 / ranks / np.sum(1.0 / ranks)
+        self.rng = np.random.default_rng(seed + 1)
+
+    def sentence(self, min_chars=8, max_chars=40):
+        target = self.rng.integers(min_chars, max_chars + 1)
+        text = ""
+        while len(text) < target:
+            # 一次抽一批词，逐个抽太慢
+            for i in self.rng.choice(len(self.words), size=max_chars // 2, p=self.weights):
+                text += self.words[i]
+                if len(text) >= target:
+                    break
+        return text
+
+    def meeting(self, segments, speakers=4):
+        """一场会议的段列表，格式与 TranscriptStore.append 的输入相同"""
+        result = []
+        t = 0.0
+        for _ in range(segments):
+            text = self.sentence()
+            duration = len(text) * 0.2
+            result.append({
+                "speaker": f"说话人{self.rng.integers(1, speakers + 1)}",
+                "start_time": t,
+                "end_time": t + duration,
+                "text": text,
+            })
+            t += duration + 0.5
+        return result
+
+    def phrase(self, texts, min_chars=2, max_chars=6):
+        """从 texts 中随机截取一段作为检索词"""
+        text = texts[self.rng.integers(len(texts))]
+        length = int(self.rng.integers(min_chars, max_chars + 1))
+        start = int(self.rng.integers(0, max(1, len(text) - length + 1)))
+        return text[start:start + length]
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {}
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def main(args):
+    if args.reset and os.path.exists(args.dir):
+        shutil.rmtree(args.dir)
+    corpus = SyntheticTranscripts(seed=args.seed)
+    store = TranscriptStore(args.dir, snapshot_segments=args.snapshot_segments)
+    existing = len(store)
+    meetings = int(args.hours * 3600 / args.meeting_s)
+    per_meeting = int(args.meeting_s / 3600 * args.segments_per_hour)
+    sample = []  # 用于生成命中查询的段文本
+    append_ms = []
+    start = time.perf_counter()
+    for m in range(meetings):
+        segments = corpus.meeting(per_meeting)
+        sample.extend(s["text"] for s in segments[:: max(1, per_meeting // 4)])
+        meeting_id = f"bench-{existing}-{m}"
+        # 按 --append_batch 段一批追加，与识别结果逐句到达时的写入方式相同
+        for i in range(0, len(segments), args.append_batch):
+            t0 = time.perf_counter()
+            store.append(meeting_id, segments[i:i + args.append_batch], title=f"会议 {m}", source="bench")
+            append_ms.append((time.perf_counter() - t0) * 1000)
+        if (m + 1) % max(1, meetings // 10) == 0:
+            print(f"{m + 1}/{meetings} meetings, {len(store)} segments, {time.perf_counter() - start:.1f}s", flush=True)
+    write_seconds = time.perf_counter() - start
+    # 把剩余增量写成快照（后台合并进行中时 compact() 立即返回，等它结束再试），重启时只需映射
+    while store.stats()["delta_bigrams"]:
+        store.compact()
+        time.sleep(0.05)
+
+    t0 = time.perf_counter()
+    reopened = TranscriptStore(args.dir, snapshot_segments=args.snapshot_segments)
+    warm_load = time.perf_counter() - t0
+    report = {
+        "segments": len(reopened),
+        "meetings": len(reopened.meetings()),
+        "write_seconds": write_seconds,
+        "append_ms": percentiles(append_ms),
+        "warm_load_seconds": warm_load,
+        "store": reopened.stats(),
+    }
+    if not sample:
+        sample = [s["text"] for s in corpus.meeting(100)]
+    for kind, make_query in (
+        ("hit", lambda: corpus.phrase(sample)),
+        ("random", lambda: corpus.sentence(2, 6)),
+    ):
+        took, candidates, hits = [], [], 0
+        for _ in range(args.queries):
+            result = reopened.search(make_query(), limit=args.limit)
+            took.append(result["took_ms"])
+            candidates.append(result["candidates"])
+            hits += bool(result["results"])
+        report[f"search_{kind}_ms"] = percentiles(took)
+        report[f"search_{kind}_candidates"] = percentiles(candidates)
+        report[f"search_{kind}_with_results"] = hits / args.queries if args.queries else 0.0
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", type=str, required=True, help="transcript store directory")
+    parser.add_argument("--reset", action="store_true", help="delete the directory first")
+    parser.add_argument("--hours", type=float, default=100, help="meeting hours to add")
+    parser.add_argument("--meeting_s", type=float, default=3600, help="length of one synthetic meeting")
+    parser.add_argument("--segments_per_hour", type=int, default=720, help="segments per meeting hour")
+    parser.add_argument("--append_batch", type=int, default=1, help="segments per append call")
+    parser.add_argument("--snapshot_segments", type=int, default=50000, help="store snapshot threshold")
+    parser.add_argument("--queries", type=int, default=1000, help="queries per kind")
+    parser.add_argument("--limit", type=int, default=20, help="results per query")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic text")
+    parser.add_argument("--output", type=str, default="", help="write the json report to this file")
+    main(parser.parse_args())
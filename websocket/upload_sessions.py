@@ -0,0 +1,71 @@
+"""
+可续传的文件上传会话：连接断开时保留会话的识别状态，客户端带 upload_id 重连后从已收到的位置继续
+"""
+import asyncio
+import secrets
+import time
+
+
+class UploadStore:
+    """
+    断线上传会话的保留区
+
+    park(upload_id, state) 保存断线会话的状态，take(upload_id) 取回并移出保留区。
+    超过 ttl_s 未取回、或保留的会话超过 max_sessions 时最早的会话被丢弃，
+    丢弃时调用 on_expire(state) 释放其资源。
+    """
+    def __init__(self, ttl_s=300, max_sessions=64, on_expire=None):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.on_expire = on_expire
+        self._sessions = {}  # upload_id -> (过期时刻, state)，按保存顺序
+        self._sweeper = None
+        self.parked = 0
+        self.resumed = 0
+        self.expired = 0
+
+    @staticmethod
+    def new_id():
+        return secrets.token_hex(16)
+
+    def park(self, upload_id, state):
+        self._sessions.pop(upload_id, None)
+        self._sessions[upload_id] = (time.monotonic() + self.ttl_s, state)
+        self.parked += 1
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)))
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self._sweep())
+
+    def take(self, upload_id):
+        self.expire()
+        entry = self._sessions.pop(upload_id, None)
+        if entry is None:
+            return None
+        self.resumed += 1
+        return entry[1]
+
+    def expire(self):
+        now = time.monotonic()
+        for upload_id in [k for k, (deadline, _) in self._sessions.items() if deadline <= now]:
+            self._drop(upload_id)
+
+    def _drop(self, upload_id):
+        _, state = self._sessions.pop(upload_id)
+        self.expired += 1
+        if self.on_expire is not None:
+            self.on_expire(state)
+
+    async def _sweep(self):
+        # 没有客户端重连时也按时释放过期会话
+        while self._sessions:
+            await asyncio.sleep(min(self.ttl_s, 30))
+            self.expire()
+
+    def stats(self):
+        return {
+            "parked_now": len(self._sessions),
+            "parked": self.parked,
+            "resumed": self.resumed,
+            "expired": self.expired,
+        }
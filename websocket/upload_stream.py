@@ -0,0 +1,185 @@
+"""
+流式读取 multipart 上传：边接收边解码音频，不需要先把整个文件读进内存再写临时文件
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from audio_codecs import StreamingWavDecoder, UnsupportedAudioFormat
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(Exception):
+    pass
+
+
+class AudioUploadSink:
+    """
+    上传音频的接收端
+
+    WAV/PCM 直接解码进 float32 数组，超过 mmap_threshold_bytes 的输出使用
+    np.memmap 映射到临时文件，常驻内存与分块大小相关而不是与文件大小相关。
+    其他格式（mp3 等）原样写入临时文件，交给模型自己解码。
+    """
+    def __init__(self, expected_bytes=None, mmap_threshold_bytes=64 * 1024 * 1024):
+        self.filename = ""
+        self.expected_bytes = expected_bytes
+        self.mmap_threshold_bytes = mmap_threshold_bytes
+        self.bytes_received = 0
+        self.digest = hashlib.sha256()  # 上传内容的流式哈希，用作结果缓存键
+        self._decoder = None
+        self._spill = None
+        self._temp_paths = []
+
+    def start(self, filename):
+        """文件部分开始，按文件名决定是否按裸 PCM 解析"""
+        self.filename = filename or ""
+        self._decoder = StreamingWavDecoder(
+            raw_pcm=self.filename.lower().endswith(".pcm"),
+            expected_bytes=self.expected_bytes,
+            allocate=self._allocate,
+        )
+
+    def _allocate(self, n):
+        if n * 4 <= self.mmap_threshold_bytes:
+            return np.empty(n, dtype=np.float32)
+        fd, path = tempfile.mkstemp(suffix=".f32")
+        os.close(fd)
+        self._temp_paths.append(path)
+        return np.memmap(path, dtype=np.float32, mode="w+", shape=(n,))
+
+    def write(self, chunk):
+        self.bytes_received += len(chunk)
+        self.digest.update(chunk)
+        if self._spill is not None:
+            self._spill.write(chunk)
+            return
+        try:
+            self._decoder.feed(chunk)
+        except UnsupportedAudioFormat:
+            suffix = os.path.splitext(self.filename)[1] or ".wav"
+            self._spill = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+            self._temp_paths.append(self._spill.name)
+            self._spill.write(self._decoder.consumed_head)
+            self._decoder = None
+
+    @property
+    def duration_s(self):
+        """已解码的音频时长（秒），退回文件模式时未知，返回 None"""
+        if self._decoder is None:
+            return None
+        return self._decoder.samples / self._decoder.sample_rate
+
+    def finish(self):
+        """返回可直接传给 model.generate 的输入：float32 数组或临时文件路径"""
+        if self._decoder is None and self._spill is None:
+            raise UnsupportedAudioFormat("no audio received")
+        if self._spill is not None:
+            self._spill.close()
+            return self._spill.name
+        return self._decoder.finish()
+
+    def cleanup(self):
+        if self._spill is not None and not self._spill.closed:
+            self._spill.close()
+        for path in self._temp_paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        self._temp_paths = []
+
+
+async def read_multipart_upload(request, file_field, sink, max_bytes=0):
+    """
+    流式解析 multipart/form-data 请求体
+
+    file_field 对应的文件交给 sink：先调用 sink.start(filename)，内容再分块交给
+    sink.write(bytes)；其余表单字段以字符串返回。
+    返回 (fields, filename)。请求体超过 max_bytes（0 表示不限）时抛出 UploadTooLarge。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MalformedUpload("expected multipart/form-data")
+
+    fields = {}
+    file_chunks = []
+    state = {"name": None, "filename": None, "header_field": b"", "header_value": b"", "data": None}
+    filename = {"value": None}
+
+    def on_part_begin():
+        state["name"] = None
+        state["filename"] = None
+        state["data"] = bytearray()
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        if state["header_field"].lower() == b"content-disposition":
+            _, options = parse_options_header(state["header_value"])
+            state["name"] = options.get(b"name", b"").decode("utf-8", "replace")
+            if b"filename" in options:
+                state["filename"] = options[b"filename"].decode("utf-8", "replace")
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        if state["name"] == file_field:
+            filename["value"] = state["filename"] or ""
+            sink.start(filename["value"])
+
+    def on_part_data(data, start, end):
+        if state["name"] == file_field:
+            file_chunks.append(bytes(data[start:end]))
+        elif state["data"] is not None:
+            state["data"] += data[start:end]
+            if len(state["data"]) > MAX_FIELD_BYTES:
+                raise MalformedUpload(f"form field {state['name']} too large")
+
+    def on_part_end():
+        if state["name"] is not None and state["name"] != file_field:
+            fields[state["name"]] = state["data"].decode("utf-8", "replace")
+        state["data"] = None
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        },
+    )
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise UploadTooLarge(f"request body exceeds {max_bytes} bytes")
+        parser.write(chunk)
+        # 解析器回调是同步的，本块解析出的文件数据在这里统一交出
+        for piece in file_chunks:
+            sink.write(piece)
+        file_chunks.clear()
+    parser.finalize()
+    for piece in file_chunks:
+        sink.write(piece)
+    return fields, filename["value"]
@@ -0,0 +1,98 @@
+"""
+VAD 前置静音门：用 NumPy 按 10ms 子帧批量计算短时能量和过零率，跟踪自适应噪声底，
+会话确定处于静音时跳过 FSMN VAD 和流式识别
+"""
+import numpy as np
+
+
+# 所有会话汇总的跳过统计
+gate_totals = {"sessions": 0, "frames": 0, "skipped_frames": 0, "samples": 0, "skipped_samples": 0}
+
+
+def gate_stats():
+    """全部会话被静音门跳过的帧数与音频占比"""
+    return dict(
+        gate_totals,
+        skipped_share=gate_totals["skipped_samples"] / gate_totals["samples"] if gate_totals["samples"] else 0.0,
+    )
+
+
+class SilenceGate:
+    """
+    单个会话的静音判断
+
+    子帧能量高于 max(噪声底 + margin_db, min_energy_db) 判为语音；能量略低
+    （高于噪声底 + margin_db / 2）但过零率超过 zcr_threshold 的子帧按清辅音算作语音。
+    噪声底取每帧最低子帧能量：更低时立即跟随，更高时缓慢上升，以适应环境噪声变化。
+    检测到语音后保持 hangover_ms 才回到静音；开头 warmup_ms 用于估计噪声底，始终视为语音。
+    """
+    def __init__(self, sample_rate=16000, subframe_ms=10, margin_db=6.0, min_energy_db=-55.0,
+                 zcr_threshold=0.25, hangover_ms=600, warmup_ms=200, floor_rise=0.01):
+        self.sample_rate = sample_rate
+        self.subframe = sample_rate * subframe_ms // 1000
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+        self.zcr_threshold = zcr_threshold
+        self.hangover = sample_rate * hangover_ms // 1000
+        self.warmup = sample_rate * warmup_ms // 1000
+        self.floor_rise = floor_rise
+        self.noise_floor_db = None
+        self._seen = 0
+        self._hang_left = 0
+        self._tail = np.zeros(0, dtype=np.int16)  # 不足一个子帧的剩余采样
+        self.counters = {"frames": 0, "skipped_frames": 0, "samples": 0, "skipped_samples": 0}
+        gate_totals["sessions"] += 1
+
+    def _features(self, samples):
+        """按子帧返回 (能量 dBFS, 过零率)"""
+        if len(self._tail):
+            samples = np.concatenate([self._tail, samples])
+        n = len(samples) // self.subframe
+        self._tail = samples[n * self.subframe:].copy()
+        frames = samples[:n * self.subframe].reshape(n, self.subframe).astype(np.float32) / 32768.0
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return energy_db, zcr
+
+    def process(self, samples):
+        """送入一帧 int16 采样，返回该帧是否可能含有语音"""
+        self._seen += len(samples)
+        energy_db, zcr = self._features(samples)
+        if len(energy_db) == 0:
+            return self._hang_left > 0 or self._seen <= self.warmup
+
+        lowest = float(energy_db.min())
+        if self.noise_floor_db is None or lowest < self.noise_floor_db:
+            self.noise_floor_db = lowest
+        else:
+            rise = 1.0 - (1.0 - self.floor_rise) ** len(energy_db)
+            self.noise_floor_db += rise * (lowest - self.noise_floor_db)
+
+        threshold = max(self.noise_floor_db + self.margin_db, self.min_energy_db)
+        voiced = energy_db > threshold
+        unvoiced = (energy_db > threshold - self.margin_db / 2) & (zcr > self.zcr_threshold)
+        if np.any(voiced | unvoiced):
+            self._hang_left = self.hangover
+        else:
+            self._hang_left = max(self._hang_left - len(samples), 0)
+        return self._hang_left > 0 or self._seen <= self.warmup
+
+    def record(self, num_samples, skipped):
+        """记录一帧是否被跳过，用于统计节省的模型调用"""
+        self.counters["frames"] += 1
+        self.counters["samples"] += num_samples
+        gate_totals["frames"] += 1
+        gate_totals["samples"] += num_samples
+        if skipped:
+            self.counters["skipped_frames"] += 1
+            self.counters["skipped_samples"] += num_samples
+            gate_totals["skipped_frames"] += 1
+            gate_totals["skipped_samples"] += num_samples
+
+    def stats(self):
+        return dict(
+            self.counters,
+            skipped_share=self.counters["skipped_samples"] / self.counters["samples"] if self.counters["samples"] else 0.0,
+            noise_floor_db=self.noise_floor_db,
+        )